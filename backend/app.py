@@ -1,29 +1,312 @@
-from flask import Flask, jsonify
+from flask import Flask, jsonify, current_app
+from flask.cli import with_appcontext
+import atexit
+import click
+import importlib.util
 from flask_cors import CORS
 import os
+import sys
 from dotenv import load_dotenv # Importar dotenv
+from werkzeug.serving import is_running_from_reloader
 from routes.campaign_routes import campaign_bp
 from routes.vault_routes import vault_bp
 from routes.session_routes import session_bp
-from routes.ai_routes import ai_bp
+from routes.ai_routes import ai_bp, summarize_text
+from routes.search_routes import search_bp
+from routes.change_routes import changes_bp
+from routes.http_utils import FastJSONProvider, compress_response
+from routes.metrics_routes import metrics_bp, init_request_metrics
+from services.file_service import FileService, DEFAULT_CACHE_MAX_BYTES, DEFAULT_FSYNC_INTERVAL, DEFAULT_LOAD_WORKERS
+from services.storage_engine import STORAGE_ENGINES
+from services.serializer import BACKEND as JSON_BACKEND, STORAGE_FORMATS
+from services.sqlite_storage import SqliteStorage
+from services.storage_transfer import export_to_files, import_from_files
+from services.search_service import SearchService
+from services.vector_index import VectorIndexService, create_embedder, DEFAULT_EMBEDDER, DEFAULT_EMBEDDING_DIM, DEFAULT_VECTOR_TOP_K, DEFAULT_VECTOR_MIN_SCORE
+from services.change_log import ChangeLog
+from services.session_timeline import SessionTimelineCache, DEFAULT_ROLLING_MEMORY_SESSIONS
+from services.summary_queue import SummaryQueue, DEFAULT_SUMMARY_WORKERS
+from services.storage_watcher import StorageWatcher, DEFAULT_DEBOUNCE, DEFAULT_POLL_INTERVAL
+from services.conversation_store import ConversationStore, DEFAULT_TTL_SECONDS
+from services.response_cache import ResponseCache, DEFAULT_RESPONSE_TTL_SECONDS, DEFAULT_MAX_RESPONSES, DEFAULT_MAX_RESPONSE_BYTES
+from services.prompt_context import PromptContextCache
+from services.context_builder import ContextBuilder, DEFAULT_CONTEXT_TOKEN_BUDGET, DEFAULT_TURN_CONTEXT_TOKEN_BUDGET
 
 # Cargar variables de entorno desde .env
 load_dotenv()
 
-app = Flask(__name__)
-CORS(app)
-
 DATA_STORAGE_PATH = os.path.abspath(os.path.join(os.path.dirname(__file__), '..', 'data_storage'))
-app.config['DATA_STORAGE_PATH'] = DATA_STORAGE_PATH
 
-app.register_blueprint(campaign_bp, url_prefix='/api/campaigns')
-app.register_blueprint(vault_bp, url_prefix='/api/campaigns')
-app.register_blueprint(session_bp, url_prefix='/api/campaigns')
-app.register_blueprint(ai_bp, url_prefix='/api/campaigns')
+# Apps con servicios en marcha: las que nadie cerró con shutdown_services se
+# cierran al salir del proceso (dev server, scripts)
+_running_apps = set()
+
+def init_services(app, storage_path):
+    """Crea los servicios compartidos del proceso y los conecta a FileService."""
+    # Almacenamiento único por proceso: la caché de documentos y los índices viven aquí.
+    # Por defecto archivos JSON (FileService); opcionalmente SQLite con la misma interfaz.
+    engine = app.config.get('STORAGE_ENGINE', 'json')
+    if engine not in STORAGE_ENGINES:
+        raise ValueError(f"STORAGE_ENGINE must be one of {STORAGE_ENGINES}")
+    if engine == 'sqlite':
+        file_service = SqliteStorage(
+            storage_path,
+            db_path=app.config.get('SQLITE_PATH'),
+            fsync_mode=app.config.get('FSYNC_MODE', 'none'),
+        )
+    else:
+        file_service = FileService(
+            storage_path,
+            cache_max_bytes=app.config['FILE_CACHE_MAX_BYTES'],
+            fsync_mode=app.config.get('FSYNC_MODE', 'none'),
+            fsync_interval=app.config.get('FSYNC_INTERVAL', DEFAULT_FSYNC_INTERVAL),
+            load_workers=app.config.get('STORAGE_LOAD_WORKERS', DEFAULT_LOAD_WORKERS),
+            storage_format=app.config.get('STORAGE_FORMAT', 'pretty'),
+        )
+    app.extensions['file_service'] = file_service
+
+    # Índice de búsqueda full-text, mantenido con cada escritura del FileService
+    app.extensions['search_service'] = SearchService(file_service)
+    file_service.subscribe(app.extensions['search_service'].handle_change)
+
+    # Índice vectorial del Vault para elegir el contexto de cada pregunta (VECTOR_INDEX=0 lo desactiva)
+    if app.config.get('VECTOR_INDEX', True):
+        embedder = create_embedder(app.config.get('EMBEDDER', DEFAULT_EMBEDDER), app.config.get('EMBEDDING_DIM', DEFAULT_EMBEDDING_DIM))
+        app.extensions['vector_index'] = VectorIndexService(file_service, embedder)
+        file_service.subscribe_batch(app.extensions['vector_index'].handle_changes)
+
+    # Log de cambios por campaña para la sincronización incremental de los clientes
+    app.extensions['change_log'] = ChangeLog(file_service)
+    file_service.subscribe(app.extensions['change_log'].handle_change)
+
+    # Línea temporal de sesiones (numeración, memoria rodante, Bitácora)
+    app.extensions['session_timeline'] = SessionTimelineCache(file_service)
+    file_service.subscribe(app.extensions['session_timeline'].handle_change)
+
+    # Conversaciones de IA abiertas por (campaña, modo, sesión)
+    app.extensions['conversation_store'] = ConversationStore(ttl_seconds=app.config.get('AI_CONVERSATION_TTL', DEFAULT_TTL_SECONDS))
+    file_service.subscribe(app.extensions['conversation_store'].handle_change)
+
+    # Respuestas del chat a preguntas repetidas (AI_RESPONSE_CACHE_TTL=0 la desactiva)
+    if app.config.get('AI_RESPONSE_CACHE_TTL', DEFAULT_RESPONSE_TTL_SECONDS) > 0:
+        app.extensions['response_cache'] = ResponseCache(
+            ttl_seconds=app.config['AI_RESPONSE_CACHE_TTL'],
+            max_entries=app.config.get('AI_RESPONSE_CACHE_MAX_ENTRIES', DEFAULT_MAX_RESPONSES),
+            max_bytes=app.config.get('AI_RESPONSE_CACHE_MAX_BYTES', DEFAULT_MAX_RESPONSE_BYTES),
+        )
+        file_service.subscribe(app.extensions['response_cache'].handle_change)
+
+    # Contexto de prompt por campaña, invalidado con cada escritura
+    app.extensions['prompt_context'] = PromptContextCache()
+    file_service.subscribe(app.extensions['prompt_context'].handle_change)
+
+    # Resúmenes automáticos en segundo plano (SUMMARY_WORKERS=0 los desactiva)
+    if app.config.get('SUMMARY_WORKERS', DEFAULT_SUMMARY_WORKERS) > 0:
+        def summarize(prompt):
+            with app.app_context():
+                return summarize_text(prompt)
+        summary_queue = SummaryQueue(file_service, summarize, workers=app.config['SUMMARY_WORKERS'])
+        app.extensions['summary_queue'] = summary_queue
+        file_service.subscribe(summary_queue.handle_change)
+        # Lo que quedó pendiente del arranque anterior (o de workers caídos)
+        summary_queue.recover()
+
+    # Presupuesto de tokens del system prompt y del contexto añadido a cada pregunta
+    app.extensions['context_builder'] = ContextBuilder(
+        budget_tokens=app.config.get('AI_CONTEXT_TOKEN_BUDGET', DEFAULT_CONTEXT_TOKEN_BUDGET),
+        turn_budget_tokens=app.config.get('AI_TURN_CONTEXT_TOKEN_BUDGET', DEFAULT_TURN_CONTEXT_TOKEN_BUDGET)
+    )
+
+    # Ediciones hechas a mano (o con git) en los JSON: listados, índices y cachés al día.
+    # Al final, con todos los listeners ya suscritos. STORAGE_WATCHER=auto|inotify|poll
+    watcher_mode = app.config.get('STORAGE_WATCHER', 'off')
+    if watcher_mode != 'off' and isinstance(file_service, FileService):
+        os.makedirs(storage_path, exist_ok=True)
+        app.extensions['storage_watcher'] = StorageWatcher(
+            file_service, watcher_mode,
+            debounce=app.config.get('STORAGE_WATCHER_DEBOUNCE', DEFAULT_DEBOUNCE),
+            poll_interval=app.config.get('STORAGE_WATCHER_POLL_INTERVAL', DEFAULT_POLL_INTERVAL),
+        ).start()
+
+def shutdown_services(app):
+    """Cierre ordenado del proceso: vuelca a disco las escrituras pendientes."""
+    _running_apps.discard(app)
+    storage_watcher = app.extensions.get('storage_watcher')
+    if storage_watcher is not None:
+        storage_watcher.close()
+    summary_queue = app.extensions.get('summary_queue')
+    if summary_queue is not None:
+        summary_queue.close()
+    file_service = app.extensions.get('file_service')
+    if file_service is not None:
+        file_service.close()
+
+@atexit.register
+def _shutdown_running_apps():
+    for app in list(_running_apps):
+        shutdown_services(app)
+
+def create_app(config=None):
+    """Crea la aplicación. Cada worker de gunicorn llama aquí y tiene sus propios servicios."""
+    app = Flask(__name__)
+    app.json = FastJSONProvider(app)
+    CORS(app, expose_headers=['X-Total-Count', 'X-Next-Cursor', 'ETag'])
+
+    app.config['DATA_STORAGE_PATH'] = os.getenv('DATA_STORAGE_PATH', DATA_STORAGE_PATH)
+    app.config['FILE_CACHE_MAX_BYTES'] = int(os.getenv('FILE_CACHE_MAX_BYTES', DEFAULT_CACHE_MAX_BYTES))
+    app.config['FSYNC_MODE'] = os.getenv('FSYNC_MODE', 'none')
+    app.config['FSYNC_INTERVAL'] = float(os.getenv('FSYNC_INTERVAL', DEFAULT_FSYNC_INTERVAL))
+    app.config['STORAGE_LOAD_WORKERS'] = int(os.getenv('STORAGE_LOAD_WORKERS', DEFAULT_LOAD_WORKERS))
+    # Documentos en disco: 'pretty' (indentados, legibles) o 'compact' (menos bytes, más rápido)
+    app.config['STORAGE_FORMAT'] = os.getenv('STORAGE_FORMAT', 'pretty')
+    # Vigilancia de ediciones externas: 'off', 'auto' (inotify o sondeo), 'inotify' o 'poll'
+    app.config['STORAGE_WATCHER'] = os.getenv('STORAGE_WATCHER', 'off')
+    app.config['STORAGE_WATCHER_DEBOUNCE'] = float(os.getenv('STORAGE_WATCHER_DEBOUNCE', DEFAULT_DEBOUNCE))
+    app.config['STORAGE_WATCHER_POLL_INTERVAL'] = float(os.getenv('STORAGE_WATCHER_POLL_INTERVAL', DEFAULT_POLL_INTERVAL))
+    app.config['AI_STUB'] = os.getenv('AI_STUB', '').lower() in ('1', 'true', 'yes')
+    app.config['AI_CONVERSATION_TTL'] = int(os.getenv('AI_CONVERSATION_TTL', DEFAULT_TTL_SECONDS))
+    app.config['AI_CONTEXT_TOKEN_BUDGET'] = int(os.getenv('AI_CONTEXT_TOKEN_BUDGET', DEFAULT_CONTEXT_TOKEN_BUDGET))
+    app.config['AI_TURN_CONTEXT_TOKEN_BUDGET'] = int(os.getenv('AI_TURN_CONTEXT_TOKEN_BUDGET', DEFAULT_TURN_CONTEXT_TOKEN_BUDGET))
+    app.config['STORAGE_ENGINE'] = os.getenv('STORAGE_ENGINE', 'json')
+    app.config['SQLITE_PATH'] = os.getenv('SQLITE_PATH') or None
+    app.config['SUMMARY_WORKERS'] = int(os.getenv('SUMMARY_WORKERS', DEFAULT_SUMMARY_WORKERS))
+    app.config['ROLLING_MEMORY_SESSIONS'] = int(os.getenv('ROLLING_MEMORY_SESSIONS', DEFAULT_ROLLING_MEMORY_SESSIONS))
+    app.config['AI_RESPONSE_CACHE_TTL'] = int(os.getenv('AI_RESPONSE_CACHE_TTL', DEFAULT_RESPONSE_TTL_SECONDS))
+    app.config['AI_RESPONSE_CACHE_MAX_ENTRIES'] = int(os.getenv('AI_RESPONSE_CACHE_MAX_ENTRIES', DEFAULT_MAX_RESPONSES))
+    app.config['AI_RESPONSE_CACHE_MAX_BYTES'] = int(os.getenv('AI_RESPONSE_CACHE_MAX_BYTES', DEFAULT_MAX_RESPONSE_BYTES))
+    # Perfil (cProfile, o pyinstrument con PROFILER=pyinstrument) de los requests que superen PROFILE_SLOW_MS
+    app.config['PROFILE_SLOW_MS'] = float(os.getenv('PROFILE_SLOW_MS', 0))
+    app.config['PROFILE_SAMPLE_RATE'] = float(os.getenv('PROFILE_SAMPLE_RATE', 1.0))
+    app.config['PROFILE_DIR'] = os.getenv('PROFILE_DIR') or None
+    app.config['PROFILER'] = os.getenv('PROFILER', 'cprofile')
+    app.config['VECTOR_INDEX'] = os.getenv('VECTOR_INDEX', '1').lower() not in ('0', 'false', 'no')
+    app.config['EMBEDDER'] = os.getenv('EMBEDDER', DEFAULT_EMBEDDER)
+    app.config['EMBEDDING_DIM'] = int(os.getenv('EMBEDDING_DIM', DEFAULT_EMBEDDING_DIM))
+    app.config['VECTOR_TOP_K'] = int(os.getenv('VECTOR_TOP_K', DEFAULT_VECTOR_TOP_K))
+    app.config['VECTOR_MIN_SCORE'] = float(os.getenv('VECTOR_MIN_SCORE', DEFAULT_VECTOR_MIN_SCORE))
+    if config:
+        app.config.update(config)
+
+    init_services(app, app.config['DATA_STORAGE_PATH'])
+    _running_apps.add(app)
+
+    app.register_blueprint(campaign_bp, url_prefix='/api/campaigns')
+    app.register_blueprint(vault_bp, url_prefix='/api/campaigns')
+    app.register_blueprint(session_bp, url_prefix='/api/campaigns')
+    app.register_blueprint(ai_bp, url_prefix='/api/campaigns')
+    app.register_blueprint(search_bp, url_prefix='/api/campaigns')
+    app.register_blueprint(changes_bp, url_prefix='/api/campaigns')
+
+    app.register_blueprint(metrics_bp)
+
+    app.after_request(compress_response)
+    # Tiempos por request y spans (Server-Timing, /metrics) y perfil opcional de los lentos
+    init_request_metrics(app)
+
+    app.add_url_rule('/health', 'health_check', health_check, methods=['GET'])
+    app.cli.add_command(rebuild_indexes)
+    app.cli.add_command(export_storage)
+    app.cli.add_command(import_storage)
+    app.cli.add_command(reformat_storage)
+    app.cli.add_command(serve)
+    return app
 
-@app.route('/health', methods=['GET'])
 def health_check():
-    return jsonify({"status": "healthy", "storage_path": DATA_STORAGE_PATH})
+    return jsonify({
+        "status": "healthy",
+        "storage_engine": current_app.config.get('STORAGE_ENGINE', 'json'),
+        "storage_path": current_app.config['DATA_STORAGE_PATH'],
+        "storage_format": current_app.config.get('STORAGE_FORMAT', 'pretty'),
+        "json_backend": JSON_BACKEND,
+        "storage_watcher": current_app.extensions['storage_watcher'].mode if 'storage_watcher' in current_app.extensions else None,
+        "pid": os.getpid(),
+        "file_cache": current_app.extensions['file_service'].cache_stats(),
+        "ai_response_cache": current_app.extensions['response_cache'].stats() if 'response_cache' in current_app.extensions else None,
+    })
+
+@click.command('rebuild-indexes')
+@click.argument('campaign_id', required=False)
+@with_appcontext
+def rebuild_indexes(campaign_id):
+    """Reconstruye los manifiestos y los índices de búsqueda y vectorial desde los archivos."""
+    service = current_app.extensions['file_service']
+    campaigns = service.rebuild_manifest(None, "campaigns")
+    campaign_ids = [campaign_id] if campaign_id else list(campaigns)
+    for cid in campaign_ids:
+        vault = service.rebuild_manifest(cid, "vault")
+        sessions = service.rebuild_manifest(cid, "sessions")
+        current_app.extensions['search_service'].rebuild(cid)
+        if 'vector_index' in current_app.extensions:
+            current_app.extensions['vector_index'].rebuild(cid)
+        click.echo(f"campaign_{cid}: {len(vault)} items, {len(sessions)} sesiones")
+
+@click.command('export-storage')
+@click.argument('dest_path', type=click.Path(file_okay=False))
+@click.option('--campaign', 'campaign_ids', multiple=True, help="Solo estas campañas (repetible)")
+@with_appcontext
+def export_storage(dest_path, campaign_ids):
+    """Exporta las campañas al layout campaign_{uuid}/vault|sessions en DEST_PATH."""
+    dest_path = os.path.abspath(dest_path)
+    if dest_path == os.path.abspath(current_app.config['DATA_STORAGE_PATH']) and current_app.config['STORAGE_ENGINE'] == 'json':
+        raise click.ClickException("El destino es el propio almacenamiento de archivos")
+    export_to_files(current_app.extensions['file_service'], dest_path, list(campaign_ids) or None, log=click.echo)
+
+@click.command('import-storage')
+@click.argument('src_path', type=click.Path(exists=True, file_okay=False))
+@click.option('--campaign', 'campaign_ids', multiple=True, help="Solo estas campañas (repetible)")
+@with_appcontext
+def import_storage(src_path, campaign_ids):
+    """Importa campañas desde un árbol campaign_{uuid}/vault|sessions al almacenamiento actual."""
+    copied = import_from_files(os.path.abspath(src_path), current_app.extensions['file_service'], list(campaign_ids) or None, log=click.echo)
+    # La copia no pasa por los listeners: el índice de búsqueda se regenera aquí
+    for cid in copied:
+        current_app.extensions['search_service'].rebuild(cid)
+        if 'vector_index' in current_app.extensions:
+            current_app.extensions['vector_index'].rebuild(cid)
+
+@click.command('reformat-storage')
+@click.option('--format', 'storage_format', type=click.Choice(STORAGE_FORMATS), default=None,
+              help="Formato destino (por defecto STORAGE_FORMAT)")
+@click.option('--campaign', 'campaign_ids', multiple=True, help="Solo estas campañas (repetible)")
+@with_appcontext
+def reformat_storage(storage_format, campaign_ids):
+    """Reescribe los documentos JSON en el formato 'pretty' o 'compact', sin tocar su contenido."""
+    service = current_app.extensions['file_service']
+    if not isinstance(service, FileService):
+        raise click.ClickException("Solo aplica al almacenamiento de archivos (STORAGE_ENGINE=json)")
+    storage_format = storage_format or service.storage_format
+    stats = service.reformat_documents(list(campaign_ids) or None, storage_format)
+    click.echo(f"{stats['rewritten']} de {stats['files']} documentos reescritos en formato {storage_format}"
+               f" ({stats['bytes_before']} -> {stats['bytes_after']} bytes, {stats['unreadable']} ilegibles)")
+    if storage_format != service.storage_format:
+        click.echo(f"Aviso: STORAGE_FORMAT es '{service.storage_format}'; las próximas escrituras volverán a ese formato")
+
+@click.command('serve')
+@click.option('--host', default=lambda: os.getenv('HOST', '127.0.0.1'), show_default='127.0.0.1')
+@click.option('--port', default=lambda: int(os.getenv('PORT', 5000)), type=int, show_default='5000')
+@click.option('--workers', '-w', default=lambda: int(os.getenv('WEB_WORKERS', 2)), type=int, show_default='2')
+@click.option('--threads', '-t', default=lambda: int(os.getenv('WEB_THREADS', 8)), type=int, show_default='8')
+def serve(host, port, workers, threads):
+    """Servidor de producción con gunicorn (N procesos x M hilos)."""
+    if importlib.util.find_spec('gunicorn') is None:
+        raise click.ClickException("gunicorn no está instalado: pip install gunicorn")
+    backend_dir = os.path.dirname(os.path.abspath(__file__))
+    argv = [
+        sys.executable, '-m', 'gunicorn',
+        '--chdir', backend_dir,
+        '--config', os.path.join(backend_dir, 'gunicorn.conf.py'),
+        '--bind', f'{host}:{port}',
+        '--workers', str(workers),
+        '--threads', str(threads),
+        'wsgi:app',
+    ]
+    click.echo(f"Sirviendo en http://{host}:{port} con {workers} workers x {threads} hilos")
+    os.execv(sys.executable, argv)
 
+# Sin app a nivel de módulo: importar app.py no debe crear servicios, hilos ni
+# directorios sobre data_storage. gunicorn usa wsgi:app; 'flask' encuentra create_app.
 if __name__ == '__main__':
-    app.run(debug=True, port=5000)
\ No newline at end of file
+    # Con el reloader este proceso solo vigila los archivos y sirve un hijo:
+    # los servicios (hilos, índices, recover() de los resúmenes) solo en el hijo
+    app = create_app() if is_running_from_reloader() else Flask(__name__)
+    app.run(debug=True, port=5000)
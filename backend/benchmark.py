@@ -0,0 +1,312 @@
+"""Benchmarks en proceso sobre campañas sintéticas (Flask test client, sin red).
+
+    python benchmark.py                                   # tabla p50/p99/ops por caso
+    python benchmark.py --items 200 --sessions 80 --json bench/$(git rev-parse --short HEAD).json
+    python benchmark.py --compare bench/abc1234.json      # diferencias contra otro commit
+
+Genera una campaña con synthetic_campaign.py (--items por tipo, --sessions,
+--framework-chars) en un directorio temporal, arranca la aplicación sobre
+él (AI_STUB, sin resúmenes en segundo plano) y mide cada ruta de la API y
+las funciones internas del contexto de IA. Cada caso se repite al menos
+--iterations veces y al menos --min-time segundos (tras --warmup vueltas
+sin medir). Las latencias son de un solo hilo; para concurrencia contra un
+servidor real está load_test.py.
+
+El JSON incluye commit, motor y tamaños: dos resultados son comparables si
+los tamaños coinciden. --compare marca las regresiones de p50 por encima
+de --threshold.
+"""
+import argparse
+import io
+import json
+import os
+import platform
+import random
+import shutil
+import subprocess
+import sys
+import tempfile
+import time
+from datetime import datetime, timezone
+
+from app import create_app, shutdown_services
+from routes.ai_routes import load_campaign_context, get_rolling_memory
+from services import serializer
+from synthetic_campaign import WORDS, generate_campaign, open_storage
+
+
+class Case:
+    """Un benchmark: run(arg) se mide; setup() (opcional) prepara 'arg' fuera de la medida."""
+
+    def __init__(self, name, run, setup=None, max_iterations=None, megabytes=None):
+        self.name = name
+        self.run = run
+        self.setup = setup
+        # Casos caros (export, import...) no pasan de aquí aunque sobre tiempo
+        self.max_iterations = max_iterations
+        # MB que procesa cada vuelta: el informe añade ms por MB
+        self.megabytes = megabytes
+
+
+def percentile(sorted_values, q):
+    return sorted_values[min(len(sorted_values) - 1, int(len(sorted_values) * q))]
+
+
+def measure(case, iterations, min_time, warmup):
+    for _ in range(warmup):
+        case.run(case.setup() if case.setup else None)
+
+    latencies = []
+    limit = case.max_iterations or sys.maxsize
+    started = time.perf_counter()
+    while len(latencies) < min(iterations, limit) or (
+        time.perf_counter() - started < min_time and len(latencies) < limit
+    ):
+        arg = case.setup() if case.setup else None
+        t0 = time.perf_counter()
+        case.run(arg)
+        latencies.append(time.perf_counter() - t0)
+
+    latencies.sort()
+    total = sum(latencies)
+    result = {
+        "n": len(latencies),
+        "p50_ms": round(percentile(latencies, 0.5) * 1000, 3),
+        "p99_ms": round(percentile(latencies, 0.99) * 1000, 3),
+        "mean_ms": round(total / len(latencies) * 1000, 3),
+        "ops_s": round(len(latencies) / total, 1) if total else None,
+    }
+    if case.megabytes:
+        result["ms_per_mb"] = round(percentile(latencies, 0.5) * 1000 / case.megabytes, 3)
+    return result
+
+
+def build_cases(app, campaign_id):
+    client = app.test_client()
+    service = app.extensions['file_service']
+    rng = random.Random(1)
+    base = f"/api/campaigns/{campaign_id}"
+
+    def call(method, url, expect=200, **kwargs):
+        response = client.open(url, method=method, **kwargs)
+        body = response.get_data()
+        if response.status_code != expect:
+            raise RuntimeError(f"{method} {url}: {response.status_code} {body[:200]!r}")
+        return response
+
+    def etag(url):
+        return call('GET', url).headers['ETag']
+
+    def get(url, expect=200, **kwargs):
+        return lambda _: call('GET', url, expect, **kwargs)
+
+    def revalidate(url):
+        # La ETag se pide en setup (sin medir): así vale aunque otro caso haya escrito antes
+        return Case(f"GET {url.rsplit('/', 1)[-1] or 'campaigns'} (304)",
+                    lambda tag: call('GET', url, 304, headers={"If-None-Match": tag}),
+                    setup=lambda: etag(url))
+
+    items = client.get(f"{base}/vault").get_json()
+    item_ids = [i['id'] for i in items]
+    session_ids = [s['id'] for s in client.get(f"{base}/sessions").get_json()]
+
+    def new_item(_=None):
+        return call('POST', f"{base}/vault", 201, json={"type": "npc", "content": {"name": "Bench"}}).get_json()['id']
+
+    def new_session(_=None):
+        return call('POST', f"{base}/sessions", 201, json={}).get_json()['id']
+
+    def new_campaign(_=None):
+        return call('POST', '/api/campaigns/', 201, json={"title": "Bench"}).get_json()['id']
+
+    def trashed_campaign():
+        return call('DELETE', f"/api/campaigns/{new_campaign()}").get_json()['trash']
+
+    def query():
+        return ' '.join(rng.sample(WORDS, 3))
+
+    archive = call('GET', f"{base}/export").get_data()
+
+    def with_app_context(fn):
+        def run(_):
+            with app.app_context():
+                fn()
+        return run
+
+    return [
+        # --- Campañas ---
+        Case("GET campaigns", get('/api/campaigns/')),
+        revalidate('/api/campaigns/'),
+        Case("POST campaign", new_campaign, max_iterations=200),
+        Case("GET campaign", get(base)),
+        Case("PUT campaign", lambda _: call('PUT', base, json={"moods": query()})),
+        Case("DELETE campaign", lambda cid: call('DELETE', f"/api/campaigns/{cid}"), setup=new_campaign, max_iterations=100),
+        Case("GET export", lambda _: call('GET', f"{base}/export").get_data(), max_iterations=30),
+        Case("POST import", lambda _: call('POST', '/api/campaigns/import', 201, data=io.BytesIO(archive)), max_iterations=30),
+        Case("GET trash", get('/api/campaigns/_trash'), max_iterations=200),
+        Case("POST trash restore", lambda name: call('POST', f"/api/campaigns/_trash/{name}/restore", 201),
+             setup=trashed_campaign, max_iterations=50),
+        # --- Vault ---
+        Case("GET vault", get(f"{base}/vault")),
+        revalidate(f"{base}/vault"),
+        Case("GET vault (gzip)", get(f"{base}/vault", headers={"Accept-Encoding": "gzip"})),
+        Case("GET vault (filter+page)", get(f"{base}/vault?type=npc,location&status=reserve&sort=name&limit=20")),
+        Case("POST vault item", new_item),
+        Case("PUT vault item", lambda _: call('PUT', f"{base}/vault/{rng.choice(item_ids)}", json={"usage_count": rng.randint(0, 50)})),
+        Case("DELETE vault item", lambda item_id: call('DELETE', f"{base}/vault/{item_id}"), setup=new_item),
+        Case("POST vault _bulk (100 status)", lambda _: call('POST', f"{base}/vault/_bulk", json={"operations": [
+            {"op": "status", "ids": rng.sample(item_ids, min(100, len(item_ids))), "status": rng.choice(("active", "reserve"))}
+        ]})),
+        # --- Sesiones ---
+        Case("GET sessions", get(f"{base}/sessions")),
+        Case("GET sessions/timeline", get(f"{base}/sessions/timeline")),
+        Case("GET session", lambda _: call('GET', f"{base}/sessions/{rng.choice(session_ids)}")),
+        Case("POST session", new_session, max_iterations=200),
+        Case("PUT session", lambda _: call('PUT', f"{base}/sessions/{rng.choice(session_ids)}", json={"recap": query()})),
+        Case("DELETE session", lambda session_id: call('DELETE', f"{base}/sessions/{session_id}"), setup=new_session, max_iterations=200),
+        # --- Búsqueda, cambios, IA ---
+        Case("GET search", lambda _: call('GET', f"{base}/search?q={rng.choice(WORDS)}")),
+        Case("GET changes", get(f"{base}/changes?since=0&limit=200")),
+        Case("POST chat (stub)", lambda _: call('POST', f"{base}/chat", json={"query": query(), "fresh": True})),
+        Case("POST chat (cached)", lambda _: call('POST', f"{base}/chat", json={"query": "qué trama la bruja del pantano"})),
+        Case("POST chat/stream (stub)", lambda _: call('POST', f"{base}/chat/stream", json={"query": query(), "fresh": True}).get_data()),
+        Case("GET health", get('/health')),
+        # --- Funciones internas ---
+        Case("load_campaign_context", lambda _: load_campaign_context(service, campaign_id)),
+        Case("get_rolling_memory", with_app_context(lambda: get_rolling_memory(campaign_id))),
+        Case("FileService.list_campaigns", lambda _: service.list_campaigns()),
+    ]
+
+
+def serializer_cases(service, campaign_id):
+    """Serializar y parsear los documentos de la campaña, uno a uno como save_json/load_json.
+
+    Un caso por backend disponible (json, orjson) y formato (pretty, compact).
+    """
+    metadata = service.load_json(os.path.join(service._get_campaign_path(campaign_id), "metadata.json"))
+    docs = [metadata] + [dict(doc) for collection in ("vault", "sessions")
+                         for doc in service.load_records(campaign_id, collection).values()]
+    cases = []
+    for backend, (dumps, loads) in serializer.BACKENDS.items():
+        for pretty in (True, False):
+            raws = [dumps(doc, pretty) for doc in docs]
+            megabytes = sum(len(raw) for raw in raws) / (1024 * 1024)
+            label = f"{'pretty' if pretty else 'compact'}, {backend}"
+            cases.append(Case(f"serialize ({label})", lambda _, dumps=dumps, pretty=pretty: [dumps(doc, pretty) for doc in docs],
+                              megabytes=megabytes))
+            cases.append(Case(f"parse ({label})", lambda _, loads=loads, raws=raws: [loads(raw) for raw in raws],
+                              megabytes=megabytes))
+    return cases
+
+
+def git_commit():
+    try:
+        return subprocess.run(
+            ['git', 'rev-parse', '--short', 'HEAD'], capture_output=True, text=True,
+            cwd=os.path.dirname(os.path.abspath(__file__)), check=True,
+        ).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def run_benchmarks(storage_path, engine="json", items_per_type=50, sessions=20, framework_chars=20000,
+                   iterations=50, min_time=0.5, warmup=3, only=None, log=print):
+    """Genera la campaña, mide los casos y devuelve el informe (dict serializable)."""
+    generator = open_storage(storage_path, engine)
+    try:
+        started = time.perf_counter()
+        campaign_id = generate_campaign(generator, items_per_type=items_per_type, sessions=sessions,
+                                        framework_chars=framework_chars, title="Benchmark")
+        generate_s = time.perf_counter() - started
+    finally:
+        generator.close()
+
+    app = create_app({"DATA_STORAGE_PATH": storage_path, "STORAGE_ENGINE": engine, "AI_STUB": True, "SUMMARY_WORKERS": 0})
+    results = {}
+    try:
+        cases = build_cases(app, campaign_id) + serializer_cases(app.extensions['file_service'], campaign_id)
+        for case in cases:
+            if only and not any(pattern.casefold() in case.name.casefold() for pattern in only):
+                continue
+            results[case.name] = result = measure(case, iterations, min_time, warmup)
+            if log:
+                per_mb = f"  {result['ms_per_mb']:.2f} ms/MB" if 'ms_per_mb' in result else ""
+                log(f"{case.name:32} p50 {result['p50_ms']:>9.3f} ms  p99 {result['p99_ms']:>9.3f} ms"
+                    f"  {result['ops_s']:>9} ops/s  (n={result['n']}){per_mb}")
+    finally:
+        shutdown_services(app)
+
+    return {
+        "commit": git_commit(),
+        "date": datetime.now(timezone.utc).isoformat(),
+        "python": platform.python_version(),
+        "engine": engine,
+        "json_backend": serializer.BACKEND,
+        "sizes": {"items_per_type": items_per_type, "sessions": sessions, "framework_chars": framework_chars},
+        "generate_s": round(generate_s, 3),
+        "results": results,
+    }
+
+
+def compare(baseline, current, threshold=1.10, log=print):
+    """Imprime p50/p99 de ambos informes; devuelve los casos cuyo p50 empeoró más de 'threshold'."""
+    if baseline.get('sizes') != current.get('sizes') or baseline.get('engine') != current.get('engine'):
+        log(f"aviso: tamaños/motor distintos ({baseline.get('engine')} {baseline.get('sizes')}"
+            f" vs {current.get('engine')} {current.get('sizes')})")
+    log(f"{'caso':32} {'p50 ' + str(baseline.get('commit')):>18} {'p50 ' + str(current.get('commit')):>18}  ratio  p99 ratio")
+    regressions = []
+    for name, result in current['results'].items():
+        old = baseline['results'].get(name)
+        if old is None:
+            log(f"{name:32} {'-':>18} {result['p50_ms']:>18.3f}")
+            continue
+        ratio = result['p50_ms'] / old['p50_ms'] if old['p50_ms'] else float('inf')
+        p99_ratio = result['p99_ms'] / old['p99_ms'] if old['p99_ms'] else float('inf')
+        flag = "  <-- regresión" if ratio > threshold else ""
+        if flag:
+            regressions.append(name)
+        log(f"{name:32} {old['p50_ms']:>18.3f} {result['p50_ms']:>18.3f}  {ratio:5.2f}  {p99_ratio:9.2f}{flag}")
+    return regressions
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--engine', choices=("json", "sqlite"), default="json")
+    parser.add_argument('--items', type=int, default=50, help="items del vault por tipo (7 tipos)")
+    parser.add_argument('--sessions', type=int, default=20)
+    parser.add_argument('--framework-chars', type=int, default=20000)
+    parser.add_argument('--iterations', type=int, default=50, help="mínimo de repeticiones medidas por caso")
+    parser.add_argument('--min-time', type=float, default=0.5, help="mínimo de segundos medidos por caso")
+    parser.add_argument('--warmup', type=int, default=3)
+    parser.add_argument('--only', action='append', help="solo casos cuyo nombre contenga esto (repetible)")
+    parser.add_argument('--storage', help="directorio de datos (por defecto uno temporal que se borra)")
+    parser.add_argument('--json', dest='json_path', help="guardar el informe en este archivo")
+    parser.add_argument('--compare', help="informe JSON de referencia (otro commit)")
+    parser.add_argument('--threshold', type=float, default=1.10, help="ratio de p50 que cuenta como regresión")
+    args = parser.parse_args()
+
+    storage_path = args.storage or tempfile.mkdtemp(prefix="bench_")
+    try:
+        report = run_benchmarks(
+            storage_path, engine=args.engine, items_per_type=args.items, sessions=args.sessions,
+            framework_chars=args.framework_chars, iterations=args.iterations, min_time=args.min_time,
+            warmup=args.warmup, only=args.only,
+        )
+    finally:
+        if not args.storage:
+            shutil.rmtree(storage_path, ignore_errors=True)
+
+    if args.json_path:
+        os.makedirs(os.path.dirname(os.path.abspath(args.json_path)), exist_ok=True)
+        with open(args.json_path, 'w', encoding='utf-8') as f:
+            json.dump(report, f, indent=2, ensure_ascii=False)
+    if args.compare:
+        with open(args.compare, encoding='utf-8') as f:
+            baseline = json.load(f)
+        print()
+        if compare(baseline, report, args.threshold):
+            sys.exit(1)
+
+
+if __name__ == '__main__':
+    main()
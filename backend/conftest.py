@@ -0,0 +1,29 @@
+import pytest
+
+from app import create_app, shutdown_services
+
+
+@pytest.fixture
+def make_app(tmp_path):
+    """Crea apps de prueba con el almacenamiento en tmp_path y la IA simulada.
+
+    make_app(**config) admite cualquier clave de configuración; cada llamada
+    sin DATA_STORAGE_PATH usa un directorio propio. Al terminar el test se
+    cierran los servicios (hilos de resúmenes, vigilante, fsync) de todas.
+    """
+    apps = []
+
+    def make(**config):
+        config.setdefault("DATA_STORAGE_PATH", str(tmp_path / f"storage_{len(apps)}"))
+        app = create_app({"AI_STUB": True, **config})
+        apps.append(app)
+        return app
+
+    yield make
+    for app in reversed(apps):
+        shutdown_services(app)
+
+
+@pytest.fixture
+def client(make_app):
+    return make_app().test_client()
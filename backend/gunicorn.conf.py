@@ -0,0 +1,21 @@
+# Configuración de gunicorn para 'flask serve' o 'gunicorn wsgi:app' desde backend/.
+import os
+
+bind = f"{os.getenv('HOST', '127.0.0.1')}:{os.getenv('PORT', '5000')}"
+workers = int(os.getenv('WEB_WORKERS', 2))
+threads = int(os.getenv('WEB_THREADS', 8))
+worker_class = 'gthread'
+# Las respuestas de IA en streaming pueden tardar
+timeout = int(os.getenv('WEB_TIMEOUT', 120))
+graceful_timeout = 30
+
+# Sin preload: cada worker importa la app y crea sus propios servicios
+# (cachés, índices, hilo de fsync). Nada de eso sobrevive bien a un fork.
+preload_app = False
+
+
+def worker_exit(server, worker):
+    # Cierre ordenado: vuelca las escrituras pendientes antes de salir
+    from app import shutdown_services
+    from wsgi import app
+    shutdown_services(app)
@@ -0,0 +1,135 @@
+"""Prueba de carga contra una instancia local (flask serve / gunicorn / app.py).
+
+    python load_test.py --url http://127.0.0.1:5000 --duration 10 --concurrency 16
+
+Crea una campaña de prueba con --items items en el vault y --sessions
+sesiones, mide cada escenario durante --duration segundos con
+--concurrency hilos y la borra al terminar (salvo --keep). Solo usa la
+biblioteca estándar para poder lanzarse en cualquier máquina.
+"""
+import argparse
+import json
+import random
+import statistics
+import threading
+import time
+import urllib.error
+import urllib.request
+
+
+def request(base_url, method, path, body=None):
+    data = json.dumps(body).encode('utf-8') if body is not None else None
+    req = urllib.request.Request(base_url + path, data=data, method=method)
+    if data is not None:
+        req.add_header('Content-Type', 'application/json')
+    with urllib.request.urlopen(req, timeout=30) as response:
+        payload = response.read()
+        return response.status, json.loads(payload) if payload else None
+
+
+def setup_campaign(base_url, n_items, n_sessions):
+    _, campaign = request(base_url, 'POST', '/api/campaigns/', {"title": "Load test"})
+    campaign_id = campaign['id']
+    item_ids = []
+    for i in range(n_items):
+        _, item = request(base_url, 'POST', f'/api/campaigns/{campaign_id}/vault', {
+            "type": random.choice(["npc", "location", "secret", "item"]),
+            "tags": [f"tag{i % 7}"],
+            "content": {"name": f"Item {i}", "description": "Texto de relleno " * 20},
+        })
+        item_ids.append(item['id'])
+    session_ids = [campaign['active_session']]
+    for _ in range(n_sessions - 1):
+        _, session = request(base_url, 'POST', f'/api/campaigns/{campaign_id}/sessions', {})
+        session_ids.append(session['id'])
+    return campaign_id, item_ids, session_ids
+
+
+def scenarios(campaign_id, item_ids, session_ids):
+    base = f'/api/campaigns/{campaign_id}'
+    return {
+        "vault list": lambda: ('GET', f'{base}/vault', None),
+        "vault list (filtro+página)": lambda: ('GET', f'{base}/vault?type=npc&sort=name&limit=20', None),
+        "vault update": lambda: ('PUT', f'{base}/vault/{random.choice(item_ids)}',
+                                 {"usage_count": random.randint(0, 50)}),
+        "sessions list": lambda: ('GET', f'{base}/sessions', None),
+        "session get": lambda: ('GET', f'{base}/sessions/{random.choice(session_ids)}', None),
+        "session update": lambda: ('PUT', f'{base}/sessions/{random.choice(session_ids)}',
+                                   {"notes": f"Notas {random.random()}"}),
+    }
+
+
+def run_scenario(base_url, make_request, duration, concurrency):
+    latencies = []
+    errors = [0]
+    lock = threading.Lock()
+    deadline = time.perf_counter() + duration
+
+    def worker():
+        local, local_errors = [], 0
+        while time.perf_counter() < deadline:
+            method, path, body = make_request()
+            start = time.perf_counter()
+            try:
+                request(base_url, method, path, body)
+                local.append(time.perf_counter() - start)
+            except (urllib.error.URLError, OSError, ValueError):
+                local_errors += 1
+        with lock:
+            latencies.extend(local)
+            errors[0] += local_errors
+
+    threads = [threading.Thread(target=worker) for _ in range(concurrency)]
+    started = time.perf_counter()
+    for t in threads:
+        t.start()
+    for t in threads:
+        t.join()
+    elapsed = time.perf_counter() - started
+
+    latencies.sort()
+    if not latencies:
+        return {"requests": 0, "errors": errors[0], "rps": 0.0, "p50_ms": None, "p99_ms": None}
+    return {
+        "requests": len(latencies),
+        "errors": errors[0],
+        "rps": round(len(latencies) / elapsed, 1),
+        "p50_ms": round(statistics.median(latencies) * 1000, 2),
+        "p99_ms": round(latencies[min(len(latencies) - 1, int(len(latencies) * 0.99))] * 1000, 2),
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--url', default='http://127.0.0.1:5000')
+    parser.add_argument('--duration', type=float, default=10.0, help="segundos por escenario")
+    parser.add_argument('--concurrency', type=int, default=16)
+    parser.add_argument('--items', type=int, default=500)
+    parser.add_argument('--sessions', type=int, default=20)
+    parser.add_argument('--only', action='append', help="ejecutar solo estos escenarios")
+    parser.add_argument('--json', action='store_true', help="salida en JSON")
+    parser.add_argument('--keep', action='store_true', help="no borrar la campaña de prueba")
+    args = parser.parse_args()
+
+    base_url = args.url.rstrip('/')
+    campaign_id, item_ids, session_ids = setup_campaign(base_url, args.items, args.sessions)
+    results = {}
+    try:
+        for name, make_request in scenarios(campaign_id, item_ids, session_ids).items():
+            if args.only and name not in args.only:
+                continue
+            results[name] = run_scenario(base_url, make_request, args.duration, args.concurrency)
+            if not args.json:
+                r = results[name]
+                print(f"{name:28} {r['rps']:>9} req/s  p50 {r['p50_ms']} ms  p99 {r['p99_ms']} ms"
+                      f"  ({r['requests']} ok, {r['errors']} errores)")
+    finally:
+        if not args.keep:
+            request(base_url, 'DELETE', f'/api/campaigns/{campaign_id}')
+
+    if args.json:
+        print(json.dumps({"url": base_url, "concurrency": args.concurrency, "results": results}, indent=2))
+
+
+if __name__ == '__main__':
+    main()
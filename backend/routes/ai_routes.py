@@ -1,154 +1,586 @@
-from flask import Blueprint, request, jsonify, current_app
-from services.file_service import FileService
+from flask import Blueprint, request, jsonify, current_app, Response
 import os
+import json
+import time
+import hashlib
+import threading
 import google.generativeai as genai
+from services.stub_model import StubGenerativeModel
+from services.conversation_store import Conversation
+from services.context_builder import rank_items, item_label, summarize_report
+from services.summary_queue import auto_summary
+from services.response_cache import normalize_query
+from services.metrics import span, record_span
+from routes.http_utils import sse_event
 
 ai_bp = Blueprint('ai', __name__)
 
-def configure_genai():
+MODEL_NAME = "gemini-2.0-flash"
+GENERATION_CONFIG = {
+    "temperature": 0.9,
+    "top_p": 0.95,
+    "top_k": 40,
+    "max_output_tokens": 8192,
+    "response_mime_type": "text/plain",
+}
+# Resúmenes automáticos (services/summary_queue.py): más deterministas y cortos
+SUMMARY_GENERATION_CONFIG = {
+    "temperature": 0.3,
+    "top_p": 0.95,
+    "top_k": 40,
+    "max_output_tokens": 1024,
+    "response_mime_type": "text/plain",
+}
+SYSTEM_ACK = "Entendido DM. Tengo el contexto completo. ¿Qué hacemos hoy?"
+
+# Turnos (pregunta + respuesta) que se conservan tras el system prompt
+MAX_HISTORY_TURNS = 10
+
+# Pool de modelos por (modelo, generation_config). genai.configure solo se
+# vuelve a llamar si cambia la API key.
+_model_pool = {}
+_model_pool_lock = threading.Lock()
+_configured_api_key = None
+
+def configure_genai(generation_config=None):
+    if current_app.config.get('AI_STUB'):
+        # Modelo falso para tests y desarrollo sin API key
+        return StubGenerativeModel()
+    global _configured_api_key
     api_key = os.getenv("GOOGLE_API_KEY")
     if not api_key:
         raise ValueError("GOOGLE_API_KEY not found in environment variables")
-    genai.configure(api_key=api_key)
-    return genai.GenerativeModel(
-        model_name="gemini-2.0-flash",
-        generation_config={
-            "temperature": 0.9,
-            "top_p": 0.95,
-            "top_k": 40,
-            "max_output_tokens": 8192,
-            "response_mime_type": "text/plain",
-        }
-    )
+    config = generation_config or GENERATION_CONFIG
+    pool_key = (MODEL_NAME, tuple(sorted(config.items())))
+
+    with _model_pool_lock:
+        if api_key != _configured_api_key:
+            genai.configure(api_key=api_key)
+            _configured_api_key = api_key
+            _model_pool.clear()
+        model = _model_pool.get(pool_key)
+        if model is None:
+            model = _model_pool[pool_key] = genai.GenerativeModel(
+                model_name=MODEL_NAME,
+                generation_config=config
+            )
+        return model
+
+def summarize_text(prompt):
+    """Una llamada al modelo sin conversación (la usa la cola de resúmenes)."""
+    with span("model.summary"):
+        return configure_genai(SUMMARY_GENERATION_CONFIG).generate_content(prompt).text
+
+def get_conversation_store():
+    return current_app.extensions['conversation_store']
 
 def get_file_service():
-    storage_path = current_app.config['DATA_STORAGE_PATH']
-    return FileService(storage_path)
+    # Instancia única registrada en app.py (comparte caché e índices)
+    return current_app.extensions['file_service']
 
 def load_campaign_context(service, campaign_id):
     path = service._get_campaign_path(campaign_id)
-    metadata = service.load_json(os.path.join(path, "metadata.json"))
-    vault_path = os.path.join(path, "vault")
-    vault_items = []
-    if os.path.exists(vault_path):
-        for f in os.listdir(vault_path):
-            if f.endswith(".json"):
-                item = service.load_json(os.path.join(vault_path, f))
-                if item: vault_items.append(item)
+    metadata = service.load_json(os.path.join(path, "metadata.json"), readonly=True)
+    vault_items = list(service.load_records(campaign_id, "vault").values())
     return metadata, vault_items
 
-def get_rolling_memory(service, campaign_id, limit=3):
-    """Recupera los resúmenes de las últimas 'limit' sesiones completadas."""
-    campaign_path = service._get_campaign_path(campaign_id)
-    sessions_path = os.path.join(campaign_path, "sessions")
-    sessions = []
-    
-    if os.path.exists(sessions_path):
-        for f in os.listdir(sessions_path):
-            if f.endswith(".json"):
-                sess = service.load_json(os.path.join(sessions_path, f))
-                if sess and sess.get('status') == 'completed' and sess.get('summary'):
-                    sessions.append(sess)
-    
-    # Ordenar por número (descendente) y tomar los últimos
-    sessions.sort(key=lambda x: x.get('number', 0), reverse=True)
-    recent = sessions[:limit]
+def get_rolling_memory(campaign_id, limit=None):
+    """Recupera los resúmenes de las últimas 'limit' sesiones completadas.
+
+    Por defecto ROLLING_MEMORY_SESSIONS; 0 desactiva la memoria rodante.
+    """
+    if limit is None:
+        limit = current_app.config.get('ROLLING_MEMORY_SESSIONS', 3)
+    if limit <= 0:
+        return ""
+    recent = current_app.extensions['session_timeline'].get(campaign_id).completed(limit, with_summary=True)
     
     # Formatear texto (orden cronológico para la lectura de la IA)
     memory_text = ""
-    for s in reversed(recent):
-        memory_text += f"- Sesión {s['number']} ({s.get('title', 'Sin título')}): {s.get('summary')}\n"
+    for s in recent:
+        memory_text += f"- Sesión {s['number']} ({s.get('title') or 'Sin título'}): {s.get('summary')}\n"
     
     return memory_text
 
-@ai_bp.route('/<campaign_id>/chat', methods=['POST'])
-def chat_with_ai(campaign_id):
-    try:
-        model = configure_genai() # Configurar con la key del env cada vez
-        data = request.get_json()
-        user_query = data.get('query', '')
-        context_mode = data.get('mode', 'vault') 
-        session_id = data.get('sessionId')
-        
-        service = get_file_service()
-        metadata, vault_items = load_campaign_context(service, campaign_id)
-        
-        if not metadata:
-            return jsonify({"error": "Campaign not found"}), 404
+def assemble_prompt_context(service, campaign_id):
+    """Lee la campaña y extrae las piezas del system prompt (None si no existe)."""
+    metadata, vault_items = load_campaign_context(service, campaign_id)
+    if not metadata:
+        return None
 
-        # Lógica de Framework
-        use_full = metadata.get('use_full_framework', False)
-        framework_full = metadata.get('framework', '')
-        framework_summary = metadata.get('framework_summary', '')
-        framework_context = framework_full if use_full else (framework_summary or framework_full)
-        if not framework_context: framework_context = "Mundo de fantasía genérico."
+    # Lógica de Framework
+    use_full = metadata.get('use_full_framework', False)
+    framework_full = metadata.get('framework', '')
+    framework_summary = metadata.get('framework_summary', '')
+    # Prioridad: el resumen escrito a mano, el automático si está al día, el texto completo
+    framework_context = framework_full if use_full else (
+        framework_summary or auto_summary(metadata, "framework") or framework_full
+    )
+    if not framework_context: framework_context = "Mundo de fantasía genérico."
 
+    sessions = service.read_manifest(campaign_id, "sessions")
+
+    return {
+        "framework": framework_context,
+        "truths": metadata.get('truths', []),
+        "fronts": metadata.get('fronts', []),
         # Memoria Rodante (Contexto Histórico Reciente)
-        rolling_memory = get_rolling_memory(service, campaign_id)
+        "rolling_memory": get_rolling_memory(campaign_id),
+        "vault_items": vault_items,
+        "vault_by_id": {i['id']: i for i in vault_items},
+        "session_links": {sid: sess.get('linked_items', []) for sid, sess in sessions.items()},
+        # Términos por item para el ranking léxico (se rellena bajo demanda)
+        "item_terms": {},
+    }
 
-        characters = [i['content'] for i in vault_items if i['type'] == 'character']
-        secrets = [i['content'] for i in vault_items if i['type'] == 'secret' and i['status'] == 'reserve']
-        truths = metadata.get('truths', [])
-        fronts = metadata.get('fronts', [])
+def get_prompt_context(service, campaign_id):
+    """Contexto cacheado; solo toca el disco si la campaña cambió desde la última vez."""
+    cache = current_app.extensions['prompt_context']
+    # Firma del almacenamiento: detecta escrituras hechas por otros workers
+    stamp = service.campaign_stamp(campaign_id)
+    def load():
+        with span("prompt.context"):
+            return assemble_prompt_context(service, campaign_id)
+    return cache.get(campaign_id, load, stamp=stamp)
 
-        system_prompt = f"""
-        Eres un Asistente de Dungeon Master experto.
-        
-        CONTEXTO MUNDIAL (Framework):
-        {framework_context}
-        
-        VERDADES DEL MUNDO:
-        {', '.join(filter(None, truths))}
-        
-        FRENTES (Amenazas Activas):
-        {str(fronts)}
-        
-        PERSONAJES (PJs):
-        {str(characters)}
+def get_context_builder():
+    return current_app.extensions['context_builder']
+
+def build_system_prompt(context, context_mode, session_id, builder):
+    """Devuelve (system_prompt, informe, ids_completos) respetando el presupuesto de tokens.
+
+    El resultado solo depende del contexto (no de la pregunta), así que se
+    memoiza y la conversación puede reutilizarse entre turnos.
+    """
+    memo_key = (context_mode, session_id if context_mode == 'session' else None)
+    cached = context['prompts'].get(memo_key)
+    if cached is not None:
+        return cached
+
+    vault_items = context['vault_items']
+    terms_cache = context['item_terms']
+    report = {}
+
+    framework, report['framework'] = builder.fit_text('framework', context['framework'])
+    # Verdades y frentes comparten la sección 'world': primero las verdades
+    truths, report['truths'] = builder.fit_list('world', [str(t) for t in context['truths'] or [] if t])
+    fronts, report['fronts'] = builder.fit_list(
+        'world', context['fronts'],
+        budget_tokens=max(0, builder.section_budget('world') - report['truths']['tokens'])
+    )
+    rolling_memory, report['memory'] = builder.fit_text('memory', context['rolling_memory'])
+
+    characters = [i for i in vault_items if i['type'] == 'character']
+    character_texts, report['characters'] = builder.fit_items('characters', characters, terms_cache=terms_cache)
+    full_ids = list(report['characters']['included'])
+
+    system_prompt = f"""
+    Eres un Asistente de Dungeon Master experto.
+    
+    CONTEXTO MUNDIAL (Framework):
+    {framework}
+    
+    VERDADES DEL MUNDO:
+    {', '.join(truths)}
+    
+    FRENTES (Amenazas Activas):
+    {str(fronts)}
+    
+    PERSONAJES (PJs):
+    {chr(10).join(character_texts)}
+    
+    MEMORIA RECIENTE (Lo que ha pasado últimamente):
+    {rolling_memory if rolling_memory else "No hay sesiones previas registradas."}
+    """
+
+    if context_mode == 'session' and session_id:
+        linked_ids = context['session_links'].get(session_id)
         
-        MEMORIA RECIENTE (Lo que ha pasado últimamente):
-        {rolling_memory if rolling_memory else "No hay sesiones previas registradas."}
-        """
+        if linked_ids is not None:
+            vault_by_id = context['vault_by_id']
+            active_items = [vault_by_id[i] for i in linked_ids if i in vault_by_id]
+            secrets = [i for i in vault_items if i['type'] == 'secret' and i['status'] == 'reserve']
 
-        if context_mode == 'session' and session_id:
-            session_path = os.path.join(service._get_campaign_path(campaign_id), "sessions")
-            # Buscar archivo de sesión
-            target_file = None
-            for f in os.listdir(session_path):
-                if f.endswith(f"_{session_id}.json"):
-                    target_file = f
-                    break
+            # Primero lo que está en escena; los secretos con lo que sobre
+            items_budget = builder.section_budget('items')
+            active_texts, report['scene_items'] = builder.fit_items('items', active_items, linked_ids=linked_ids, terms_cache=terms_cache)
+            secret_texts, report['secrets'] = builder.fit_items(
+                'items', secrets, terms_cache=terms_cache,
+                budget_tokens=max(0, items_budget - report['scene_items']['tokens'])
+            )
+            full_ids += report['scene_items']['included'] + report['secrets']['included']
             
-            if target_file:
-                session_data = service.load_json(os.path.join(session_path, target_file))
-                linked_ids = session_data.get('linked_items', [])
-                active_items = [i['content'] for i in vault_items if i['id'] in linked_ids]
-                
-                system_prompt += f"""
-                ESTADO: SESIÓN EN CURSO.
-                Elementos en escena: {str(active_items)}
-                Secretos disponibles: {str(secrets)}
-                
-                Instrucciones: Prioriza conectar la situación actual con la 'Memoria Reciente' y los 'Frentes'.
-                """
-        else:
-            item_names = [i['content'].get('name', i['content'].get('title')) for i in vault_items]
             system_prompt += f"""
-            ESTADO: PREPARACIÓN (VAULT).
-            Items existentes: {str(item_names)}
-            Instrucciones: Crea contenido nuevo que sea coherente con el Framework y la historia reciente.
+            ESTADO: SESIÓN EN CURSO.
+            Elementos en escena: {chr(10).join(active_texts)}
+            Secretos disponibles: {chr(10).join(secret_texts)}
+            
+            Instrucciones: Prioriza conectar la situación actual con la 'Memoria Reciente' y los 'Frentes'.
             """
+    else:
+        # Los nombres más usados primero
+        ranked = [i for _, i in rank_items(vault_items)]
+        names, report['item_names'] = builder.fit_list('items', [item_label(i) for i in ranked])
+        system_prompt += f"""
+        ESTADO: PREPARACIÓN (VAULT).
+        Items existentes: {str(names)}
+        Instrucciones: Crea contenido nuevo que sea coherente con el Framework y la historia reciente.
+        """
+
+    result = (system_prompt, report, full_ids)
+    context['prompts'][memo_key] = result
+    return result
+
+def vector_candidates(campaign_id, user_query, exclude_ids):
+    """IDs del Vault más cercanos a la pregunta según el índice vectorial (None si está desactivado)."""
+    vector_index = current_app.extensions.get('vector_index')
+    if vector_index is None or not user_query.strip():
+        return None
+    with span("vector.search"):
+        hits = vector_index.search(
+            campaign_id, user_query, k=current_app.config['VECTOR_TOP_K'],
+            exclude_ids=exclude_ids, min_score=current_app.config['VECTOR_MIN_SCORE']
+        )
+    return None if hits is None else [item_id for _, item_id in hits]
+
+def build_turn_message(context, user_query, full_ids, builder, campaign_id=None):
+    """Antepone a la pregunta los items del Vault más relevantes para ella."""
+    ranked_ids = vector_candidates(campaign_id, user_query, full_ids) if campaign_id else None
+    texts, report = builder.turn_context(
+        user_query, context['vault_items'], exclude_ids=full_ids,
+        terms_cache=context['item_terms'], ranked_ids=ranked_ids
+    )
+    if not texts:
+        return user_query, report
+    relevant = "\n".join(f"- {t}" for t in texts)
+    return f"CONTEXTO RELEVANTE DEL VAULT:\n{relevant}\n\nPREGUNTA DEL DM:\n{user_query}", report
 
+def prepare_chat(campaign_id, data):
+    """Prepara el turno de chat.
+
+    Devuelve (conversation, user_query, release, stats), o None si la campaña
+    no existe. Si hay una conversación abierta para (campaña, modo, sesión)
+    con el mismo system prompt se reutiliza; si no, se abre una nueva.
+    'release' debe llamarse al terminar el turno.
+    """
+    started = time.perf_counter()
+    model = configure_genai()
+    user_query = data.get('query', '')
+    context_mode = data.get('mode', 'vault') 
+    session_id = data.get('sessionId')
+    
+    service = get_file_service()
+    context = get_prompt_context(service, campaign_id)
+    
+    if context is None:
+        return None
+
+    builder = get_context_builder()
+    with span("prompt.build"):
+        system_prompt, context_report, full_ids = build_system_prompt(context, context_mode, session_id, builder)
+        context_report = dict(context_report)
+        user_query, context_report['turn'] = build_turn_message(context, user_query, full_ids, builder, campaign_id)
+    prompt_hash = hashlib.sha1(system_prompt.encode('utf-8')).hexdigest()
+
+    store = get_conversation_store()
+    key = conversation_key(campaign_id, data)
+    if data.get('reset'):
+        store.discard(key)
+
+    conversation = store.get(key, prompt_hash)
+    reused = conversation is not None
+    if not reused:
         chat = model.start_chat(
             history=[
                 {"role": "user", "parts": [system_prompt]},
-                {"role": "model", "parts": ["Entendido DM. Tengo el contexto completo. ¿Qué hacemos hoy?"]}
+                {"role": "model", "parts": [SYSTEM_ACK]}
             ]
         )
-        
-        response = chat.send_message(user_query)
-        return jsonify({"response": response.text})
+        conversation = store.put(key, chat, prompt_hash)
+
+    if not conversation.lock.acquire(blocking=False):
+        # Otro turno en curso en la misma conversación: chat efímero para no esperar
+        chat = model.start_chat(history=list(conversation.chat.history[:2]))
+        conversation = Conversation(chat, prompt_hash)
+        conversation.lock.acquire()
+        reused = False
+
+    def release(ok):
+        if ok:
+            conversation.turns += 1
+            trim_history(conversation.chat)
+        else:
+            # Un turno a medias deja el ChatSession inservible
+            store.discard(key, conversation)
+        conversation.lock.release()
+
+    stats = {
+        "prompt_ms": round((time.perf_counter() - started) * 1000, 1),
+        "system_prompt_chars": len(system_prompt),
+        # Estimación grosera: ~4 caracteres por token
+        "prompt_tokens_est": (history_chars(conversation.chat.history) + len(user_query)) // 4,
+        "history_messages": len(conversation.chat.history),
+        "reused_conversation": reused,
+        "context": summarize_report(context_report),
+        # Nombres de lo que no cupo en el presupuesto, por sección
+        "dropped": {
+            section: data['dropped'] for section, data in context_report.items()
+            if isinstance(data.get('dropped'), list) and data['dropped']
+        },
+    }
+    return conversation, user_query, release, stats
+
+def conversation_key(campaign_id, data):
+    """(campaña, modo, sesión): la conversación que continúa este turno."""
+    mode = data.get('mode', 'vault')
+    return (campaign_id, mode, data.get('sessionId') if mode == 'session' else None)
+
+def message_text(message):
+    parts = message["parts"] if isinstance(message, dict) else message.parts
+    return "".join(part if isinstance(part, str) else getattr(part, 'text', '') for part in parts)
+
+def history_chars(history):
+    return sum(len(message_text(message)) for message in history)
+
+def conversation_state(campaign_id, data):
+    """Huella de los turnos previos de la conversación, o None si empieza de cero.
+
+    Forma parte de la clave de la caché de respuestas: una misma pregunta
+    no tiene la misma respuesta como primer turno que como seguimiento.
+    """
+    if data.get('reset'):
+        return None
+    conversation = get_conversation_store().peek(conversation_key(campaign_id, data))
+    if conversation is None:
+        return None
+    turns = list(conversation.chat.history)[2:]
+    if not turns:
+        return None
+    digest = hashlib.sha1(conversation.prompt_hash.encode('utf-8'))
+    for message in turns:
+        digest.update(b"\0" + message_text(message).encode('utf-8'))
+    return digest.hexdigest()
+
+def record_turn(campaign_id, data, text):
+    """Añade a la conversación una respuesta que no pasó por el modelo (caché o single-flight).
+
+    Así el siguiente turno la tiene en el historial, igual que si se hubiera
+    generado. Si el turno ya está (el líder del single-flight lo grabó en
+    la misma conversación) no se repite.
+    """
+    prepared = prepare_chat(campaign_id, data)
+    if prepared is None:
+        return
+    conversation, user_query, release, _ = prepared
+    history = list(conversation.chat.history)
+    last_turn = [message_text(message) for message in history[-2:]] if len(history) > 2 else None
+    if last_turn != [user_query, text]:
+        conversation.chat.history = history + [
+            {"role": "user", "parts": [user_query]},
+            {"role": "model", "parts": [text]},
+        ]
+    release(True)
+
+def trim_history(chat):
+    history = list(chat.history)
+    limit = 2 + MAX_HISTORY_TURNS * 2
+    if len(history) > limit:
+        chat.history = history[:2] + history[-MAX_HISTORY_TURNS * 2:]
+
+def log_chat_stats(campaign_id, stats):
+    current_app.logger.info("chat %s %s", campaign_id, json.dumps(stats))
+
+def server_timing(stats):
+    parts = [f"prompt;dur={stats['prompt_ms']}"] if 'prompt_ms' in stats else []
+    if 'model_ms' in stats:
+        parts.append(f"model;dur={stats['model_ms']}")
+    if stats.get('cache'):
+        parts.append(f"cache;desc={stats['cache']}")
+    return ", ".join(parts)
+
+def response_cache_key(campaign_id, data):
+    """(caché, clave) de la respuesta para esta pregunta; clave None si no se cachea.
+
+    La versión del contexto es la firma del almacenamiento de la campaña:
+    cambia con cualquier escritura, de este worker o de otro. El estado de la
+    conversación (ver conversation_state) separa los seguimientos de los
+    primeros turnos y de otras conversaciones.
+    """
+    cache = current_app.extensions.get('response_cache')
+    query = normalize_query((data or {}).get('query', ''))
+    if cache is None or not query:
+        return cache, None
+    service = get_file_service()
+    # Cargar el contexto antes de firmar: la primera lectura puede crear los manifiestos
+    if get_prompt_context(service, campaign_id) is None:
+        return cache, None
+    _, mode, session_id = conversation_key(campaign_id, data)
+    state = conversation_state(campaign_id, data)
+    return cache, (campaign_id, service.campaign_stamp(campaign_id), mode, session_id, state, query)
+
+def wants_fresh(data):
+    """Respuesta nueva aunque haya una cacheada: {"fresh": true} o Cache-Control: no-cache."""
+    return bool((data or {}).get('fresh')) or 'no-cache' in request.headers.get('Cache-Control', '')
+
+@ai_bp.route('/<campaign_id>/chat', methods=['POST'])
+def chat_with_ai(campaign_id):
+    """Un turno de chat. Las preguntas repetidas (o simultáneas) con el mismo
+    contexto comparten respuesta salvo que se pida {"fresh": true}.
+    """
+    try:
+        data = request.get_json()
+        stats = {}
+
+        def ask():
+            prepared = prepare_chat(campaign_id, data)
+            if prepared is None:
+                return None
+            conversation, user_query, release, turn_stats = prepared
+            stats.update(turn_stats)
+            ok = False
+            try:
+                started = time.perf_counter()
+                with span("model.call"):
+                    response = conversation.chat.send_message(user_query)
+                    text = response.text
+                stats["model_ms"] = round((time.perf_counter() - started) * 1000, 1)
+                ok = True
+            finally:
+                release(ok)
+            return text
+
+        cache, key = response_cache_key(campaign_id, data)
+        if key is None:
+            text = ask()
+        else:
+            text, stats['cache'] = cache.fetch(key, ask, fresh=wants_fresh(data))
+            if text is not None and stats['cache'] in ("hit", "coalesced"):
+                record_turn(campaign_id, data, text)
+        if text is None:
+            return jsonify({"error": "Campaign not found"}), 404
+
+        log_chat_stats(campaign_id, stats)
+        headers = {"Server-Timing": server_timing(stats)}
+        if 'prompt_tokens_est' in stats:
+            headers["X-Prompt-Tokens-Est"] = str(stats["prompt_tokens_est"])
+        if stats.get('cache'):
+            headers["X-AI-Cache"] = stats['cache']
+        return jsonify({"response": text}), 200, headers
         
     except Exception as e:
-        print(f"Error IA: {str(e)}") 
-        return jsonify({"error": str(e)}), 500
\ No newline at end of file
+        current_app.logger.exception("chat %s failed", campaign_id)
+        return jsonify({"error": str(e)}), 500
+
+@ai_bp.route('/<campaign_id>/chat/stream', methods=['POST'])
+def chat_with_ai_stream(campaign_id):
+    """Igual que /chat pero envía la respuesta por trozos (Server-Sent Events).
+
+    Eventos: 'data' con {"text": ...} por cada trozo, 'done' al terminar
+    (con las métricas del turno) y 'error' con {"error": ...} si el modelo
+    falla a mitad. Una respuesta cacheada (o compartida con una petición
+    idéntica en curso) llega en un solo trozo.
+    """
+    data = request.get_json()
+    cache, key = response_cache_key(campaign_id, data)
+    flight = None
+    try:
+        if key is not None:
+            state, payload = cache.claim(key, fresh=wants_fresh(data))
+            if state == "hit":
+                record_turn(campaign_id, data, payload)
+                return cached_stream(campaign_id, payload, "hit")
+            if state == "follow":
+                text = payload.wait()
+                if text is not None:
+                    record_turn(campaign_id, data, text)
+                    return cached_stream(campaign_id, text, "coalesced")
+            else:
+                flight = payload
+        try:
+            prepared = prepare_chat(campaign_id, data)
+            if prepared is None:
+                if flight:
+                    cache.complete(key, flight, None)
+                return jsonify({"error": "Campaign not found"}), 404
+            conversation, user_query, release, stats = prepared
+            started = time.perf_counter()
+            try:
+                response = conversation.chat.send_message(user_query, stream=True)
+            except Exception:
+                release(False)
+                raise
+        except Exception as e:
+            if flight:
+                cache.abandon(key, flight, e)
+            raise
+    except Exception as e:
+        current_app.logger.exception("chat stream %s failed", campaign_id)
+        return jsonify({"error": str(e)}), 500
+
+    logger = current_app.logger
+    if flight:
+        stats['cache'] = "bypass" if wants_fresh(data) else "miss"
+
+    def generate():
+        completed = False
+        parts = []
+        try:
+            for chunk in response:
+                text = chunk.text
+                if text:
+                    if "first_token_ms" not in stats:
+                        stats["first_token_ms"] = round((time.perf_counter() - started) * 1000, 1)
+                    parts.append(text)
+                    yield sse_event({"text": text})
+            completed = True
+            if flight:
+                cache.complete(key, flight, "".join(parts))
+            stats["model_ms"] = round((time.perf_counter() - started) * 1000, 1)
+            record_span("model.stream", stats["model_ms"] / 1000)
+            logger.info("chat %s %s", campaign_id, json.dumps(stats))
+            yield sse_event(stats, event="done")
+        except GeneratorExit:
+            # El cliente cerró la conexión: dejamos de consumir el stream del modelo
+            logger.info("chat stream %s cancelled by client", campaign_id)
+            raise
+        except Exception as e:
+            logger.exception("chat stream %s failed mid-response", campaign_id)
+            yield sse_event({"error": str(e)}, event="error")
+        finally:
+            if not completed:
+                close = getattr(response, 'close', None)
+                if close:
+                    close()
+                if flight:
+                    cache.abandon(key, flight)
+            release(completed)
+
+    return Response(generate(), mimetype='text/event-stream', headers={
+        "Cache-Control": "no-cache",
+        "X-Accel-Buffering": "no",
+        "Server-Timing": server_timing(stats),
+    })
+
+def cached_stream(campaign_id, text, source):
+    """Respuesta ya conocida con el mismo formato SSE que /chat/stream."""
+    stats = {"cache": source}
+    log_chat_stats(campaign_id, stats)
+
+    def generate():
+        yield sse_event({"text": text})
+        yield sse_event(stats, event="done")
+
+    return Response(generate(), mimetype='text/event-stream', headers={
+        "Cache-Control": "no-cache",
+        "X-Accel-Buffering": "no",
+        "Server-Timing": server_timing(stats),
+        "X-AI-Cache": source,
+    })
+
+@ai_bp.route('/<campaign_id>/chat/cache', methods=['GET'])
+def chat_cache_stats(campaign_id):
+    """Aciertos de la caché de respuestas de esta campaña (en este worker)."""
+    cache = current_app.extensions.get('response_cache')
+    if cache is None:
+        return jsonify({"enabled": False})
+    return jsonify(dict(cache.stats(campaign_id), enabled=True))
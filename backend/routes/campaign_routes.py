@@ -1,20 +1,38 @@
-from flask import Blueprint, request, jsonify, current_app
-from services.file_service import FileService
+from flask import Blueprint, Response, request, jsonify, current_app, stream_with_context
 from services.id_service import generate_id
+from services.file_service import VersionConflict
+from services.campaign_archive import (
+    ArchiveError, stream_campaign_archive, import_campaign_archive,
+    trash_campaign, list_trash, restore_from_trash,
+)
+from routes.http_utils import (
+    expected_version, document_response, conflict_response,
+    collection_etag, not_modified, cached_response, version_etag,
+)
 import os
+import re
+import tempfile
 from datetime import datetime
 
+# Tamaño máximo de un archivo de importación (se vuelca a disco, no a memoria)
+MAX_IMPORT_BYTES = 1024 * 1024 * 1024
+COPY_CHUNK = 1024 * 1024
+
 campaign_bp = Blueprint('campaigns', __name__)
 
 def get_file_service():
-    storage_path = current_app.config['DATA_STORAGE_PATH']
-    return FileService(storage_path)
+    # Instancia única registrada en app.py (comparte caché e índices)
+    return current_app.extensions['file_service']
 
 @campaign_bp.route('/', methods=['GET'])
 def list_campaigns():
     service = get_file_service()
+    etag = collection_etag(service, None, "campaigns")
+    cached = not_modified(etag)
+    if cached:
+        return cached
     campaigns = service.list_campaigns()
-    return jsonify(campaigns)
+    return cached_response(campaigns, etag)
 
 @campaign_bp.route('/', methods=['POST'])
 def create_campaign():
@@ -39,7 +57,8 @@ def create_campaign():
         "framework": data.get('framework', ''),
         "framework_summary": data.get('framework_summary', ''), # Nuevo campo
         "use_full_framework": False, # Nuevo campo, por defecto False (usar resumen)
-        "active_session": None
+        "active_session": None,
+        "version": 1
     }
     service.save_json(os.path.join(base_path, "metadata.json"), metadata)
     
@@ -55,7 +74,8 @@ def create_campaign():
         "summary": "",
         "notes": "",
         "linked_items": [],
-        "status": "planned"
+        "status": "planned",
+        "version": 1
     }
     sessions_path = os.path.join(base_path, "sessions")
     session_filename = f"session_01_{session_id}.json"
@@ -65,18 +85,23 @@ def create_campaign():
     metadata['active_session'] = session_id
     service.save_json(os.path.join(base_path, "metadata.json"), metadata)
     
-    return jsonify(metadata), 201
+    # 4. Actualizar manifiestos
+    service.on_saved(campaign_id, "sessions", session_01)
+    service.on_saved(campaign_id, "campaigns", metadata)
+    
+    return document_response(metadata, 201)
 
 @campaign_bp.route('/<campaign_id>', methods=['GET'])
 def get_campaign(campaign_id):
     service = get_file_service()
-    path = service._get_campaign_path(campaign_id)
-    metadata = service.load_json(os.path.join(path, "metadata.json"))
+    metadata_path = os.path.join(service._get_campaign_path(campaign_id), "metadata.json")
+    stamp = service.document_stamp(metadata_path)
+    metadata = service.load_json(metadata_path, readonly=True)
     
     if not metadata:
         return jsonify({"error": "Campaign not found"}), 404
         
-    return jsonify(metadata)
+    return not_modified(version_etag(metadata, stamp)) or document_response(metadata, stamp=stamp)
 
 @campaign_bp.route('/<campaign_id>', methods=['PUT'])
 def update_campaign(campaign_id):
@@ -85,29 +110,93 @@ def update_campaign(campaign_id):
     path = service._get_campaign_path(campaign_id)
     metadata_path = os.path.join(path, "metadata.json")
     
-    current_metadata = service.load_json(metadata_path)
-    if not current_metadata:
-        return jsonify({"error": "Campaign not found"}), 404
-        
     # Lista ampliada de campos permitidos
     fields = [
         'title', 'elevator_pitch', 'moods', 'truths', 'fronts', 'safety_tools', 
         'active_session', 'framework', 'framework_summary', 'use_full_framework'
     ]
-    
-    for field in fields:
-        if field in data:
-            current_metadata[field] = data[field]
-            
-    service.save_json(metadata_path, current_metadata)
-    return jsonify(current_metadata)
+
+    def apply(current_metadata):
+        for field in fields:
+            if field in data:
+                current_metadata[field] = data[field]
+
+    try:
+        current_metadata = service.update_json(metadata_path, apply, expected_version=expected_version())
+    except VersionConflict as e:
+        return conflict_response(e)
+    if not current_metadata:
+        return jsonify({"error": "Campaign not found"}), 404
+
+    service.on_saved(campaign_id, "campaigns", current_metadata)
+    return document_response(current_metadata)
 
 @campaign_bp.route('/<campaign_id>', methods=['DELETE'])
 def delete_campaign(campaign_id):
     service = get_file_service()
-    success = service.delete_campaign(campaign_id)
+    # Borrado suave: la campaña queda archivada en la papelera
+    trashed = trash_campaign(service, campaign_id)
     
-    if not success:
+    if not trashed:
         return jsonify({"error": "Campaign not found"}), 404
         
-    return jsonify({"message": "Campaign deleted"})
\ No newline at end of file
+    return jsonify({"message": "Campaign moved to trash", "trash": trashed})
+
+@campaign_bp.route('/<campaign_id>/export', methods=['GET'])
+def export_campaign(campaign_id):
+    """Zip con metadata, vault y sesiones, generado mientras se envía."""
+    service = get_file_service()
+    metadata = service.load_json(os.path.join(service._get_campaign_path(campaign_id), "metadata.json"), readonly=True)
+    if not metadata:
+        return jsonify({"error": "Campaign not found"}), 404
+
+    slug = re.sub(r'[^a-z0-9]+', '-', (metadata.get('title') or 'campaign').lower()).strip('-') or 'campaign'
+    filename = f"{slug}-{datetime.now().strftime('%Y%m%d')}.zip"
+    return Response(
+        stream_with_context(stream_campaign_archive(service, campaign_id)),
+        mimetype='application/zip',
+        headers={'Content-Disposition': f'attachment; filename="{filename}"'},
+    )
+
+@campaign_bp.route('/import', methods=['POST'])
+def import_campaign():
+    """Importa un zip exportado (body crudo o campo 'file' multipart) como campaña nueva."""
+    upload = request.files.get('file')
+    source = upload.stream if upload else request.stream
+    service = get_file_service()
+
+    # zipfile necesita poder hacer seek: se vuelca a un temporal por bloques
+    with tempfile.TemporaryFile() as spool:
+        copied = 0
+        while True:
+            chunk = source.read(COPY_CHUNK)
+            if not chunk:
+                break
+            copied += len(chunk)
+            if copied > MAX_IMPORT_BYTES:
+                return jsonify({"error": "Archive too large"}), 413
+            spool.write(chunk)
+        if not copied:
+            return jsonify({"error": "Archive is required"}), 400
+        spool.seek(0)
+        try:
+            metadata, counts = import_campaign_archive(service, spool)
+        except ArchiveError as e:
+            return jsonify({"error": str(e)}), 400
+
+    return jsonify({"campaign": metadata, "imported": counts}), 201
+
+@campaign_bp.route('/_trash', methods=['GET'])
+def list_campaign_trash():
+    return jsonify(list_trash(get_file_service()))
+
+@campaign_bp.route('/_trash/<name>/restore', methods=['POST'])
+def restore_campaign(name):
+    try:
+        result = restore_from_trash(get_file_service(), name)
+    except ArchiveError as e:
+        return jsonify({"error": str(e)}), 409
+    if result is None:
+        return jsonify({"error": "Not found in trash"}), 404
+    metadata, counts = result
+    return jsonify({"campaign": metadata, "imported": counts}), 201
\ No newline at end of file
@@ -0,0 +1,97 @@
+from flask import Blueprint, Response, request, jsonify, current_app, stream_with_context
+from routes.http_utils import sse_event
+import time
+
+# Un stream SSE ocupa un hilo del worker: se cierra cada cierto tiempo y
+# EventSource reconecta solo (con Last-Event-ID)
+STREAM_MAX_SECONDS = 300
+STREAM_POLL_SECONDS = 1.0
+KEEPALIVE_SECONDS = 15
+
+changes_bp = Blueprint('changes', __name__)
+
+def get_change_log():
+    return current_app.extensions['change_log']
+
+def _since():
+    # Last-Event-ID (reconexión de EventSource) manda sobre ?since=
+    value = request.headers.get('Last-Event-ID') or request.args.get('since', '0')
+    try:
+        return max(int(value), 0)
+    except ValueError:
+        return None
+
+@changes_bp.route('/<campaign_id>/changes', methods=['GET'])
+def list_changes(campaign_id):
+    """Cambios de la campaña posteriores a ?since=N (0 = todos los del log).
+
+    Con ?log=<id> del log que conoce el cliente: si ya no es el mismo
+    (campaña restaurada o importada) se responde reset: true y hay que
+    recargar entero.
+    """
+    since = _since()
+    if since is None:
+        return jsonify({"error": "since must be an integer"}), 400
+    try:
+        limit = int(request.args.get('limit', 1000))
+    except ValueError:
+        limit = 0
+    if limit < 1:
+        return jsonify({"error": "'limit' must be a positive integer"}), 400
+    limit = min(limit, 1000)
+
+    page = get_change_log().read(campaign_id, since, log_id=request.args.get('log'), limit=limit)
+    if page is None:
+        return jsonify({"error": "Campaign not found"}), 404
+    return jsonify(page)
+
+@changes_bp.route('/<campaign_id>/changes/stream', methods=['GET'])
+def stream_changes(campaign_id):
+    """Versión en vivo de /changes (Server-Sent Events).
+
+    Cada cambio es un evento 'change' con id = seq. Si el log no es el del
+    cliente se envía 'reset' y se cierra; si la campaña se borra, 'gone'.
+    """
+    since = _since()
+    if since is None:
+        return jsonify({"error": "since must be an integer"}), 400
+    log_id = request.args.get('log')
+    change_log = get_change_log()
+    # El stat del log se toma antes de leer: lo escrito entre medias no se pierde
+    stamp = change_log.stamp(campaign_id)
+    first = change_log.read(campaign_id, since, log_id=log_id)
+    if first is None:
+        return jsonify({"error": "Campaign not found"}), 404
+
+    def generate(page=first, stamp=stamp):
+        deadline = time.monotonic() + STREAM_MAX_SECONDS
+        last_sent = time.monotonic()
+        while True:
+            if page is None:
+                yield sse_event({}, event="gone")
+                return
+            if page['reset']:
+                yield sse_event({"log": page['log'], "last_seq": page['last_seq']}, event="reset")
+                return
+            for change in page['changes']:
+                yield sse_event(change, event="change", event_id=change['seq'])
+                last_sent = time.monotonic()
+
+            if not page['more']:
+                # Sin cambios pendientes: se espera a una escritura (de este
+                # proceso, o de otro según el stat del log)
+                while change_log.stamp(campaign_id) == stamp:
+                    now = time.monotonic()
+                    if now >= deadline:
+                        return
+                    if now - last_sent >= KEEPALIVE_SECONDS:
+                        yield ": keepalive\n\n"
+                        last_sent = now
+                    change_log.wait(STREAM_POLL_SECONDS)
+            stamp = change_log.stamp(campaign_id)
+            page = change_log.read(campaign_id, page['last_seq'], log_id=page['log'])
+
+    return Response(stream_with_context(generate()), mimetype='text/event-stream', headers={
+        "Cache-Control": "no-cache",
+        "X-Accel-Buffering": "no",
+    })
@@ -0,0 +1,177 @@
+import gzip
+
+from flask import request, jsonify, current_app
+from flask.json.provider import DefaultJSONProvider
+
+from services import serializer
+
+try:
+    import brotli
+except ImportError:  # Opcional: sin él solo se comprime con gzip
+    brotli = None
+
+# Las respuestas se guardan en el cliente pero se revalidan siempre (If-None-Match)
+CACHE_CONTROL = 'private, no-cache'
+
+# Por debajo de esto comprimir cuesta más de lo que ahorra
+COMPRESS_MIN_BYTES = 1024
+GZIP_LEVEL = 5
+BROTLI_QUALITY = 4
+
+# La ETag de una respuesta comprimida lleva la codificación: cada representación
+# tiene la suya, pero al comparar se ignora
+ENCODING_SUFFIXES = ('-gzip', '-br')
+
+
+class FastJSONProvider(DefaultJSONProvider):
+    """jsonify y request.get_json con services.serializer (orjson si está instalado).
+
+    Sin ordenar claves (salen en el orden del documento) y en UTF-8 sin
+    escapes. Fechas, UUIDs y dataclasses se convierten como en Flask.
+    """
+
+    ensure_ascii = False
+    sort_keys = False
+
+    def dumps(self, obj, **kwargs):
+        if kwargs.keys() - {'indent', 'separators'}:
+            return super().dumps(obj, **kwargs)
+        return serializer.dumps(obj, pretty='indent' in kwargs, default=self.default).decode('utf-8')
+
+    def loads(self, s, **kwargs):
+        if kwargs:
+            return super().loads(s, **kwargs)
+        return serializer.loads(s)
+
+    def response(self, *args, **kwargs):
+        obj = self._prepare_response_obj(args, kwargs)
+        pretty = self.compact is False or (self.compact is None and self._app.debug)
+        body = serializer.dumps(obj, pretty=pretty, default=self.default) + b"\n"
+        return self._app.response_class(body, mimetype=self.mimetype)
+
+
+def _opaque_tag(value):
+    value = value.strip()
+    if value.startswith('W/'):
+        value = value[2:]
+    value = value.strip('"')
+    for suffix in ENCODING_SUFFIXES:
+        if value.endswith(suffix):
+            return value[:-len(suffix)]
+    return value
+
+
+def expected_version():
+    """Versión que el cliente dice tener, según la cabecera If-Match.
+
+    None si no la envía (se acepta la escritura sin comprobar). El campo
+    'version' del body se ignora a propósito: el frontend reenvía objetos
+    completos con la versión con la que los cargó.
+    """
+    header = request.headers.get('If-Match')
+    if header and header.strip() != '*':
+        # "3" o "3.<firma>" (ver version_etag): cuenta solo la versión
+        value = _opaque_tag(header).split('.', 1)[0]
+        if value.isdigit():
+            return int(value)
+    return None
+
+
+def version_etag(doc, stamp=None):
+    """ETag de un documento: su versión y, si se conoce, la firma del almacenamiento.
+
+    Con solo la versión, una edición a mano (o un documento antiguo sin
+    'version') daría un 304 con el contenido viejo. 'stamp' debe leerse
+    antes que el documento: si cambia entre medias, la ETag queda vieja y
+    el cliente recibe un 200, nunca un 304 falso.
+    """
+    version = doc.get("version", 0)
+    return f'"{version}.{stamp}"' if stamp else f'"{version}"'
+
+
+def collection_etag(service, campaign_id, collection):
+    """ETag de un listado a partir de la revisión de la colección (None si no hay).
+
+    Se calcula antes de leer el listado: si algo se escribe entre medias, la
+    ETag queda vieja y la próxima petición recibe un 200, nunca un 304 falso.
+    """
+    revision = service.collection_revision(campaign_id, collection)
+    return f'"{collection}.{revision}"' if revision else None
+
+
+def not_modified(etag):
+    """304 si el If-None-Match del cliente incluye 'etag'; None si hay que responder entero."""
+    header = request.headers.get('If-None-Match')
+    if not etag or not header:
+        return None
+    tags = {_opaque_tag(tag) for tag in header.split(',')}
+    if '*' not in tags and _opaque_tag(etag) not in tags:
+        return None
+    response = current_app.response_class(status=304)
+    response.headers['ETag'] = etag
+    response.headers['Cache-Control'] = CACHE_CONTROL
+    return response
+
+
+def cached_response(data, etag, headers=None):
+    """jsonify(data) con ETag y Cache-Control, para los GET revalidables."""
+    response = jsonify(data)
+    if headers:
+        response.headers.update(headers)
+    if etag:
+        response.headers['ETag'] = etag
+        response.headers['Cache-Control'] = CACHE_CONTROL
+    return response
+
+
+def document_response(doc, status=200, stamp=None):
+    """jsonify(doc) con su ETag (ver version_etag)."""
+    response = cached_response(doc, version_etag(doc, stamp))
+    response.status_code = status
+    return response
+
+
+def conflict_response(error):
+    """412 con el documento actual, para que el cliente pueda reconciliar."""
+    response = jsonify({"error": "Version conflict", "current": error.current})
+    response.status_code = 412
+    response.headers['ETag'] = version_etag(error.current)
+    return response
+
+
+def sse_event(data, event=None, event_id=None):
+    payload = serializer.dumps(data).decode('utf-8')
+    head = f"id: {event_id}\n" if event_id is not None else ""
+    if event:
+        head += f"event: {event}\n"
+    return f"{head}data: {payload}\n\n"
+
+
+def _choose_encoding():
+    offered = ['br', 'gzip'] if brotli is not None else ['gzip']
+    return request.accept_encodings.best_match(offered)
+
+
+def compress_response(response):
+    """after_request: comprime con br o gzip los JSON grandes si el cliente lo acepta."""
+    response.vary.add('Accept-Encoding')
+    if (response.status_code != 200 or response.direct_passthrough or response.is_streamed
+            or response.mimetype != 'application/json' or 'Content-Encoding' in response.headers):
+        return response
+    data = response.get_data()
+    if len(data) < COMPRESS_MIN_BYTES:
+        return response
+    encoding = _choose_encoding()
+    if encoding == 'br':
+        body = brotli.compress(data, quality=BROTLI_QUALITY)
+    elif encoding == 'gzip':
+        body = gzip.compress(data, compresslevel=GZIP_LEVEL, mtime=0)
+    else:
+        return response
+
+    response.set_data(body)
+    response.headers['Content-Encoding'] = encoding
+    etag = response.headers.get('ETag')
+    if etag and etag.endswith('"'):
+        response.headers['ETag'] = f'{etag[:-1]}-{encoding}"'
+    return response
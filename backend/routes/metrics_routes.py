@@ -0,0 +1,155 @@
+from flask import Blueprint, Response, request, current_app, g
+import cProfile
+import os
+import random
+import re
+import time
+
+from services.metrics import METRICS, begin_request, end_request
+
+try:
+    import pyinstrument
+except ImportError:  # Opcional: sin él los perfiles son de cProfile (.prof, para snakeviz/pstats)
+    pyinstrument = None
+
+# Perfiles que se conservan en PROFILE_DIR (los más antiguos se borran)
+PROFILE_MAX_FILES = 200
+
+metrics_bp = Blueprint('metrics', __name__)
+
+
+def _route_label():
+    return request.url_rule.rule if request.url_rule else "unmatched"
+
+
+def _start_profiler():
+    if current_app.config.get('PROFILER') == 'pyinstrument' and pyinstrument is not None:
+        profiler = pyinstrument.Profiler()
+        profiler.start()
+        return profiler
+    profiler = cProfile.Profile()
+    try:
+        profiler.enable()
+    except ValueError:
+        # Otro perfilador activo en el proceso (Python 3.12+): este request no se perfila
+        return None
+    return profiler
+
+
+def _stop_profiler(profiler):
+    if pyinstrument is not None and isinstance(profiler, pyinstrument.Profiler):
+        profiler.stop()
+    else:
+        profiler.disable()
+
+
+def _dump_profile(profiler, elapsed_ms):
+    directory = current_app.config.get('PROFILE_DIR') or os.path.join(current_app.config['DATA_STORAGE_PATH'], "_profiles")
+    os.makedirs(directory, exist_ok=True)
+    route = re.sub(r'[^A-Za-z0-9]+', '_', _route_label()).strip('_') or "root"
+    stem = f"{time.strftime('%Y%m%dT%H%M%S')}_{os.getpid()}_{request.method}_{route}_{elapsed_ms:.0f}ms"
+    if pyinstrument is not None and isinstance(profiler, pyinstrument.Profiler):
+        path = os.path.join(directory, f"{stem}.html")
+        with open(path, 'w', encoding='utf-8') as f:
+            f.write(profiler.output_html())
+    else:
+        path = os.path.join(directory, f"{stem}.prof")
+        profiler.dump_stats(path)
+
+    profiles = sorted(os.listdir(directory))
+    for name in profiles[:max(0, len(profiles) - PROFILE_MAX_FILES)]:
+        try:
+            os.remove(os.path.join(directory, name))
+        except FileNotFoundError:
+            pass
+    current_app.logger.info("slow request %s %s (%.0f ms): profile in %s", request.method, request.path, elapsed_ms, path)
+
+
+def start_request_metrics():
+    """before_request: empieza la medida del request y, si toca por muestreo, el perfil."""
+    g.request_metrics, g.request_metrics_token = begin_request()
+    g.profiler = None
+    if current_app.config.get('PROFILE_SLOW_MS', 0) > 0 and random.random() < current_app.config.get('PROFILE_SAMPLE_RATE', 1.0):
+        g.profiler = _start_profiler()
+
+
+def add_server_timing(response):
+    """after_request: desglose del request en Server-Timing (spans y E/S)."""
+    request_metrics = g.get('request_metrics')
+    if request_metrics is None:
+        return response
+    parts = [response.headers['Server-Timing']] if 'Server-Timing' in response.headers else []
+    for name, (seconds, _) in sorted(request_metrics.spans.items(), key=lambda kv: -kv[1][0]):
+        parts.append(f"{name};dur={seconds * 1000:.2f}")
+    counts = request_metrics.counts
+    if counts:
+        parts.append('io;desc="' + " ".join(f"{k}={v}" for k, v in sorted(counts.items())) + '"')
+    parts.append(f"app;dur={request_metrics.elapsed() * 1000:.2f}")
+    response.headers['Server-Timing'] = ", ".join(parts)
+    return response
+
+
+def finish_request_metrics(error=None):
+    """teardown_request: registra latencia y E/S; guarda el perfil si fue lento."""
+    request_metrics = g.pop('request_metrics', None)
+    if request_metrics is None:
+        return
+    end_request(g.pop('request_metrics_token'))
+    elapsed = request_metrics.elapsed()
+    route = _route_label()
+    status = "500" if error is not None else str(g.pop('response_status', 200))
+    METRICS.inc("http_requests_total", labels=(request.method, route, status))
+    METRICS.observe("http_request_duration_seconds", elapsed, (request.method, route))
+    METRICS.observe("app_request_files_read", request_metrics.counts.get("files_read", 0), (route,))
+    METRICS.observe("app_request_bytes_parsed", request_metrics.counts.get("bytes_parsed", 0), (route,))
+
+    profiler = g.pop('profiler', None)
+    if profiler is not None:
+        _stop_profiler(profiler)
+        threshold = current_app.config.get('PROFILE_SLOW_MS', 0)
+        if elapsed * 1000 >= threshold:
+            _dump_profile(profiler, elapsed * 1000)
+
+
+def remember_status(response):
+    # teardown_request no recibe la respuesta: el status se guarda aquí
+    g.response_status = response.status_code
+    return response
+
+
+def init_request_metrics(app):
+    app.before_request(start_request_metrics)
+    app.after_request(add_server_timing)
+    app.after_request(remember_status)
+    app.teardown_request(finish_request_metrics)
+
+
+def _service_gauges():
+    """Métricas de las cachés y colas del proceso, leídas en el momento del scrape."""
+    extensions = current_app.extensions
+    gauges = []
+    file_cache = extensions['file_service'].cache_stats()
+    if 'hits' in file_cache:
+        gauges.append(("app_file_cache_hits_total", "counter", "Document cache hits.", [({}, file_cache['hits'])]))
+        gauges.append(("app_file_cache_misses_total", "counter", "Document cache misses.", [({}, file_cache['misses'])]))
+        gauges.append(("app_file_cache_bytes", "gauge", "Bytes held by the document cache.", [({}, file_cache['bytes'])]))
+    if 'response_cache' in extensions:
+        stats = extensions['response_cache'].stats()
+        gauges.append(("app_ai_response_cache_requests_total", "counter", "Chat response cache lookups by result.", [
+            ({"result": result}, stats[result]) for result in ("hits", "misses", "coalesced", "bypassed")
+        ]))
+        gauges.append(("app_ai_response_cache_entries", "gauge", "Cached chat responses.", [({}, stats['entries'])]))
+    prompt_stats = extensions['prompt_context'].stats()
+    gauges.append(("app_prompt_context_cache_requests_total", "counter", "Prompt context cache lookups by result.", [
+        ({"result": "hits"}, prompt_stats['hits']), ({"result": "misses"}, prompt_stats['misses'])
+    ]))
+    if 'summary_queue' in extensions:
+        gauges.append(("app_summary_queue_pending", "gauge", "Summary jobs waiting on disk.", [({}, extensions['summary_queue'].pending())]))
+    return gauges
+
+
+@metrics_bp.route('/metrics', methods=['GET'])
+def metrics():
+    """Métricas de este worker en formato de texto de Prometheus."""
+    body = METRICS.render(extra=(("pid", os.getpid()),), gauges=_service_gauges())
+    return Response(body, content_type="text/plain; version=0.0.4; charset=utf-8")
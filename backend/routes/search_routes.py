@@ -0,0 +1,28 @@
+from flask import Blueprint, request, jsonify, current_app
+
+search_bp = Blueprint('search', __name__)
+
+def get_search_service():
+    return current_app.extensions['search_service']
+
+@search_bp.route('/<campaign_id>/search', methods=['GET'])
+def search_campaign(campaign_id):
+    query = request.args.get('q', '').strip()
+    if not query:
+        return jsonify({"error": "Query 'q' is required"}), 400
+
+    try:
+        limit = int(request.args.get('limit', 20))
+    except ValueError:
+        limit = 0
+    if limit < 1:
+        return jsonify({"error": "'limit' must be a positive integer"}), 400
+    limit = min(limit, 100)
+    # kind=vault | sessions (por defecto ambos)
+    kinds = [k for k in request.args.get('kind', '').split(',') if k] or None
+
+    results = get_search_service().search(campaign_id, query, limit=limit, kinds=kinds)
+    if results is None:
+        return jsonify({"error": "Campaign not found"}), 404
+
+    return jsonify(results)
@@ -1,32 +1,46 @@
 from flask import Blueprint, request, jsonify, current_app
-from services.file_service import FileService
 from services.id_service import generate_id
+from services.vault_service import apply_bulk
+from services.file_service import VersionConflict
+from services.storage_engine import LISTING_FIELDS
+from routes.http_utils import (
+    expected_version, document_response, conflict_response,
+    collection_etag, not_modified, cached_response, version_etag,
+)
 import os
 from datetime import datetime
 
 session_bp = Blueprint('sessions', __name__)
 
 def get_file_service():
-    storage_path = current_app.config['DATA_STORAGE_PATH']
-    return FileService(storage_path)
+    # Instancia única registrada en app.py (comparte caché e índices)
+    return current_app.extensions['file_service']
+
+def get_session_timeline(campaign_id):
+    return current_app.extensions['session_timeline'].get(campaign_id)
 
 @session_bp.route('/<campaign_id>/sessions', methods=['GET'])
 def list_sessions(campaign_id):
+    """Sesiones ordenadas por número.
+
+    fields (separados por comas; 'id' siempre incluido) proyecta cada
+    sesión. Si todos son campos de listado se responde solo con el
+    manifiesto, sin abrir las sesiones; sin fields, documentos completos.
+    """
     service = get_file_service()
-    campaign_path = service._get_campaign_path(campaign_id)
-    sessions_path = os.path.join(campaign_path, "sessions")
-    
-    sessions = []
-    if os.path.exists(sessions_path):
-        for filename in os.listdir(sessions_path):
-            if filename.endswith(".json"):
-                session = service.load_json(os.path.join(sessions_path, filename))
-                if session:
-                    sessions.append(session)
-    
-    # Sort by number
-    sessions.sort(key=lambda x: x.get('number', 0))
-    return jsonify(sessions)
+    etag = collection_etag(service, campaign_id, "sessions")
+    cached = not_modified(etag)
+    if cached:
+        return cached
+    sessions = sorted(service.read_manifest(campaign_id, "sessions").values(), key=lambda x: x.get('number', 0))
+
+    fields = [f.strip() for f in request.args.get('fields', '').split(',') if f.strip()]
+    if not fields or not set(fields) <= set(LISTING_FIELDS["sessions"]):
+        docs = service.load_records(campaign_id, "sessions", [s['id'] for s in sessions])
+        sessions = [docs[s['id']] for s in sessions if s['id'] in docs]
+    if fields:
+        sessions = [{k: s[k] for k in ['id'] + fields if k in s} for s in sessions]
+    return cached_response(sessions, etag)
 
 @session_bp.route('/<campaign_id>/sessions', methods=['POST'])
 def create_session(campaign_id):
@@ -37,17 +51,9 @@ def create_session(campaign_id):
     # Data opcional
     req_data = request.get_json() or {}
     
-    # Calculate next number
-    existing_sessions = []
-    if os.path.exists(sessions_path):
-        for filename in os.listdir(sessions_path):
-            if filename.endswith(".json"):
-                s = service.load_json(os.path.join(sessions_path, filename))
-                if s: existing_sessions.append(s)
-    
-    next_number = 1
-    if existing_sessions:
-        next_number = max([s.get('number', 0) for s in existing_sessions]) + 1
+    # Calculate next number (del manifiesto: no hace falta leer las sesiones)
+    numbers = [r.get('number') for r in service.read_manifest(campaign_id, "sessions").values()]
+    next_number = max((n for n in numbers if isinstance(n, int)), default=0) + 1
         
     session_id = generate_id()
     session = {
@@ -62,106 +68,101 @@ def create_session(campaign_id):
         "linked_items": [],
         "status": "planned",
         "fronts_snapshot": [],
-        "used_items": [] # CAMPO NUEVO
+        "used_items": [], # CAMPO NUEVO
+        "version": 1
     }
     
     file_path = os.path.join(sessions_path, f"session_{next_number:02d}_{session_id}.json")
     service.save_json(file_path, session)
+    service.on_saved(campaign_id, "sessions", session)
     
-    return jsonify(session), 201
+    return document_response(session, 201)
+
+@session_bp.route('/<campaign_id>/sessions/timeline', methods=['GET'])
+def session_timeline(campaign_id):
+    """Sesiones ordenadas con número, título, estado, fecha y resumen, y el próximo número.
+
+    ?status=completed para la Bitácora.
+    """
+    service = get_file_service()
+    if not service.campaign_exists(campaign_id):
+        return jsonify({"error": "Campaign not found"}), 404
+    etag = collection_etag(service, campaign_id, "sessions")
+    cached = not_modified(etag)
+    if cached:
+        return cached
+    status = request.args.get('status') or None
+    return cached_response(get_session_timeline(campaign_id).to_dict(status), etag)
 
 @session_bp.route('/<campaign_id>/sessions/<session_id>', methods=['GET'])
 def get_session(campaign_id, session_id):
     service = get_file_service()
-    campaign_path = service._get_campaign_path(campaign_id)
-    sessions_path = os.path.join(campaign_path, "sessions")
-    
-    target_file = None
-    for filename in os.listdir(sessions_path):
-        if filename.endswith(f"_{session_id}.json"):
-            target_file = filename
-            break
-            
-    if not target_file:
+    file_path = service.find_file(campaign_id, "sessions", session_id)
+    if not file_path:
         return jsonify({"error": "Session not found"}), 404
         
-    session = service.load_json(os.path.join(sessions_path, target_file))
-    return jsonify(session)
+    stamp = service.document_stamp(file_path)
+    session = service.load_json(file_path, readonly=True)
+    if not session:
+        return jsonify({"error": "Session not found"}), 404
+    return not_modified(version_etag(session, stamp)) or document_response(session, stamp=stamp)
 
 @session_bp.route('/<campaign_id>/sessions/<session_id>', methods=['PUT'])
 def update_session(campaign_id, session_id):
     data = request.get_json()
     service = get_file_service()
     campaign_path = service._get_campaign_path(campaign_id)
-    sessions_path = os.path.join(campaign_path, "sessions")
-    
-    target_file = None
-    for filename in os.listdir(sessions_path):
-        if filename.endswith(f"_{session_id}.json"):
-            target_file = filename
-            break
-            
-    if not target_file:
+    file_path = service.find_file(campaign_id, "sessions", session_id)
+    if not file_path:
         return jsonify({"error": "Session not found"}), 404
         
-    file_path = os.path.join(sessions_path, target_file)
-    current_session = service.load_json(file_path)
-    
-    # Lógica de Snapshot: Si se marca como completada, guardar estado de frentes
-    if data.get('status') == 'completed' and current_session.get('status') != 'completed':
-        try:
-            metadata_path = os.path.join(campaign_path, "metadata.json")
-            metadata = service.load_json(metadata_path)
-            if metadata and 'fronts' in metadata:
-                current_session['fronts_snapshot'] = metadata['fronts']
-        except Exception as e:
-            print(f"Error saving fronts snapshot: {e}")
-
-    # Update fields (INCLUIDO 'used_items')
-    fields = ['title', 'strong_start', 'recap', 'summary', 'notes', 'linked_items', 'status', 'used_items']
-    for field in fields:
-        if field in data:
-            current_session[field] = data[field]
-            
-    service.save_json(file_path, current_session)
-    return jsonify(current_session)
+    def apply(current_session):
+        # Lógica de Snapshot: Si se marca como completada, guardar estado de frentes
+        if data.get('status') == 'completed' and current_session.get('status') != 'completed':
+            try:
+                metadata_path = os.path.join(campaign_path, "metadata.json")
+                metadata = service.load_json(metadata_path)
+                if metadata and 'fronts' in metadata:
+                    current_session['fronts_snapshot'] = metadata['fronts']
+            except Exception:
+                current_app.logger.exception("fronts snapshot for session %s could not be saved", session_id)
+
+        # Update fields (INCLUIDO 'used_items')
+        fields = ['title', 'strong_start', 'recap', 'summary', 'notes', 'linked_items', 'status', 'used_items']
+        for field in fields:
+            if field in data:
+                current_session[field] = data[field]
+
+    try:
+        current_session = service.update_json(file_path, apply, expected_version=expected_version())
+    except VersionConflict as e:
+        return conflict_response(e)
+    if current_session is None:
+        return jsonify({"error": "Session not found"}), 404
+
+    service.on_saved(campaign_id, "sessions", current_session)
+    return document_response(current_session)
 
 @session_bp.route('/<campaign_id>/sessions/<session_id>', methods=['DELETE'])
 def delete_session(campaign_id, session_id):
     service = get_file_service()
-    campaign_path = service._get_campaign_path(campaign_id)
-    sessions_path = os.path.join(campaign_path, "sessions")
-    vault_path = os.path.join(campaign_path, "vault")
-    
-    target_file = None
-    for filename in os.listdir(sessions_path):
-        if filename.endswith(f"_{session_id}.json"):
-            target_file = filename
-            break
-            
-    if not target_file:
+    session_path = service.find_file(campaign_id, "sessions", session_id)
+    if not session_path:
         return jsonify({"error": "Session not found"}), 404
 
-    session_path = os.path.join(sessions_path, target_file)
-    session_data = service.load_json(session_path)
+    session_data = service.load_json(session_path, readonly=True)
     
-    # Restaurar items al Vault si la sesión se borra
-    if session_data and 'linked_items' in session_data:
-        for item_id in session_data['linked_items']:
-            item_file_name = None
-            if os.path.exists(vault_path):
-                for v_file in os.listdir(vault_path):
-                    if v_file.endswith(f"_{item_id}.json"):
-                        item_file_name = v_file
-                        break
-            
-            if item_file_name:
-                item_path = os.path.join(vault_path, item_file_name)
-                item_data = service.load_json(item_path)
-                if item_data:
-                    item_data['status'] = 'reserve'
-                    service.save_json(item_path, item_data)
-
-    os.remove(session_path)
+    # Restaurar items al Vault si la sesión se borra (un solo lote)
+    restored = []
+    if session_data and session_data.get('linked_items'):
+        restored = apply_bulk(service, campaign_id, [
+            {"op": "status", "ids": session_data['linked_items'], "status": "reserve"}
+        ])
+
+    service.trash_file(session_path)
+    service.on_deleted(campaign_id, "sessions", session_id)
     
-    return jsonify({"message": "Session deleted and items returned to vault"}), 200
\ No newline at end of file
+    return jsonify({
+        "message": "Session deleted and items returned to vault",
+        "restored": [{"id": r['id'], "status": r['status']} for r in restored]
+    }), 200
\ No newline at end of file
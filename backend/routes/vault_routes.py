@@ -1,105 +1,221 @@
 from flask import Blueprint, request, jsonify, current_app
-from services.file_service import FileService
-from services.id_service import generate_id
+from services.file_service import VersionConflict
+from services.storage_engine import LISTING_FIELDS
+from services.vault_service import new_vault_item, vault_item_path, apply_bulk, usage_count, valid_type, MAX_BULK_OPERATIONS
+from routes.http_utils import (
+    expected_version, document_response, conflict_response,
+    collection_etag, not_modified, cached_response,
+)
 import os
+import json
+import base64
 
 vault_bp = Blueprint('vault', __name__)
 
 def get_file_service():
-    storage_path = current_app.config['DATA_STORAGE_PATH']
-    return FileService(storage_path)
+    # Instancia única registrada en app.py (comparte caché e índices)
+    return current_app.extensions['file_service']
+
+def _split_param(name):
+    value = request.args.get(name, '')
+    return [v.strip() for v in value.split(',') if v.strip()]
+
+def _positive_int_param(name):
+    """Entero >= 1 del query string, None si falta; ValueError si no es válido."""
+    value = request.args.get(name)
+    if value is None:
+        return None
+    number = int(value)
+    if number < 1:
+        raise ValueError(name)
+    return number
+
+def _item_name(record):
+    # 'name' del registro de listado: content.name o content.title
+    return record.get('name', '').casefold()
+
+# Claves siempre del mismo tipo (número o texto), aunque un item editado a
+# mano traiga otra cosa: si no, ordenar o comparar con el cursor da TypeError
+SORT_KEYS = {
+    'usage_count': usage_count,
+    'name': _item_name,
+}
+
+def _valid_sort_key(sort_field, key):
+    if sort_field == 'usage_count':
+        return isinstance(key, (int, float)) and not isinstance(key, bool)
+    return isinstance(key, str)
+
+def _encode_cursor(sort, key, item_id):
+    raw = json.dumps([sort, key, item_id], ensure_ascii=False).encode('utf-8')
+    return base64.urlsafe_b64encode(raw).decode('ascii')
+
+def _decode_cursor(cursor):
+    """(sort, clave, id) del cursor, o None si no es un cursor válido."""
+    try:
+        sort, key, item_id = json.loads(base64.urlsafe_b64decode(cursor.encode('ascii')))
+    except (ValueError, TypeError):
+        return None
+    if not isinstance(sort, str) or not isinstance(item_id, str) or not _valid_sort_key(sort.lstrip('-'), key):
+        return None
+    return sort, key, item_id
 
 @vault_bp.route('/<campaign_id>/vault', methods=['GET'])
 def list_vault_items(campaign_id):
+    """Lista el Vault con filtros opcionales en query string.
+
+    type, status, tags (separados por comas; tags exige todos), name
+    (prefijo del nombre/título), fields (proyección; 'id' siempre incluido),
+    sort (usage_count, -usage_count, name, -name), limit y cursor.
+    Sin parámetros devuelve todos los items, como siempre. Con limit, el
+    cursor de la página siguiente va en la cabecera X-Next-Cursor.
+    """
     service = get_file_service()
-    campaign_path = service._get_campaign_path(campaign_id)
-    vault_path = os.path.join(campaign_path, "vault")
-    
-    items = []
-    if os.path.exists(vault_path):
-        for filename in os.listdir(vault_path):
-            if filename.endswith(".json"):
-                item = service.load_json(os.path.join(vault_path, filename))
-                if item:
-                    # Asegurar que usage_count existe para items antiguos
-                    if 'usage_count' not in item:
-                        item['usage_count'] = 0
-                    items.append(item)
-    
-    return jsonify(items)
+    # Misma ETag para cualquier filtro: todos salen de la misma revisión del vault
+    etag = collection_etag(service, campaign_id, "vault")
+    cached = not_modified(etag)
+    if cached:
+        return cached
+    # Filtros y orden sobre los registros de listado (vault/_index.json), sin
+    # abrir cada item; solo se cargan los documentos de la página devuelta.
+    # El manifiesto ya garantiza 'usage_count' para items antiguos.
+    manifest = service.read_manifest(campaign_id, "vault")
+
+    types = _split_param('type')
+    if types:
+        # El tipo va en el nombre del archivo ({type}_{uuid}.json): se filtra sin abrir nada
+        ids = []
+        for item_type in types:
+            ids.extend(service.list_ids(campaign_id, "vault", filename_prefix=f"{item_type}_"))
+        items = [manifest[i] for i in ids if i in manifest and manifest[i].get('type') in types]
+    else:
+        items = list(manifest.values())
+
+    statuses = _split_param('status')
+    if statuses:
+        items = [i for i in items if i.get('status') in statuses]
+
+    tags = _split_param('tags')
+    if tags:
+        items = [i for i in items if set(tags).issubset(i.get('tags') or [])]
+
+    name_prefix = request.args.get('name', '').strip().casefold()
+    if name_prefix:
+        items = [i for i in items if _item_name(i).startswith(name_prefix)]
+
+    sort = request.args.get('sort', '')
+    try:
+        limit = _positive_int_param('limit')
+    except ValueError:
+        return jsonify({"error": "'limit' must be a positive integer"}), 400
+    cursor = request.args.get('cursor')
+    sort_field = sort.lstrip('-')
+    if sort and sort_field not in SORT_KEYS:
+        return jsonify({"error": f"Invalid sort: {sort}"}), 400
+
+    headers = {"X-Total-Count": str(len(items))}
+    if sort or limit or cursor:
+        # Orden estable (clave, id) para que el cursor no salte ni repita items
+        key_fn = SORT_KEYS.get(sort_field, lambda item: '')
+        descending = sort.startswith('-')
+        items.sort(key=lambda i: (key_fn(i), i['id']), reverse=descending)
+
+        if cursor:
+            decoded = _decode_cursor(cursor)
+            if decoded is None:
+                return jsonify({"error": "Invalid cursor"}), 400
+            if decoded[0] != sort:
+                # El cursor solo vale para el orden con el que se generó
+                return jsonify({"error": "Cursor does not match sort"}), 400
+            after = decoded[1:]
+            if descending:
+                items = [i for i in items if (key_fn(i), i['id']) < after]
+            else:
+                items = [i for i in items if (key_fn(i), i['id']) > after]
+
+        if limit is not None and len(items) > limit:
+            items = items[:limit]
+            last = items[-1]
+            headers["X-Next-Cursor"] = _encode_cursor(sort, key_fn(last), last['id'])
+
+    fields = _split_param('fields')
+    if not fields or not set(fields) <= set(LISTING_FIELDS["vault"]):
+        docs = service.load_records(campaign_id, "vault", [i['id'] for i in items])
+        items = [docs[i['id']] for i in items if i['id'] in docs]
+    if fields:
+        items = [{k: i[k] for k in ['id'] + fields if k in i} for i in items]
+
+    return cached_response(items, etag, headers)
 
 @vault_bp.route('/<campaign_id>/vault', methods=['POST'])
 def create_vault_item(campaign_id):
     data = request.get_json()
     if not data or 'type' not in data:
         return jsonify({"error": "Type is required"}), 400
+    if not valid_type(data['type']):
+        return jsonify({"error": "Type must contain only letters, digits, '_' or '-'"}), 400
 
     service = get_file_service()
-    item_id = generate_id()
-    item_type = data['type']
-    
-    item = {
-        "id": item_id,
-        "type": item_type,
-        "status": "reserve",
-        "usage_count": 0, # Nuevo campo para seguimiento
-        "tags": data.get('tags', []),
-        "content": data.get('content', {})
-    }
-    
-    campaign_path = service._get_campaign_path(campaign_id)
-    file_path = os.path.join(campaign_path, "vault", f"{item_type}_{item_id}.json")
-    
-    service.save_json(file_path, item)
+    item = new_vault_item(data)
+    service.save_json(vault_item_path(service, campaign_id, item), item)
+    service.on_saved(campaign_id, "vault", item)
     
-    return jsonify(item), 201
+    return document_response(item, 201)
+
+@vault_bp.route('/<campaign_id>/vault/_bulk', methods=['POST'])
+def bulk_vault_items(campaign_id):
+    """Lote de create/update/status/delete en una sola petición.
+
+    Body: {"operations": [{"op": "status", "ids": [...], "status": "active"}, ...]}
+    Responde con un resultado por operación (status HTTP, item o error).
+    """
+    data = request.get_json(silent=True) or {}
+    operations = data.get('operations')
+    if not isinstance(operations, list):
+        return jsonify({"error": "operations list is required"}), 400
+    if len(operations) > MAX_BULK_OPERATIONS:
+        return jsonify({"error": f"At most {MAX_BULK_OPERATIONS} operations per batch"}), 400
+
+    service = get_file_service()
+    if not service.campaign_exists(campaign_id):
+        return jsonify({"error": "Campaign not found"}), 404
+
+    results = apply_bulk(service, campaign_id, operations)
+    failed = sum(1 for r in results if r['status'] >= 400)
+    return jsonify({"results": results, "ok": len(results) - failed, "failed": failed})
 
 @vault_bp.route('/<campaign_id>/vault/<item_id>', methods=['PUT'])
 def update_vault_item(campaign_id, item_id):
     data = request.get_json()
     service = get_file_service()
-    campaign_path = service._get_campaign_path(campaign_id)
-    vault_path = os.path.join(campaign_path, "vault")
-    
-    target_file = None
-    for filename in os.listdir(vault_path):
-        if filename.endswith(f"_{item_id}.json"):
-            target_file = filename
-            break
-            
-    if not target_file:
+    file_path = service.find_file(campaign_id, "vault", item_id)
+    if not file_path:
         return jsonify({"error": "Item not found"}), 404
         
-    file_path = os.path.join(vault_path, target_file)
-    current_item = service.load_json(file_path)
-    
-    # Update fields
-    if 'status' in data:
-        current_item['status'] = data['status']
-    if 'tags' in data:
-        current_item['tags'] = data['tags']
-    if 'content' in data:
-        current_item['content'] = data['content']
-    if 'usage_count' in data:
-        current_item['usage_count'] = data['usage_count']
-        
-    service.save_json(file_path, current_item)
-    return jsonify(current_item)
+    def apply(current_item):
+        # Update fields
+        for field in ('status', 'tags', 'content', 'usage_count'):
+            if field in data:
+                current_item[field] = data[field]
+
+    try:
+        current_item = service.update_json(file_path, apply, expected_version=expected_version())
+    except VersionConflict as e:
+        return conflict_response(e)
+    if current_item is None:
+        return jsonify({"error": "Item not found"}), 404
+
+    service.on_saved(campaign_id, "vault", current_item)
+    return document_response(current_item)
 
 @vault_bp.route('/<campaign_id>/vault/<item_id>', methods=['DELETE'])
 def delete_vault_item(campaign_id, item_id):
     service = get_file_service()
-    campaign_path = service._get_campaign_path(campaign_id)
-    vault_path = os.path.join(campaign_path, "vault")
-    
-    target_file = None
-    for filename in os.listdir(vault_path):
-        if filename.endswith(f"_{item_id}.json"):
-            target_file = filename
-            break
+    file_path = service.find_file(campaign_id, "vault", item_id)
             
-    if target_file:
-        os.remove(os.path.join(vault_path, target_file))
+    if file_path:
+        service.trash_file(file_path)
+        service.on_deleted(campaign_id, "vault", item_id)
         return jsonify({"message": "Item deleted"})
         
     return jsonify({"error": "Item not found"}), 404
\ No newline at end of file
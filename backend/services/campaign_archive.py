@@ -0,0 +1,302 @@
+import os
+import re
+import tempfile
+import zipfile
+from datetime import datetime, timezone
+
+from services import serializer
+from services.id_service import generate_id, is_valid_id
+from services.storage_engine import TRASH_DIRNAME
+
+ARCHIVE_FORMAT = 1
+ARCHIVE_INFO = "archive.json"
+
+# Límites de importación (también frenan zip bombs)
+MAX_ARCHIVE_ENTRIES = 100_000
+MAX_DOCUMENT_BYTES = 16 * 1024 * 1024
+
+# Lote de IDs resueltos por consulta y de registros notificados por on_changed
+BATCH = 500
+
+_ENTRY_RE = re.compile(r"^(archive\.json|metadata\.json|(vault|sessions)/[^/\\]+\.json)$")
+_TYPE_RE = re.compile(r"^[\w-]+$")
+_TRASH_RE = re.compile(r"^campaign_(?P<id>[\w-]+)\.(?P<ts>\d{8}T\d{6}(?:\.\d+)?)\.zip$")
+
+
+class ArchiveError(ValueError):
+    """Archivo de campaña inválido: se responde 400 sin haber escrito nada."""
+
+
+class _ChunkBuffer:
+    """Destino de escritura para ZipFile: acumula bytes hasta que el generador los recoge.
+
+    No tiene seek/tell, así que zipfile escribe en modo streaming (data descriptors).
+    """
+
+    def __init__(self):
+        self._chunks = []
+
+    def write(self, data):
+        self._chunks.append(bytes(data))
+        return len(data)
+
+    def flush(self):
+        pass
+
+    def drain(self):
+        data = b"".join(self._chunks)
+        self._chunks.clear()
+        return data
+
+
+def _dump(doc):
+    return serializer.dumps(doc, pretty=True)
+
+
+def iter_campaign_documents(service, campaign_id):
+    """(nombre en el archivo, JSON en bytes) de metadata, vault y sesiones, uno a uno.
+
+    Los IDs se resuelven de BATCH en BATCH y cada documento se lee sin pasar
+    por la caché, así que solo el directorio central del zip crece con la campaña.
+    """
+    metadata = service.load_json(os.path.join(service._get_campaign_path(campaign_id), "metadata.json"), readonly=True)
+    if metadata is None:
+        return
+    counts = {c: len(service.list_ids(campaign_id, c)) for c in ("vault", "sessions")}
+    yield ARCHIVE_INFO, _dump({
+        "format": ARCHIVE_FORMAT,
+        "campaign_id": campaign_id,
+        "title": metadata.get('title'),
+        "exported_at": datetime.now(timezone.utc).isoformat(),
+        "counts": counts,
+    })
+    yield "metadata.json", _dump(metadata)
+
+    for collection in ("vault", "sessions"):
+        ids = sorted(service.list_ids(campaign_id, collection))
+        for start in range(0, len(ids), BATCH):
+            paths = service.find_files(campaign_id, collection, ids[start:start + BATCH])
+            for path in paths.values():
+                data = service.read_raw(path) if path else None
+                if data is not None:
+                    yield f"{collection}/{os.path.basename(path)}", data
+
+
+def stream_campaign_archive(service, campaign_id):
+    """Generador de bytes del zip de la campaña, sin construirlo en memoria."""
+    buffer = _ChunkBuffer()
+    with zipfile.ZipFile(buffer, 'w', compression=zipfile.ZIP_DEFLATED) as archive:
+        for name, data in iter_campaign_documents(service, campaign_id):
+            archive.writestr(name, data)
+            data = buffer.drain()
+            if data:
+                yield data
+    yield buffer.drain()
+
+
+def write_campaign_archive(service, campaign_id, path):
+    """Escribe el zip de la campaña en 'path' (temporal + rename)."""
+    fd, tmp_path = tempfile.mkstemp(dir=os.path.dirname(path), prefix=".tmp_", suffix=".zip")
+    try:
+        with os.fdopen(fd, 'wb') as f:
+            for chunk in stream_campaign_archive(service, campaign_id):
+                f.write(chunk)
+        os.replace(tmp_path, path)
+    except BaseException:
+        if os.path.exists(tmp_path):
+            os.remove(tmp_path)
+        raise
+
+
+# --- Importación ---
+
+def _read_entry(archive, info):
+    if info.file_size > MAX_DOCUMENT_BYTES:
+        raise ArchiveError(f"{info.filename}: document too large")
+    try:
+        with archive.open(info) as f:
+            doc = serializer.loads(f.read())
+    except (ValueError, UnicodeDecodeError, zipfile.BadZipFile):
+        raise ArchiveError(f"{info.filename}: invalid JSON")
+    if not isinstance(doc, dict):
+        raise ArchiveError(f"{info.filename}: expected a JSON object")
+    return doc
+
+
+def _validate(archive):
+    """Primera pasada: comprueba estructura y documentos y devuelve el plan.
+
+    Plan: (info de archivo, metadata, [(ZipInfo, colección, id original)]).
+    """
+    infos = archive.infolist()
+    if len(infos) > MAX_ARCHIVE_ENTRIES:
+        raise ArchiveError("Too many entries")
+    names = set()
+    for info in infos:
+        if info.is_dir():
+            continue
+        if not _ENTRY_RE.match(info.filename):
+            raise ArchiveError(f"Unexpected entry: {info.filename}")
+        if info.filename in names:
+            raise ArchiveError(f"Duplicate entry: {info.filename}")
+        names.add(info.filename)
+    if "metadata.json" not in names:
+        raise ArchiveError("metadata.json is missing")
+
+    info_doc = _read_entry(archive, archive.getinfo(ARCHIVE_INFO)) if ARCHIVE_INFO in names else {}
+    if info_doc.get('format', ARCHIVE_FORMAT) != ARCHIVE_FORMAT:
+        raise ArchiveError(f"Unsupported archive format: {info_doc.get('format')}")
+    metadata = _read_entry(archive, archive.getinfo("metadata.json"))
+    if not isinstance(metadata.get('title'), str):
+        raise ArchiveError("metadata.json: title is required")
+
+    entries = []
+    seen = set()
+    for info in infos:
+        collection = info.filename.split("/", 1)[0]
+        if collection not in ("vault", "sessions"):
+            continue
+        doc = _read_entry(archive, info)
+        doc_id = doc.get('id')
+        if not isinstance(doc_id, str) or not doc_id:
+            raise ArchiveError(f"{info.filename}: id is required")
+        if (collection, doc_id) in seen:
+            raise ArchiveError(f"{info.filename}: duplicate id {doc_id}")
+        seen.add((collection, doc_id))
+        if collection == "vault" and not (isinstance(doc.get('type'), str) and _TYPE_RE.match(doc['type'])):
+            raise ArchiveError(f"{info.filename}: invalid type")
+        if collection == "sessions" and not isinstance(doc.get('number'), int):
+            raise ArchiveError(f"{info.filename}: number is required")
+        entries.append((info, collection, doc_id))
+    return info_doc, metadata, entries
+
+
+def _remap_list(values, id_map):
+    if not isinstance(values, list):
+        return values
+    return [id_map.get(v, v) if isinstance(v, str) else v for v in values]
+
+
+def import_campaign_archive(service, fileobj, keep_ids=False):
+    """Crea una campaña a partir de un zip exportado. Devuelve (metadata, {'vault': n, 'sessions': m}).
+
+    Por defecto todo recibe IDs nuevos (campaña, items y sesiones) y las
+    referencias internas (active_session, linked_items, used_items) se
+    reescriben, así que importar dos veces da dos campañas independientes.
+    keep_ids=True conserva los IDs (restaurar desde la papelera).
+    """
+    try:
+        archive = zipfile.ZipFile(fileobj)
+    except zipfile.BadZipFile:
+        raise ArchiveError("Not a zip archive")
+
+    with archive:
+        info_doc, metadata, entries = _validate(archive)
+
+        if keep_ids:
+            campaign_id = metadata.get('id') or info_doc.get('campaign_id')
+            if not is_valid_id(campaign_id):
+                raise ArchiveError("metadata.json: id is required to keep IDs")
+            # Los IDs acaban en nombres de archivo: solo se conservan si son IDs generados
+            for info, _, doc_id in entries:
+                if not is_valid_id(doc_id):
+                    raise ArchiveError(f"{info.filename}: invalid id {doc_id!r}")
+            if service.campaign_exists(campaign_id):
+                raise ArchiveError(f"Campaign {campaign_id} already exists")
+            id_map = {}
+        else:
+            campaign_id = generate_id()
+            id_map = {doc_id: generate_id() for _, _, doc_id in entries}
+
+        base_path = service.create_campaign_structure(campaign_id)
+        counts = {"vault": 0, "sessions": 0}
+        try:
+            pending = {"vault": [], "sessions": []}
+            for info, collection, doc_id in entries:
+                doc = _read_entry(archive, info)
+                doc['id'] = id_map.get(doc_id, doc_id)
+                if collection == "vault":
+                    filename = f"{doc['type']}_{doc['id']}.json"
+                else:
+                    doc['linked_items'] = _remap_list(doc.get('linked_items', []), id_map)
+                    doc['used_items'] = _remap_list(doc.get('used_items', []), id_map)
+                    filename = f"session_{doc['number']:02d}_{doc['id']}.json"
+                service.save_json(os.path.join(base_path, collection, filename), doc)
+                counts[collection] += 1
+                pending[collection].append(doc)
+                if len(pending[collection]) >= BATCH:
+                    service.on_changed(campaign_id, collection, saved=pending[collection])
+                    pending[collection] = []
+            for collection, docs in pending.items():
+                service.on_changed(campaign_id, collection, saved=docs)
+
+            # La metadata va al final: la campaña no aparece en el listado a medias
+            metadata['id'] = campaign_id
+            if metadata.get('active_session'):
+                metadata['active_session'] = id_map.get(metadata['active_session'], metadata['active_session'])
+            service.save_json(os.path.join(base_path, "metadata.json"), metadata)
+            service.on_saved(campaign_id, "campaigns", metadata)
+        except BaseException:
+            service.delete_campaign(campaign_id)
+            raise
+    return metadata, counts
+
+
+# --- Papelera ---
+
+def _trash_dir(service):
+    return os.path.join(service.storage_path, TRASH_DIRNAME)
+
+
+def trash_campaign(service, campaign_id):
+    """Borrado suave: archiva la campaña en la papelera y después la elimina.
+
+    Devuelve el nombre del archivo en la papelera, o None si no existe.
+    """
+    if not service.campaign_exists(campaign_id):
+        return None
+    trash_dir = _trash_dir(service)
+    os.makedirs(trash_dir, exist_ok=True)
+    name = f"campaign_{campaign_id}.{datetime.now(timezone.utc).strftime('%Y%m%dT%H%M%S.%f')}.zip"
+    write_campaign_archive(service, campaign_id, os.path.join(trash_dir, name))
+    service.delete_campaign(campaign_id)
+    return name
+
+
+def list_trash(service):
+    trash_dir = _trash_dir(service)
+    if not os.path.isdir(trash_dir):
+        return []
+    entries = []
+    for name in sorted(os.listdir(trash_dir), reverse=True):
+        match = _TRASH_RE.match(name)
+        if not match:
+            continue
+        path = os.path.join(trash_dir, name)
+        title = None
+        try:
+            with zipfile.ZipFile(path) as archive:
+                title = serializer.loads(archive.read(ARCHIVE_INFO)).get('title')
+        except (zipfile.BadZipFile, KeyError, ValueError):
+            pass
+        entries.append({
+            "name": name,
+            "campaign_id": match.group('id'),
+            "title": title,
+            "deleted_at": datetime.strptime(match.group('ts').split('.')[0], '%Y%m%dT%H%M%S').replace(tzinfo=timezone.utc).isoformat(),
+            "bytes": os.path.getsize(path),
+        })
+    return entries
+
+
+def restore_from_trash(service, name):
+    """Restaura una campaña de la papelera con sus IDs originales. None si no existe."""
+    if not _TRASH_RE.match(name):
+        return None
+    path = os.path.join(_trash_dir(service), name)
+    if not os.path.exists(path):
+        return None
+    with open(path, 'rb') as f:
+        result = import_campaign_archive(service, f, keep_ids=True)
+    os.remove(path)
+    return result
@@ -0,0 +1,218 @@
+import os
+import tempfile
+import threading
+import time
+import uuid
+
+from services import serializer
+
+CHANGE_LOG_FILENAME = "_changes.jsonl"
+CHANGE_LOG_VERSION = 1
+
+# Tamaño a partir del cual el log se compacta (queda el último cambio de cada
+# registro). Si tras compactar sigue siendo grande, el umbral pasa a ser el doble.
+COMPACT_MIN_BYTES = 4 * 1024 * 1024
+
+# Cambios devueltos como máximo por petición (el resto con 'more': true)
+MAX_CHANGES_PER_PAGE = 1000
+
+_READ_BLOCK = 64 * 1024
+_SEQ_PREFIX = b'{"seq":'
+
+
+def _seq_of(line):
+    """Secuencia de una línea del log sin parsearla entera (None para la cabecera)."""
+    if not line.startswith(_SEQ_PREFIX):
+        return None
+    end = line.find(b',', len(_SEQ_PREFIX))
+    try:
+        return int(line[len(_SEQ_PREFIX):end])
+    except ValueError:
+        return None
+
+
+def _lines_after(f, since, newest=None):
+    """Líneas completas con seq > since (como mucho las 'newest' últimas), en orden.
+
+    Se lee desde el final del archivo: los clientes piden casi siempre lo
+    último. Una línea final sin salto (escritura en curso) se ignora.
+    """
+    f.seek(0, os.SEEK_END)
+    pos = f.tell()
+    pending = b""
+    lines = []
+    first_block = True
+    while pos > 0:
+        step = min(_READ_BLOCK, pos)
+        pos -= step
+        f.seek(pos)
+        parts = (f.read(step) + pending).split(b"\n")
+        pending = parts.pop(0)
+        if first_block:
+            parts.pop()
+            first_block = False
+        for line in reversed(parts):
+            seq = _seq_of(line)
+            if seq is None or seq <= since:
+                return lines[::-1]
+            lines.append(line)
+            if newest is not None and len(lines) >= newest:
+                return lines[::-1]
+    return lines[::-1]
+
+
+def _last_seq(f):
+    last = _lines_after(f, -1, newest=1)
+    return _seq_of(last[0]) if last else 0
+
+
+class ChangeLog:
+    """Log de cambios por campaña, append-only y con secuencia creciente.
+
+    Se alimenta de StorageEngine.subscribe, así que recoge toda escritura de
+    metadata, vault y sesiones venga del endpoint que venga. Vive en
+    campaign_{id}/_changes.jsonl: una cabecera con el ID del log y una línea
+    por cambio. Se escribe bajo el lock del motor, así que la secuencia es
+    única aunque escriban varios workers.
+
+    Un log nuevo (campaña restaurada, importada...) tiene otro ID: el cliente
+    que traiga uno distinto recibe 'reset' y debe recargar entero.
+    """
+
+    def __init__(self, file_service, compact_min_bytes=COMPACT_MIN_BYTES):
+        self.file_service = file_service
+        self.compact_min_bytes = compact_min_bytes
+        # Despierta a los streams SSE de este proceso (los de otros sondean)
+        self._condition = threading.Condition()
+
+    def _path(self, campaign_id):
+        return os.path.join(self.file_service._get_campaign_path(campaign_id), CHANGE_LOG_FILENAME)
+
+    @staticmethod
+    def _read_header(path):
+        try:
+            with open(path, 'rb') as f:
+                header = serializer.loads(f.readline())
+        except (FileNotFoundError, ValueError):
+            return None
+        return header if header.get('version') == CHANGE_LOG_VERSION else None
+
+    @staticmethod
+    def _write(path, header, lines):
+        fd, tmp_path = tempfile.mkstemp(dir=os.path.dirname(path), prefix=".tmp_", suffix=".tmp")
+        try:
+            with os.fdopen(fd, 'wb') as f:
+                f.write(serializer.dumps(header) + b"\n")
+                f.writelines(line + b"\n" for line in lines)
+            os.replace(tmp_path, path)
+        except BaseException:
+            if os.path.exists(tmp_path):
+                os.remove(tmp_path)
+            raise
+
+    def _ensure(self, campaign_id):
+        """Cabecera del log, creándolo si falta. None si la campaña no existe."""
+        path = self._path(campaign_id)
+        header = self._read_header(path)
+        if header is not None:
+            return header
+        if not self.file_service.campaign_exists(campaign_id):
+            return None
+        # Con SQLite el directorio solo guarda artefactos derivados: puede faltar
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        with self.file_service.locked(path):
+            header = self._read_header(path)
+            if header is None:
+                header = {"version": CHANGE_LOG_VERSION, "log": uuid.uuid4().hex, "compacted_bytes": 0}
+                self._write(path, header, [])
+        return header
+
+    def handle_change(self, campaign_id, collection, record_id, record):
+        if collection == "campaigns":
+            if record is None:
+                # La campaña se ha borrado y su log con ella
+                return
+            campaign_id = record_id
+        header = self._ensure(campaign_id)
+        if header is None:
+            return
+
+        path = self._path(campaign_id)
+        with self.file_service.locked(path):
+            with open(path, 'a+b') as f:
+                entry = {
+                    "seq": _last_seq(f) + 1,
+                    "ts": time.time(),
+                    "collection": collection,
+                    "id": record_id,
+                    "op": "delete" if record is None else "put",
+                    "record": record,
+                }
+                f.write(serializer.dumps(entry) + b"\n")
+                size = f.tell()
+            if size > max(self.compact_min_bytes, 2 * self._read_header(path).get('compacted_bytes', 0)):
+                self._compact(path)
+
+        with self._condition:
+            self._condition.notify_all()
+
+    def _compact(self, path):
+        """Deja solo el último cambio de cada registro, con su secuencia original.
+
+        Sin pérdida para sincronizar: un cliente en 'since' recibe el estado
+        final de todo lo que cambió después, aunque no los pasos intermedios.
+        """
+        header = self._read_header(path)
+        latest = {}
+        with open(path, 'rb') as f:
+            f.readline()
+            for line in f:
+                if not line.endswith(b"\n"):
+                    continue
+                entry = serializer.loads(line)
+                latest.pop((entry['collection'], entry['id']), None)
+                latest[(entry['collection'], entry['id'])] = line.rstrip(b"\n")
+        lines = list(latest.values())
+        header['compacted_bytes'] = sum(len(line) + 1 for line in lines)
+        self._write(path, header, lines)
+
+    def read(self, campaign_id, since=0, log_id=None, limit=MAX_CHANGES_PER_PAGE):
+        """Cambios con seq > since. None si la campaña no existe.
+
+        Devuelve {"log", "last_seq", "changes", "more", "reset"}; 'last_seq'
+        es el 'since' de la siguiente petición.
+        """
+        if limit < 1:
+            raise ValueError("limit must be a positive integer")
+        header = self._ensure(campaign_id)
+        if header is None:
+            return None
+        try:
+            with open(self._path(campaign_id), 'rb') as f:
+                lines = _lines_after(f, since)
+                last_seq = _seq_of(lines[-1]) if lines else _last_seq(f)
+        except FileNotFoundError:
+            return None
+
+        page = {"log": header['log'], "last_seq": last_seq, "changes": [], "more": False, "reset": False}
+        if (log_id and log_id != header['log']) or since > last_seq:
+            page["reset"] = True
+            return page
+        page["changes"] = [serializer.loads(line) for line in lines[:limit]]
+        if len(lines) > limit:
+            page["more"] = True
+            page["last_seq"] = page["changes"][-1]["seq"]
+        return page
+
+    def stamp(self, campaign_id):
+        """(mtime, tamaño) del log: cambia con cada escritura de cualquier proceso."""
+        try:
+            st = os.stat(self._path(campaign_id))
+        except FileNotFoundError:
+            return None
+        return st.st_mtime_ns, st.st_size
+
+    def wait(self, timeout):
+        """Espera a un cambio en este proceso o a que pase 'timeout'."""
+        with self._condition:
+            self._condition.wait(timeout)
@@ -0,0 +1,191 @@
+import json
+import math
+
+from services.search_service import tokenize
+from services.vault_service import usage_count
+
+DEFAULT_CONTEXT_TOKEN_BUDGET = 6000
+DEFAULT_TURN_CONTEXT_TOKEN_BUDGET = 1500
+
+# Reparto del presupuesto del system prompt entre secciones
+SECTION_SHARES = {
+    "framework": 0.35,
+    "world": 0.10,       # verdades + frentes
+    "characters": 0.15,
+    "memory": 0.15,
+    "items": 0.25,       # items de la escena / secretos / nombres del vault
+}
+
+SUMMARY_CHARS = 160
+
+
+def estimate_tokens(text):
+    """Estimación barata: ~4 caracteres por token."""
+    return (len(text) + 3) // 4
+
+
+def truncate_to_tokens(text, max_tokens):
+    max_chars = max_tokens * 4
+    if len(text) <= max_chars:
+        return text, False
+    return text[:max(0, max_chars - 1)].rstrip() + "…", True
+
+
+def item_label(item):
+    content = item.get('content') or {}
+    return content.get('name') or content.get('title') or (content.get('description') or '')[:40] or item.get('id', '?')
+
+
+def render_full(item):
+    return json.dumps(item.get('content') or {}, ensure_ascii=False)
+
+
+def render_summary(item):
+    content = item.get('content') or {}
+    description = (content.get('description') or content.get('background') or '').strip()
+    if len(description) > SUMMARY_CHARS:
+        description = description[:SUMMARY_CHARS - 1].rstrip() + "…"
+    label = item_label(item)
+    return f"{label} ({item.get('type')}): {description}" if description else f"{label} ({item.get('type')})"
+
+
+def item_terms(item):
+    parts = []
+    for value in (item.get('content') or {}).values():
+        if isinstance(value, str):
+            parts.append(value)
+        elif isinstance(value, list):
+            parts.extend(v for v in value if isinstance(v, str))
+    parts.extend(item.get('tags') or [])
+    return set(tokenize(' '.join(parts)))
+
+
+def _terms_for(item, terms_cache):
+    if terms_cache is None:
+        return item_terms(item)
+    terms = terms_cache.get(item.get('id'))
+    if terms is None:
+        terms = terms_cache[item.get('id')] = item_terms(item)
+    return terms
+
+
+def rank_items(items, query=None, linked_ids=(), terms_cache=None):
+    """Ordena items por relevancia: solapamiento léxico con la consulta,
+    vínculo con la sesión actual y usage_count. Devuelve [(score, item)].
+
+    terms_cache ({id: términos}) evita re-tokenizar los items en cada consulta.
+    """
+    query_terms = set(tokenize(query)) if query else set()
+    linked = set(linked_ids)
+    ranked = []
+    for item in items:
+        score = 0.0
+        if query_terms:
+            overlap = len(query_terms & _terms_for(item, terms_cache))
+            score += 3.0 * overlap / len(query_terms)
+        if item.get('id') in linked:
+            score += 2.0
+        score += 0.5 * math.log1p(usage_count(item))
+        ranked.append((score, item))
+    # Empates: orden alfabético para que el resultado sea determinista
+    ranked.sort(key=lambda pair: (-pair[0], item_label(pair[1]).casefold(), pair[1].get('id', '')))
+    return ranked
+
+
+def fit_items(items, budget_tokens, render=render_full, allow_summary=True):
+    """Mete items (ya ordenados) en el presupuesto: completos, resumidos o fuera.
+
+    Devuelve (textos, informe): 'included' son los IDs metidos completos;
+    'summarized' y 'dropped', los nombres de los que no cupieron enteros.
+    """
+    remaining = budget_tokens
+    texts = []
+    report = {"included": [], "summarized": [], "dropped": []}
+    for item in items:
+        full = render(item)
+        cost = estimate_tokens(full)
+        if cost <= remaining:
+            texts.append(full)
+            remaining -= cost
+            report["included"].append(item.get('id'))
+            continue
+        if allow_summary:
+            summary = render_summary(item)
+            cost = estimate_tokens(summary)
+            if cost <= remaining:
+                texts.append(summary)
+                remaining -= cost
+                report["summarized"].append(item_label(item))
+                continue
+        report["dropped"].append(item_label(item))
+    report["tokens"] = budget_tokens - remaining
+    return texts, report
+
+
+class ContextBuilder:
+    """Selecciona qué entra en el prompt respetando un presupuesto de tokens."""
+
+    def __init__(self, budget_tokens=DEFAULT_CONTEXT_TOKEN_BUDGET, turn_budget_tokens=DEFAULT_TURN_CONTEXT_TOKEN_BUDGET):
+        self.budget_tokens = budget_tokens
+        self.turn_budget_tokens = turn_budget_tokens
+
+    def section_budget(self, section):
+        return int(self.budget_tokens * SECTION_SHARES[section])
+
+    def fit_text(self, section, text):
+        """Recorta un bloque de texto a su presupuesto. Devuelve (texto, informe)."""
+        fitted, truncated = truncate_to_tokens(text, self.section_budget(section))
+        return fitted, {"tokens": estimate_tokens(fitted), "truncated": truncated}
+
+    def fit_list(self, section, values, render=str, budget_tokens=None):
+        """Lista de valores sueltos (verdades, frentes, nombres...) hasta agotar el presupuesto."""
+        budget = self.section_budget(section) if budget_tokens is None else budget_tokens
+        remaining = budget
+        kept = []
+        for value in values:
+            cost = estimate_tokens(render(value)) + 1
+            if cost > remaining:
+                break
+            kept.append(value)
+            remaining -= cost
+        return kept, {"included": len(kept), "dropped": len(values) - len(kept), "tokens": budget - remaining}
+
+    def fit_items(self, section, items, linked_ids=(), terms_cache=None, budget_tokens=None):
+        ranked = [item for _, item in rank_items(items, linked_ids=linked_ids, terms_cache=terms_cache)]
+        return fit_items(ranked, self.section_budget(section) if budget_tokens is None else budget_tokens)
+
+    def turn_context(self, query, items, exclude_ids=(), terms_cache=None, ranked_ids=None):
+        """Items relevantes para esta pregunta (solo los que comparten algún término).
+
+        Con ranked_ids (IDs ya ordenados por el índice vectorial) se usan esos
+        en su orden en lugar del filtro léxico.
+        """
+        query_terms = set(tokenize(query))
+        if not query_terms:
+            return [], {"included": [], "summarized": [], "dropped": [], "tokens": 0}
+        excluded = set(exclude_ids)
+        if ranked_ids is not None:
+            by_id = {item.get('id'): item for item in items}
+            ranked = [by_id[i] for i in ranked_ids if i in by_id and i not in excluded]
+            texts, report = fit_items(ranked, self.turn_budget_tokens)
+            report["retrieval"] = "vector"
+            return texts, report
+        candidates = [
+            item for item in items
+            if item.get('id') not in excluded and query_terms & _terms_for(item, terms_cache)
+        ]
+        ranked = [item for _, item in rank_items(candidates, query=query, terms_cache=terms_cache)]
+        return fit_items(ranked, self.turn_budget_tokens)
+
+
+def summarize_report(report):
+    """Versión compacta del informe para métricas y logs."""
+    summary = {}
+    for section, data in report.items():
+        entry = {k: v for k, v in data.items() if k not in ('included', 'summarized', 'dropped')}
+        for key in ('included', 'summarized', 'dropped'):
+            if key in data:
+                value = data[key]
+                entry[key] = len(value) if isinstance(value, list) else value
+        summary[section] = entry
+    return summary
@@ -0,0 +1,86 @@
+import threading
+import time
+
+DEFAULT_TTL_SECONDS = 30 * 60
+DEFAULT_MAX_CONVERSATIONS = 200
+
+
+class Conversation:
+    def __init__(self, chat, prompt_hash):
+        self.chat = chat
+        self.prompt_hash = prompt_hash
+        self.last_used = time.monotonic()
+        self.turns = 0
+        # ChatSession no es thread-safe: un turno a la vez por conversación
+        self.lock = threading.Lock()
+
+
+class ConversationStore:
+    """Chats de Gemini vivos por (campaña, modo, sesión), con expiración por inactividad.
+
+    Cada conversación recuerda el hash del system prompt con el que se abrió;
+    si el contexto de la campaña cambia, el llamador abre una nueva.
+    """
+
+    def __init__(self, ttl_seconds=DEFAULT_TTL_SECONDS, max_conversations=DEFAULT_MAX_CONVERSATIONS):
+        self.ttl_seconds = ttl_seconds
+        self.max_conversations = max_conversations
+        self._conversations = {}
+        self._lock = threading.Lock()
+
+    def _evict(self, now):
+        expired = [k for k, c in self._conversations.items() if now - c.last_used > self.ttl_seconds]
+        for key in expired:
+            del self._conversations[key]
+        # Si sigue lleno, fuera las menos usadas recientemente
+        overflow = len(self._conversations) - self.max_conversations
+        if overflow > 0:
+            oldest = sorted(self._conversations.items(), key=lambda kv: kv[1].last_used)[:overflow]
+            for key, _ in oldest:
+                del self._conversations[key]
+
+    def get(self, key, prompt_hash):
+        """Conversación vigente para 'key' si se abrió con el mismo prompt, o None."""
+        now = time.monotonic()
+        with self._lock:
+            self._evict(now)
+            conversation = self._conversations.get(key)
+            if conversation is None or conversation.prompt_hash != prompt_hash:
+                return None
+            conversation.last_used = now
+            return conversation
+
+    def peek(self, key):
+        """Conversación abierta para 'key' (con cualquier prompt), sin tocar su uso, o None."""
+        with self._lock:
+            conversation = self._conversations.get(key)
+            if conversation is None or time.monotonic() - conversation.last_used > self.ttl_seconds:
+                return None
+            return conversation
+
+    def put(self, key, chat, prompt_hash):
+        conversation = Conversation(chat, prompt_hash)
+        with self._lock:
+            self._conversations[key] = conversation
+            self._evict(time.monotonic())
+        return conversation
+
+    def discard(self, key, conversation=None):
+        """Elimina la conversación (solo si sigue siendo 'conversation', si se indica)."""
+        with self._lock:
+            if conversation is None or self._conversations.get(key) is conversation:
+                self._conversations.pop(key, None)
+
+    def discard_campaign(self, campaign_id):
+        with self._lock:
+            for key in [k for k in self._conversations if k[0] == campaign_id]:
+                del self._conversations[key]
+
+    def handle_change(self, campaign_id, collection, record_id, record):
+        # Listener de FileService: al borrar una campaña se olvidan sus chats
+        if collection == "campaigns" and record is None:
+            self.discard_campaign(record_id)
+
+    def __len__(self):
+        with self._lock:
+            return len(self._conversations)
@@ -1,48 +1,783 @@
-import json
+import logging
 import os
 import shutil
+import tempfile
+import threading
+import uuid
+import zlib
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
 
-class FileService:
-    def __init__(self, storage_path):
-        self.storage_path = storage_path
+from services.storage_engine import StorageEngine, VersionConflict, _copy_json, listing_record  # noqa: F401 (reexport)
+from services.metrics import span, count
+from services import serializer
+from services.serializer import STORAGE_FORMATS
 
-    def _get_campaign_path(self, campaign_id):
-        return os.path.join(self.storage_path, f"campaign_{campaign_id}")
+logger = logging.getLogger(__name__)
+
+DEFAULT_CACHE_MAX_BYTES = 64 * 1024 * 1024
+
+# Hilos para leer colecciones enteras (load_many): la espera de E/S en discos
+# lentos o de red se solapa; el parseo se hace después, en el hilo que llama.
+DEFAULT_LOAD_WORKERS = 8
+
+# Política de fsync: 'none' (lo decide el SO), 'always' (antes de cada
+# os.replace) o 'batch' (un hilo sincroniza lo pendiente cada FSYNC_INTERVAL).
+FSYNC_MODES = ('none', 'always', 'batch')
+DEFAULT_FSYNC_INTERVAL = 1.0
+
+# Manifiestos materializados: un archivo por colección con el registro de
+# listado de cada documento (ver storage_engine.listing_record), no el
+# documento entero. Empiezan por '_' para no confundirse con documentos de
+# la campaña. v3: registros de listado en vez de documentos completos.
+MANIFEST_FILENAME = "_index.json"
+CAMPAIGNS_MANIFEST_FILENAME = "_campaigns.json"
+MANIFEST_VERSION = 3
+
+
+def _is_document(filename):
+    return filename.endswith(".json") and not filename.startswith("_")
+
+
+def _id_from_filename(filename):
+    """Extrae el UUID de '{type}_{uuid}.json' o 'session_{nn}_{uuid}.json'."""
+    if not _is_document(filename) or "_" not in filename:
+        return None
+    return filename[:-5].rsplit("_", 1)[1]
+
+
+def _listed_doc(collection, doc):
+    """Documento tal como lo devuelven los listados, o None si no va en ellos."""
+    if not doc:
+        return None
+    if collection == "campaigns":
+        return doc
+    if 'id' not in doc:
+        return None
+    if collection == "vault" and 'usage_count' not in doc:
+        return dict(doc, usage_count=0)
+    return doc
+
+
+def _manifest_record(collection, doc):
+    """Registro del manifiesto para un documento, o None si no va en el listado.
+
+    'digest' resume el documento entero: así una edición a mano que solo
+    toca el contenido también se detecta al compararlo con el de disco.
+    """
+    if _listed_doc(collection, doc) is None:
+        return None
+    record = listing_record(collection, doc)
+    record['digest'] = zlib.crc32(serializer.dumps(doc))
+    return record
+
+
+def _dir_mtime(dir_path):
+    try:
+        return os.stat(dir_path).st_mtime_ns
+    except FileNotFoundError:
+        return None
+
+
+def _fsync_dir(dir_path):
+    # Persiste la entrada de directorio tras os.replace (no disponible en Windows)
+    try:
+        fd = os.open(dir_path, os.O_RDONLY)
+    except OSError:
+        return
+    try:
+        os.fsync(fd)
+    except OSError:
+        pass
+    finally:
+        os.close(fd)
+
+
+class FileService(StorageEngine):
+    """Acceso al File System DB: el motor por defecto, un JSON por documento.
+
+    Se instancia una vez por proceso (ver app.py) para que la caché de
+    documentos y los índices sobrevivan entre requests.
+    """
+
+    def __init__(self, storage_path, cache_max_bytes=DEFAULT_CACHE_MAX_BYTES,
+                 fsync_mode='none', fsync_interval=DEFAULT_FSYNC_INTERVAL,
+                 load_workers=DEFAULT_LOAD_WORKERS, storage_format='pretty'):
+        super().__init__(storage_path)
+
+        if fsync_mode not in FSYNC_MODES:
+            raise ValueError(f"fsync_mode must be one of {FSYNC_MODES}")
+        if storage_format not in STORAGE_FORMATS:
+            raise ValueError(f"storage_format must be one of {STORAGE_FORMATS}")
+        # Formato de los documentos que se escriben; se leen los dos
+        self.storage_format = storage_format
+        self.fsync_mode = fsync_mode
+        self.fsync_interval = fsync_interval
+        self._pending_fsync = set()
+        self._pending_fsync_lock = threading.Lock()
+        self._fsync_thread = None
+        self._fsync_stop = threading.Event()
+
+        # Caché de documentos parseados: { path: (mtime_ns, size, data) } en orden LRU.
+        # El coste de cada entrada se mide por el tamaño del archivo en disco.
+        self.cache_max_bytes = cache_max_bytes
+        self.cache_hits = 0
+        self.cache_misses = 0
+        self._doc_cache = OrderedDict()
+        self._cache_bytes = 0
+        self._cache_lock = threading.Lock()
+
+        # Índices ID -> nombre de archivo por directorio (vault/sessions de cada campaña).
+        # Estructura: { dir_path: (mtime_ns, { item_id: filename }) }
+        self._id_indexes = {}
+        self._id_indexes_lock = threading.Lock()
+
+        # Pool de lectura de load_many, creado con la primera lectura en lote
+        self.load_workers = load_workers
+        self._load_executor = None
+        self._load_executor_lock = threading.Lock()
 
-    def create_campaign_structure(self, campaign_id):
-        base_path = self._get_campaign_path(campaign_id)
-        os.makedirs(base_path, exist_ok=True)
-        os.makedirs(os.path.join(base_path, "vault"), exist_ok=True)
-        os.makedirs(os.path.join(base_path, "sessions"), exist_ok=True)
-        return base_path
 
     def save_json(self, path, data):
-        with open(path, 'w', encoding='utf-8') as f:
-            json.dump(data, f, indent=2, ensure_ascii=False)
+        is_new = not os.path.exists(path)
+        dir_path = os.path.dirname(path)
+        mtime_before = _dir_mtime(dir_path)
 
-    def load_json(self, path):
-        if not os.path.exists(path):
+        with span("storage.write"):
+            raw = serializer.dumps(data, pretty=self.storage_format == 'pretty')
+            self._atomic_write(path, raw)
+        count("bytes_written", len(raw))
+
+        # Write-through: lo que acabamos de escribir es la versión vigente
+        st = os.stat(path)
+        self._cache_put(path, st.st_mtime_ns, st.st_size, _copy_json(data))
+
+        if is_new:
+            self._index_add(dir_path, os.path.basename(path), mtime_before)
+        else:
+            # os.replace cambia el mtime del directorio, pero no su contenido
+            self._index_touch(dir_path, mtime_before)
+
+    def _atomic_write(self, path, raw):
+        """Escribe en un temporal del mismo directorio y lo renombra encima.
+
+        Un lector (o un corte) nunca ve el archivo a medias.
+        """
+        dir_path = os.path.dirname(path)
+        fd, tmp_path = tempfile.mkstemp(dir=dir_path, prefix=".tmp_", suffix=".tmp")
+        try:
+            with os.fdopen(fd, 'wb') as f:
+                f.write(raw)
+                if self.fsync_mode == 'always':
+                    f.flush()
+                    os.fsync(f.fileno())
+            os.replace(tmp_path, path)
+        except BaseException:
+            if os.path.exists(tmp_path):
+                os.remove(tmp_path)
+            raise
+
+        if self.fsync_mode == 'always':
+            _fsync_dir(dir_path)
+        elif self.fsync_mode == 'batch':
+            with self._pending_fsync_lock:
+                self._pending_fsync.add(path)
+            self._ensure_fsync_thread()
+
+    # --- fsync por lotes ---
+
+    def _ensure_fsync_thread(self):
+        if self._fsync_thread is not None:
+            return
+        with self._pending_fsync_lock:
+            if self._fsync_thread is None:
+                self._fsync_thread = threading.Thread(target=self._fsync_loop, name="fsync-batch", daemon=True)
+                self._fsync_thread.start()
+
+    def _fsync_loop(self):
+        while not self._fsync_stop.wait(self.fsync_interval):
+            self.flush()
+
+    def flush(self):
+        """Sincroniza a disco las escrituras pendientes (modo 'batch')."""
+        with self._pending_fsync_lock:
+            pending, self._pending_fsync = self._pending_fsync, set()
+        directories = set()
+        for path in pending:
+            try:
+                fd = os.open(path, os.O_RDONLY)
+            except FileNotFoundError:
+                continue
+            try:
+                os.fsync(fd)
+            finally:
+                os.close(fd)
+            directories.add(os.path.dirname(path))
+        for dir_path in directories:
+            _fsync_dir(dir_path)
+        return len(pending)
+
+    def close(self):
+        """Detiene el hilo de fsync y el pool de lectura, y vacía lo pendiente."""
+        self._fsync_stop.set()
+        if self._fsync_thread is not None:
+            self._fsync_thread.join(timeout=5)
+        if self._load_executor is not None:
+            self._load_executor.shutdown(wait=True)
+        self.flush()
+        super().close()
+
+    def document_stamp(self, path):
+        # La misma firma con la que se valida la caché de documentos
+        try:
+            st = os.stat(path)
+        except FileNotFoundError:
+            return None
+        return f"{st.st_mtime_ns:x}.{st.st_size:x}"
+
+    def campaign_stamp(self, campaign_id):
+        """(mtime, tamaño) de metadata.json y de los manifiestos de vault y sesiones."""
+        signature = []
+        for path in (
+            os.path.join(self._get_campaign_path(campaign_id), "metadata.json"),
+            self._manifest_path(campaign_id, "vault"),
+            self._manifest_path(campaign_id, "sessions"),
+        ):
+            try:
+                st = os.stat(path)
+                signature.append((st.st_mtime_ns, st.st_size))
+            except FileNotFoundError:
+                signature.append(None)
+        return tuple(signature)
+
+    def list_json_files(self, dir_path):
+        """Nombres de los documentos JSON de un directorio (sin manifiestos)."""
+        if not os.path.exists(dir_path):
+            return []
+        with span("storage.scan"):
+            count("dir_scans")
+            return [f for f in os.listdir(dir_path) if _is_document(f)]
+
+    def load_json(self, path, readonly=False):
+        """Carga un JSON pasando por la caché.
+
+        Con readonly=True se devuelve el objeto compartido de la caché, sin
+        copia: el llamador no debe modificarlo.
+        """
+        try:
+            st = os.stat(path)
+        except FileNotFoundError:
+            self._cache_drop(path)
             return None
-        with open(path, 'r', encoding='utf-8') as f:
-            return json.load(f)
-
-    def list_campaigns(self):
-        campaigns = []
-        if not os.path.exists(self.storage_path):
-            return campaigns
-            
-        for item in os.listdir(self.storage_path):
-            if item.startswith("campaign_") and os.path.isdir(os.path.join(self.storage_path, item)):
-                campaign_id = item.replace("campaign_", "")
-                metadata_path = os.path.join(self.storage_path, item, "metadata.json")
-                metadata = self.load_json(metadata_path)
+
+        cached = self._cache_lookup(path, st)
+        if cached is not None:
+            data = cached[2]
+            return data if readonly else _copy_json(data)
+
+        with span("storage.read"):
+            with open(path, 'rb') as f:
+                data = serializer.loads(f.read())
+        count("files_read")
+        count("bytes_parsed", st.st_size)
+
+        self._cache_put(path, st.st_mtime_ns, st.st_size, data)
+        return data if readonly else _copy_json(data)
+
+    def load_many(self, paths, readonly=False):
+        """Carga varios documentos; lista con los datos en el orden de 'paths'.
+
+        Los aciertos de caché no cuestan nada; los fallos se leen en el pool
+        de hilos (acotado a load_workers) y se parsean en este hilo. Un
+        archivo que falta queda como None, y uno corrupto también, con un
+        error en el log: una colección no deja de listarse por un documento roto.
+        """
+        paths = list(paths)
+        with span("storage.read_many"):
+            if self.load_workers > 1 and len(paths) > 1:
+                # Tramos contiguos: una tarea por archivo cuesta más que leerlo de un SSD
+                size = -(-len(paths) // (self.load_workers * 4))
+                chunks = [paths[i:i + size] for i in range(0, len(paths), size)]
+                loaded = [entry for chunk in self._get_load_executor().map(self._load_chunk, chunks) for entry in chunk]
+            else:
+                loaded = self._load_chunk(paths)
+
+        results = []
+        for path, (data, st, raw) in zip(paths, loaded):
+            if st is None:
+                self._cache_drop(path)
+            elif raw is not None:
+                # Parseo, contadores y caché desde este hilo (el del request):
+                # en el pool el parseo solo competiría por el GIL
+                try:
+                    data = serializer.loads(raw)
+                except ValueError as e:
+                    logger.error("skipping unreadable document %s: %s", path, e)
+                    results.append(None)
+                    continue
+                count("files_read")
+                count("bytes_parsed", st.st_size)
+                self._cache_put(path, st.st_mtime_ns, st.st_size, data)
+            results.append(data if readonly or data is None else _copy_json(data))
+        return results
+
+    def _load_chunk(self, paths):
+        return [self._load_for_batch(path) for path in paths]
+
+    def _load_for_batch(self, path):
+        """(datos en caché, stat, bytes leídos) de un documento; corre en el pool de load_many."""
+        try:
+            st = os.stat(path)
+        except FileNotFoundError:
+            return None, None, None
+        cached = self._cache_lookup(path, st)
+        if cached is not None:
+            return cached[2], st, None
+        try:
+            with open(path, 'rb') as f:
+                return None, st, f.read()
+        except FileNotFoundError:
+            return None, None, None
+        except OSError as e:
+            logger.error("skipping unreadable document %s: %s", path, e)
+            return None, st, None
+
+    def _get_load_executor(self):
+        if self._load_executor is None:
+            with self._load_executor_lock:
+                if self._load_executor is None:
+                    self._load_executor = ThreadPoolExecutor(max_workers=self.load_workers, thread_name_prefix="storage-load")
+        return self._load_executor
+
+    def read_raw(self, path):
+        # Sin pasar por la caché: un export no debe desalojar los documentos en uso
+        try:
+            with open(path, 'rb') as f:
+                data = f.read()
+        except FileNotFoundError:
+            return None
+        count("files_read")
+        return data
+
+    def _remove_file(self, path):
+        dir_path = os.path.dirname(path)
+        mtime_before = _dir_mtime(dir_path)
+        os.remove(path)
+        self._cache_drop(path)
+        self._index_discard(dir_path, os.path.basename(path), mtime_before)
+
+    # --- Caché de documentos ---
+
+    def _cache_lookup(self, path, st):
+        """Entrada (mtime_ns, size, data) si la caché sigue al día con 'st'; si no, None."""
+        with self._cache_lock:
+            cached = self._doc_cache.get(path)
+            if cached and cached[0] == st.st_mtime_ns and cached[1] == st.st_size:
+                self._doc_cache.move_to_end(path)
+                self.cache_hits += 1
+                return cached
+            self.cache_misses += 1
+            return None
+
+    def _cache_put(self, path, mtime_ns, size, data):
+        if size > self.cache_max_bytes:
+            self._cache_drop(path)
+            return
+        with self._cache_lock:
+            previous = self._doc_cache.pop(path, None)
+            if previous:
+                self._cache_bytes -= previous[1]
+            self._doc_cache[path] = (mtime_ns, size, data)
+            self._cache_bytes += size
+            # Expulsión LRU hasta volver al límite
+            while self._cache_bytes > self.cache_max_bytes and self._doc_cache:
+                _, evicted = self._doc_cache.popitem(last=False)
+                self._cache_bytes -= evicted[1]
+
+    def _cache_drop(self, path):
+        with self._cache_lock:
+            previous = self._doc_cache.pop(path, None)
+            if previous:
+                self._cache_bytes -= previous[1]
+
+    def _cache_drop_prefix(self, prefix):
+        with self._cache_lock:
+            for path in [p for p in self._doc_cache if p.startswith(prefix)]:
+                self._cache_bytes -= self._doc_cache.pop(path)[1]
+
+    def cache_stats(self):
+        with self._cache_lock:
+            return {
+                "hits": self.cache_hits,
+                "misses": self.cache_misses,
+                "entries": len(self._doc_cache),
+                "bytes": self._cache_bytes,
+                "max_bytes": self.cache_max_bytes,
+            }
+
+    # --- Índice ID -> archivo ---
+
+    def _get_id_index(self, dir_path):
+        """Devuelve el índice del directorio, reconstruyéndolo si su mtime cambió."""
+        mtime = _dir_mtime(dir_path)
+        if mtime is None:
+            return {}
+
+        with self._id_indexes_lock:
+            cached = self._id_indexes.get(dir_path)
+            if cached and cached[0] == mtime:
+                return cached[1]
+
+        index = {}
+        with span("storage.scan"):
+            count("dir_scans")
+            for filename in os.listdir(dir_path):
+                item_id = _id_from_filename(filename)
+                if item_id:
+                    index[item_id] = filename
+
+        with self._id_indexes_lock:
+            self._id_indexes[dir_path] = (mtime, index)
+        return index
+
+    def _index_add(self, dir_path, filename, mtime_before):
+        item_id = _id_from_filename(filename)
+        with self._id_indexes_lock:
+            cached = self._id_indexes.get(dir_path)
+            if not cached or not item_id:
+                return
+            # Si el directorio cambió por otra vía antes de escribir, que se reconstruya
+            if cached[0] != mtime_before:
+                del self._id_indexes[dir_path]
+                return
+            cached[1][item_id] = filename
+            self._id_indexes[dir_path] = (_dir_mtime(dir_path), cached[1])
+
+    def _index_discard(self, dir_path, filename, mtime_before):
+        item_id = _id_from_filename(filename)
+        with self._id_indexes_lock:
+            cached = self._id_indexes.get(dir_path)
+            if not cached:
+                return
+            if cached[0] != mtime_before:
+                del self._id_indexes[dir_path]
+                return
+            cached[1].pop(item_id, None)
+            self._id_indexes[dir_path] = (_dir_mtime(dir_path), cached[1])
+
+    def _index_touch(self, dir_path, mtime_before):
+        """Mantiene vigente el índice tras escribir un archivo que no es documento."""
+        with self._id_indexes_lock:
+            cached = self._id_indexes.get(dir_path)
+            if cached and cached[0] == mtime_before:
+                self._id_indexes[dir_path] = (_dir_mtime(dir_path), cached[1])
+
+    def list_ids(self, campaign_id, collection, filename_prefix=None):
+        """IDs de la colección, opcionalmente solo los de archivos '{prefix}...'.
+
+        Usa el índice ID -> archivo: no abre ningún documento.
+        """
+        index = self._get_id_index(self._get_collection_path(campaign_id, collection))
+        if filename_prefix is None:
+            return list(index)
+        return [item_id for item_id, filename in index.items() if filename.startswith(filename_prefix)]
+
+    def find_file(self, campaign_id, collection, item_id):
+        """Ruta completa del archivo de 'item_id' en vault/sessions, o None."""
+        dir_path = self._get_collection_path(campaign_id, collection)
+        filename = self._get_id_index(dir_path).get(item_id)
+        if not filename:
+            return None
+        return os.path.join(dir_path, filename)
+
+    def find_files(self, campaign_id, collection, item_ids):
+        """{id: ruta o None} para varios IDs con una sola consulta al índice."""
+        dir_path = self._get_collection_path(campaign_id, collection)
+        index = self._get_id_index(dir_path)
+        return {
+            item_id: os.path.join(dir_path, index[item_id]) if item_id in index else None
+            for item_id in item_ids
+        }
+
+    # --- Formato en disco ---
+
+    def reformat_documents(self, campaign_ids=None, storage_format=None):
+        """Reescribe metadata, vault y sesiones en 'storage_format' (por defecto el configurado).
+
+        Solo cambia la forma: mismo contenido y misma versión, sin notificar
+        a los listeners. Cada archivo se reescribe bajo su lock, así que se
+        puede lanzar con la aplicación en marcha.
+        """
+        storage_format = storage_format or self.storage_format
+        if storage_format not in STORAGE_FORMATS:
+            raise ValueError(f"storage_format must be one of {STORAGE_FORMATS}")
+        pretty = storage_format == 'pretty'
+        stats = {"files": 0, "rewritten": 0, "unreadable": 0, "bytes_before": 0, "bytes_after": 0}
+        if campaign_ids is None:
+            campaign_ids = sorted(self._current_ids(None, "campaigns"))
+
+        for campaign_id in campaign_ids:
+            base_path = self._get_campaign_path(campaign_id)
+            paths = [os.path.join(base_path, "metadata.json")]
+            for collection in ("vault", "sessions"):
+                dir_path = os.path.join(base_path, collection)
+                paths.extend(os.path.join(dir_path, f) for f in sorted(self.list_json_files(dir_path)))
+            for path in paths:
+                with self.locked(path):
+                    try:
+                        with open(path, 'rb') as f:
+                            raw = f.read()
+                    except FileNotFoundError:
+                        continue
+                    stats['files'] += 1
+                    stats['bytes_before'] += len(raw)
+                    try:
+                        data = serializer.loads(raw)
+                    except ValueError as e:
+                        logger.error("not reformatting unreadable document %s: %s", path, e)
+                        stats['unreadable'] += 1
+                        stats['bytes_after'] += len(raw)
+                        continue
+                    new_raw = serializer.dumps(data, pretty=pretty)
+                    stats['bytes_after'] += len(new_raw)
+                    if new_raw == raw:
+                        continue
+                    dir_path = os.path.dirname(path)
+                    mtime_before = _dir_mtime(dir_path)
+                    self._atomic_write(path, new_raw)
+                    st = os.stat(path)
+                    self._cache_put(path, st.st_mtime_ns, st.st_size, data)
+                    self._index_touch(dir_path, mtime_before)
+                    stats['rewritten'] += 1
+        return stats
+
+    # --- Manifiestos ---
+
+    def _manifest_path(self, campaign_id, collection):
+        if collection == "campaigns":
+            return os.path.join(self.storage_path, CAMPAIGNS_MANIFEST_FILENAME)
+        return os.path.join(self._get_collection_path(campaign_id, collection), MANIFEST_FILENAME)
+
+    def _write_manifest(self, path, items):
+        """Escritura atómica (temporal + os.replace) en formato compacto.
+
+        Cada escritura lleva una revisión nueva (aleatoria, no reutilizable
+        aunque el manifiesto se reconstruya): es la ETag de los listados.
+        """
+        data = {"version": MANIFEST_VERSION, "revision": uuid.uuid4().hex, "items": items}
+        dir_path = os.path.dirname(path)
+        mtime_before = _dir_mtime(dir_path)
+        with span("storage.manifest_write"):
+            raw = serializer.dumps(data)
+            self._atomic_write(path, raw)
+        count("bytes_written", len(raw))
+        st = os.stat(path)
+        # El dict es nuestro: se cachea sin copia
+        self._cache_put(path, st.st_mtime_ns, st.st_size, data)
+        # os.replace cambia el mtime del directorio, pero no sus documentos
+        self._index_touch(dir_path, mtime_before)
+
+    def _scan_collection(self, campaign_id, collection):
+        """Registros leyendo cada archivo (solo para reconstruir)."""
+        records = {}
+        if collection == "campaigns":
+            if not os.path.exists(self.storage_path):
+                return records
+            folders = sorted(
+                item for item in os.listdir(self.storage_path)
+                if item.startswith("campaign_") and os.path.isdir(os.path.join(self.storage_path, item))
+            )
+            paths = [os.path.join(self.storage_path, item, "metadata.json") for item in folders]
+            for item, metadata in zip(folders, self.load_many(paths, readonly=True)):
                 if metadata:
-                    campaigns.append(metadata)
-        return campaigns
+                    records[metadata.get('id', item.replace("campaign_", ""))] = _manifest_record(collection, metadata)
+            return records
+
+        dir_path = self._get_collection_path(campaign_id, collection)
+        filenames = sorted(self.list_json_files(dir_path))
+        for doc in self.load_many((os.path.join(dir_path, f) for f in filenames), readonly=True):
+            record = _manifest_record(collection, doc)
+            if record is not None:
+                records[record['id']] = record
+        return records
+
+    def _current_ids(self, campaign_id, collection):
+        """IDs presentes en disco según el índice ID -> archivo (sin abrir archivos)."""
+        if collection == "campaigns":
+            if not os.path.exists(self.storage_path):
+                return set()
+            with span("storage.scan"):
+                count("dir_scans")
+                return {
+                    item.replace("campaign_", "") for item in os.listdir(self.storage_path)
+                    if item.startswith("campaign_") and os.path.isdir(os.path.join(self.storage_path, item))
+                }
+        return set(self._get_id_index(self._get_collection_path(campaign_id, collection)))
+
+    def rebuild_manifest(self, campaign_id, collection):
+        path = self._manifest_path(campaign_id, collection)
+        if not os.path.exists(os.path.dirname(path)):
+            return {}
+        with self.locked(path):
+            items = self._scan_collection(campaign_id, collection)
+            self._write_manifest(path, items)
+        return items
+
+    def read_manifest(self, campaign_id, collection):
+        """{id: registro} de la colección ('vault', 'sessions' o 'campaigns').
+
+        Se reconstruye si falta o si los IDs no cuadran con los archivos
+        presentes (altas/bajas hechas fuera de la API). El resultado es
+        compartido con la caché: no modificar.
+        """
+        path = self._manifest_path(campaign_id, collection)
+        manifest = self.load_json(path, readonly=True)
+        if (not manifest or manifest.get('version') != MANIFEST_VERSION
+                or set(manifest['items']) != self._current_ids(campaign_id, collection)):
+            return self.rebuild_manifest(campaign_id, collection)
+        return manifest['items']
+
+    def load_records(self, campaign_id, collection, ids=None):
+        if ids is None:
+            ids = list(self.read_manifest(campaign_id, collection))
+        if collection == "campaigns":
+            paths = {cid: os.path.join(self._get_campaign_path(cid), "metadata.json") for cid in ids}
+        else:
+            paths = self.find_files(campaign_id, collection, ids)
+        found = [(record_id, paths[record_id]) for record_id in ids if paths.get(record_id)]
+        records = {}
+        for (record_id, _), doc in zip(found, self.load_many([path for _, path in found], readonly=True)):
+            doc = _listed_doc(collection, doc)
+            if doc is not None:
+                records[record_id] = doc
+        return records
+
+    def collection_revision(self, campaign_id, collection):
+        self.read_manifest(campaign_id, collection)
+        manifest = self.load_json(self._manifest_path(campaign_id, collection), readonly=True)
+        return manifest.get('revision') if manifest else None
+
+    def _manifest_apply(self, campaign_id, collection, changes):
+        """Aplica [(id, registro o None)] al manifiesto y devuelve los IDs aplicados.
+
+        Se descartan los registros más antiguos que lo ya registrado: dos
+        update_json seguidos pueden notificar en orden inverso (on_saved
+        corre fuera del lock del documento).
+        """
+        all_ids = {record_id for record_id, _ in changes}
+        path = self._manifest_path(campaign_id, collection)
+        if not os.path.exists(os.path.dirname(path)):
+            return all_ids
+        with self.locked(path):
+            manifest = self.load_json(path, readonly=True)
+            if not manifest or manifest.get('version') != MANIFEST_VERSION:
+                # Aún no materializado: se construirá completo en la próxima lectura
+                return all_ids
+            # Copia superficial: el dict cacheado puede estar en uso por otro request
+            items = dict(manifest['items'])
+            applied = set()
+            for record_id, record in changes:
+                if record is None:
+                    items.pop(record_id, None)
+                else:
+                    current = items.get(record_id)
+                    if current is not None and record.get('version', 0) < current.get('version', 0):
+                        continue
+                    items[record_id] = _manifest_record(collection, record)
+                applied.add(record_id)
+            if applied:
+                self._write_manifest(path, items)
+            return applied
+
+    # --- Cambios hechos fuera de la API ---
+
+    def apply_external_changes(self, campaign_id, collection, filenames=None):
+        """Pone al día listados y listeners tras ediciones hechas a mano en disco.
+
+        'filenames' son los documentos de vault/sessions que cambiaron (None:
+        todos). En 'campaigns' se mira metadata.json de campaign_id, o de
+        todas las campañas si es None. Cada documento se compara con su
+        registro del manifiesto: lo que ya cuadra, como las escrituras de
+        la propia aplicación, se ignora. Si algo difiere, el manifiesto se
+        reconstruye una vez desde disco y los listeners reciben todos los
+        cambios en un solo lote. Devuelve cuántos registros cambiaron.
+        """
+        path = self._manifest_path(campaign_id, collection)
+        if not os.path.isdir(os.path.dirname(path)):
+            # La campaña entera desapareció: lo notifica su metadata.json
+            return 0
+        # Bajo el lock del manifiesto: con varios workers vigilando, el
+        # primero reconstruye y los demás ya lo encuentran al día
+        with self.locked(path):
+            manifest = self.load_json(path, readonly=True)
+            if not manifest or manifest.get('version') != MANIFEST_VERSION:
+                # Nadie ha listado aún la colección, así que no hay nada derivado
+                # de ella que invalidar (los índices se construyen leyendo el
+                # manifiesto): basta con materializarlo
+                self._write_manifest(path, self._scan_collection(campaign_id, collection))
+                return 0
+            changes = self._external_diff(campaign_id, collection, manifest['items'], filenames)
+            if changes:
+                self._write_manifest(path, self._scan_collection(campaign_id, collection))
+
+        for record_id, record in changes:
+            if collection == "campaigns" and record is None:
+                campaign_path = self._get_campaign_path(record_id)
+                self._cache_drop_prefix(campaign_path + os.sep)
+                with self._id_indexes_lock:
+                    for name in ("vault", "sessions"):
+                        self._id_indexes.pop(os.path.join(campaign_path, name), None)
+        self._notify_changes(campaign_id, collection, changes)
+        return len(changes)
+
+    def _external_diff(self, campaign_id, collection, known, filenames):
+        """[(id, registro o None)] de los documentos que no cuadran con 'known'."""
+        candidates = {}
+        if collection == "campaigns":
+            ids = [campaign_id] if campaign_id else sorted(set(known) | self._current_ids(None, "campaigns"))
+            for cid in ids:
+                candidates[cid] = os.path.join(self._get_campaign_path(cid), "metadata.json")
+        else:
+            dir_path = self._get_collection_path(campaign_id, collection)
+            for filename in (self.list_json_files(dir_path) if filenames is None else filenames):
+                record_id = _id_from_filename(filename)
+                if record_id:
+                    candidates[record_id] = os.path.join(dir_path, filename)
+            if filenames is None:
+                candidates.update((record_id, None) for record_id in set(known) - set(candidates))
+
+        changes = []
+        for record_id, doc_path in sorted(candidates.items()):
+            try:
+                doc = self.load_json(doc_path, readonly=True) if doc_path else None
+            except ValueError as e:
+                # Un editor a medio guardar: el próximo evento lo reintenta
+                logger.warning("ignoring unreadable document %s: %s", doc_path, e)
+                continue
+            record = _manifest_record(collection, doc)
+            if record is None:
+                # Un renombrado (p. ej. al renumerar sesiones) no es un borrado
+                if collection != "campaigns" and self.find_file(campaign_id, collection, record_id):
+                    continue
+                if collection == "campaigns" and os.path.isdir(self._get_campaign_path(record_id)):
+                    # Carpeta recién creada, aún sin metadata.json
+                    continue
+                if record_id in known:
+                    changes.append((record_id, None))
+                continue
+            record_id = record.get('id', record_id)
+            if known.get(record_id) != record:
+                changes.append((record_id, _copy_json(_listed_doc(collection, doc))))
+        return changes
 
     def delete_campaign(self, campaign_id):
         path = self._get_campaign_path(campaign_id)
         if os.path.exists(path):
             shutil.rmtree(path)
+            self._cache_drop_prefix(path + os.sep)
+            with self._id_indexes_lock:
+                for collection in ("vault", "sessions"):
+                    self._id_indexes.pop(os.path.join(path, collection), None)
+            self.on_deleted(None, "campaigns", campaign_id)
             return True
         return False
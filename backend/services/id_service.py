@@ -1,4 +1,12 @@
+import re
 import uuid
 
+# Formato de generate_id(): UUID en minúsculas con guiones
+_ID_RE = re.compile(r"^[0-9a-f]{8}-[0-9a-f]{4}-[0-9a-f]{4}-[0-9a-f]{4}-[0-9a-f]{12}$")
+
 def generate_id():
     return str(uuid.uuid4())
+
+def is_valid_id(value):
+    """True si value tiene la forma de un ID generado (seguro para nombres de archivo)."""
+    return isinstance(value, str) and bool(_ID_RE.match(value))
@@ -0,0 +1,172 @@
+import threading
+import time
+from contextlib import contextmanager
+from contextvars import ContextVar
+
+# Buckets de latencia (segundos) y de conteos por request (archivos leídos...)
+LATENCY_BUCKETS = (0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30)
+COUNT_BUCKETS = (0, 1, 2, 5, 10, 25, 50, 100, 250, 500, 1000, 5000)
+
+# Contadores de E/S que se acumulan por request (ver count())
+IO_COUNTERS = {
+    "files_read": "Documents read from storage (cache misses).",
+    "bytes_parsed": "Bytes of JSON parsed from storage.",
+    "bytes_written": "Bytes of JSON written to storage.",
+    "dir_scans": "Directory listings (os.listdir).",
+}
+
+_current = ContextVar('request_metrics', default=None)
+
+
+class RequestMetrics:
+    """Lo medido durante un request: {span: [segundos, veces]} y {contador: valor}."""
+
+    __slots__ = ('started', 'spans', 'counts')
+
+    def __init__(self):
+        self.started = time.perf_counter()
+        self.spans = {}
+        self.counts = {}
+
+    def elapsed(self):
+        return time.perf_counter() - self.started
+
+
+def _escape(value):
+    return str(value).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')
+
+
+def _format_labels(names, values, extra=()):
+    pairs = list(zip(names, values)) + list(extra)
+    if not pairs:
+        return ""
+    escaped = (f'{k}="{_escape(v)}"' for k, v in pairs)
+    return "{" + ",".join(escaped) + "}"
+
+
+def _format_value(value):
+    return repr(float(value)) if isinstance(value, float) else str(value)
+
+
+class MetricsRegistry:
+    """Contadores e histogramas del proceso, exportables en formato de texto de Prometheus.
+
+    Con varios workers cada proceso tiene los suyos: /metrics devuelve los
+    del worker que atiende (llevan la etiqueta pid).
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._meta = {}       # nombre -> (tipo, ayuda, etiquetas, buckets)
+        self._values = {}     # nombre -> {valores de etiquetas: valor o [buckets..., suma, n]}
+
+    def describe(self, name, kind, help_text, labels=(), buckets=None):
+        with self._lock:
+            if name not in self._meta:
+                self._meta[name] = (kind, help_text, tuple(labels), buckets)
+                self._values[name] = {}
+
+    def inc(self, name, value=1, labels=()):
+        with self._lock:
+            series = self._values[name]
+            series[labels] = series.get(labels, 0) + value
+
+    def observe(self, name, value, labels=()):
+        buckets = self._meta[name][3]
+        with self._lock:
+            series = self._values[name]
+            state = series.get(labels)
+            if state is None:
+                state = series[labels] = [0] * len(buckets) + [0.0, 0]
+            for i, bound in enumerate(buckets):
+                if value <= bound:
+                    state[i] += 1
+            state[-2] += value
+            state[-1] += 1
+
+    def snapshot(self, name):
+        with self._lock:
+            return {labels: (list(v) if isinstance(v, list) else v) for labels, v in self._values[name].items()}
+
+    def render(self, extra=(), gauges=()):
+        """Texto de exposición. 'extra': etiquetas comunes; 'gauges': [(nombre, tipo, ayuda, [(labels dict, valor)])]."""
+        lines = []
+        with self._lock:
+            items = [(name, meta, dict(self._values[name])) for name, meta in self._meta.items()]
+        for name, (kind, help_text, label_names, buckets), series in items:
+            lines.append(f"# HELP {name} {help_text}")
+            lines.append(f"# TYPE {name} {kind}")
+            for labels, value in sorted(series.items()):
+                if kind == "histogram":
+                    for bound, cumulative in zip(buckets, value):
+                        le = (("le", _format_value(float(bound))),)
+                        lines.append(f"{name}_bucket{_format_labels(label_names, labels, tuple(extra) + le)} {cumulative}")
+                    inf = (("le", "+Inf"),)
+                    lines.append(f"{name}_bucket{_format_labels(label_names, labels, tuple(extra) + inf)} {value[-1]}")
+                    lines.append(f"{name}_sum{_format_labels(label_names, labels, extra)} {_format_value(value[-2])}")
+                    lines.append(f"{name}_count{_format_labels(label_names, labels, extra)} {value[-1]}")
+                else:
+                    lines.append(f"{name}{_format_labels(label_names, labels, extra)} {_format_value(value)}")
+        for name, kind, help_text, samples in gauges:
+            lines.append(f"# HELP {name} {help_text}")
+            lines.append(f"# TYPE {name} {kind}")
+            for labels, value in samples:
+                lines.append(f"{name}{_format_labels(labels.keys(), labels.values(), extra)} {_format_value(value)}")
+        return "\n".join(lines) + "\n"
+
+
+METRICS = MetricsRegistry()
+METRICS.describe("http_requests_total", "counter", "HTTP requests by route and status.", ("method", "route", "status"))
+METRICS.describe("http_request_duration_seconds", "histogram", "HTTP request latency (until the response is returned; streamed bodies excluded).",
+                 ("method", "route"), LATENCY_BUCKETS)
+METRICS.describe("app_span_seconds", "histogram", "Time spent in named spans (storage, prompt, model...).", ("span",), LATENCY_BUCKETS)
+METRICS.describe("app_request_files_read", "histogram", "Documents read from storage per request.", ("route",), COUNT_BUCKETS)
+METRICS.describe("app_request_bytes_parsed", "histogram", "Bytes of JSON parsed per request.", ("route",),
+                 (0, 1024, 16384, 131072, 1048576, 8388608, 67108864))
+for _name, _help in IO_COUNTERS.items():
+    METRICS.describe(f"app_{_name}_total", "counter", _help)
+
+
+def begin_request():
+    """Empieza a acumular spans y contadores para el request de este hilo/contexto."""
+    request_metrics = RequestMetrics()
+    return request_metrics, _current.set(request_metrics)
+
+
+def end_request(token):
+    _current.reset(token)
+
+
+def current():
+    return _current.get()
+
+
+def record_span(name, elapsed):
+    """Registra 'elapsed' segundos en el span 'name' (para lo que no cabe en un with, p. ej. un stream)."""
+    METRICS.observe("app_span_seconds", elapsed, (name,))
+    request_metrics = _current.get()
+    if request_metrics is not None:
+        entry = request_metrics.spans.get(name)
+        if entry is None:
+            request_metrics.spans[name] = [elapsed, 1]
+        else:
+            entry[0] += elapsed
+            entry[1] += 1
+
+
+@contextmanager
+def span(name):
+    """Mide el bloque: histograma global app_span_seconds y, si hay request en curso, su desglose."""
+    started = time.perf_counter()
+    try:
+        yield
+    finally:
+        record_span(name, time.perf_counter() - started)
+
+
+def count(name, value=1):
+    """Suma a un contador de E/S (IO_COUNTERS) del proceso y del request en curso."""
+    METRICS.inc(f"app_{name}_total", value)
+    request_metrics = _current.get()
+    if request_metrics is not None:
+        request_metrics.counts[name] = request_metrics.counts.get(name, 0) + value
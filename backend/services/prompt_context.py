@@ -0,0 +1,66 @@
+import threading
+from collections import defaultdict
+
+
+class PromptContextCache:
+    """Contexto de prompt ya ensamblado por campaña, invalidado por número de versión.
+
+    Cada escritura notificada por FileService (metadata, vault o sesiones)
+    incrementa la versión de su campaña; mientras no cambie, el chat reutiliza
+    el contexto y los system prompts ya construidos sin tocar el disco.
+
+    Las escrituras de otros procesos (varios workers) no pasan por aquí: para
+    eso el llamador puede pasar 'stamp', una firma barata de los archivos de
+    origen; si no coincide con la de la entrada, se recarga.
+    """
+
+    def __init__(self):
+        self._versions = defaultdict(int)
+        self._entries = {}
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+
+    def version(self, campaign_id):
+        with self._lock:
+            return self._versions[campaign_id]
+
+    def bump(self, campaign_id):
+        with self._lock:
+            self._versions[campaign_id] += 1
+            self._entries.pop(campaign_id, None)
+
+    def handle_change(self, campaign_id, collection, record_id, record):
+        # Listener de FileService: en 'campaigns' el ID del registro es la campaña
+        self.bump(record_id if collection == "campaigns" else campaign_id)
+
+    def get(self, campaign_id, loader, stamp=None):
+        """Contexto vigente de la campaña; lo construye con loader() si hace falta.
+
+        loader devuelve un dict (o None si la campaña no existe). Al dict se le
+        añade 'version' y 'prompts', un memo para los system prompts derivados.
+        """
+        with self._lock:
+            version = self._versions[campaign_id]
+            entry = self._entries.get(campaign_id)
+            if entry is not None and entry['version'] == version and entry['stamp'] == stamp:
+                self.hits += 1
+                return entry
+            self.misses += 1
+
+        # La versión se lee antes de cargar: si hay una escritura durante la
+        # carga, la entrada nace ya obsoleta y se recarga en la siguiente llamada
+        entry = loader()
+        if entry is None:
+            return None
+        entry['version'] = version
+        entry['stamp'] = stamp
+        entry['prompts'] = {}
+        with self._lock:
+            if self._versions[campaign_id] == version:
+                self._entries[campaign_id] = entry
+        return entry
+
+    def stats(self):
+        with self._lock:
+            return {"hits": self.hits, "misses": self.misses, "campaigns": len(self._entries)}
@@ -0,0 +1,179 @@
+import threading
+import time
+from collections import OrderedDict, defaultdict
+
+from services.search_service import fold
+
+DEFAULT_RESPONSE_TTL_SECONDS = 10 * 60
+DEFAULT_MAX_RESPONSES = 500
+DEFAULT_MAX_RESPONSE_BYTES = 8 * 1024 * 1024
+
+# Lo que espera un seguidor a que termine la llamada que comparte
+FLIGHT_TIMEOUT_SECONDS = 120
+
+_TRAILING_PUNCTUATION = " ?¿!¡.,;:"
+
+
+def normalize_query(query):
+    """Forma canónica de una pregunta: sin mayúsculas, acentos, espacios repetidos ni signos finales."""
+    return ' '.join(fold(query or '').split()).strip(_TRAILING_PUNCTUATION)
+
+
+class Flight:
+    """Llamada al modelo en curso; los seguidores esperan su resultado."""
+
+    def __init__(self):
+        self.done = threading.Event()
+        self.value = None
+        self.error = None
+
+    def wait(self, timeout=FLIGHT_TIMEOUT_SECONDS):
+        """Resultado del líder (None si no terminó a tiempo); relanza su error."""
+        if not self.done.wait(timeout):
+            return None
+        if self.error is not None:
+            raise self.error
+        return self.value
+
+
+class ResponseCache:
+    """Respuestas del chat por (campaña, versión del contexto, modo, sesión,
+    estado de la conversación, pregunta normalizada).
+
+    Las entradas caducan a los 'ttl_seconds' y, si se supera 'max_entries' o
+    'max_bytes', salen las usadas hace más tiempo. La versión del contexto es
+    la firma del almacenamiento de la campaña: cualquier escritura (en este
+    worker o en otro) deja de coincidir con las claves anteriores.
+
+    Single-flight: si llega una pregunta idéntica mientras otra está en
+    curso, espera a esa llamada en lugar de hacer la suya. El primer
+    elemento de la clave debe ser la campaña (estadísticas y borrados).
+    """
+
+    def __init__(self, ttl_seconds=DEFAULT_RESPONSE_TTL_SECONDS, max_entries=DEFAULT_MAX_RESPONSES, max_bytes=DEFAULT_MAX_RESPONSE_BYTES):
+        self.ttl_seconds = ttl_seconds
+        self.max_entries = max_entries
+        self.max_bytes = max_bytes
+        self._entries = OrderedDict()
+        self._bytes = 0
+        self._flights = {}
+        self._lock = threading.Lock()
+        self._stats = defaultdict(lambda: {"hits": 0, "misses": 0, "coalesced": 0, "bypassed": 0})
+
+    # --- Entradas ---
+
+    def _drop(self, key):
+        _, _, size = self._entries.pop(key)
+        self._bytes -= size
+
+    def _store(self, key, value):
+        if key in self._entries:
+            self._drop(key)
+        size = len(value.encode('utf-8'))
+        self._entries[key] = (time.monotonic() + self.ttl_seconds, value, size)
+        self._bytes += size
+        while self._entries and (len(self._entries) > self.max_entries or self._bytes > self.max_bytes):
+            self._drop(next(iter(self._entries)))
+
+    def _get(self, key):
+        entry = self._entries.get(key)
+        if entry is None:
+            return None
+        if entry[0] < time.monotonic():
+            self._drop(key)
+            return None
+        self._entries.move_to_end(key)
+        return entry[1]
+
+    # --- Single-flight ---
+
+    def claim(self, key, fresh=False):
+        """('hit', texto), ('follow', flight) o ('lead', flight).
+
+        Quien recibe 'lead' hace la llamada y debe terminar con complete() o
+        abandon(). Con fresh=True no se lee la caché ni se espera a nadie,
+        pero la respuesta nueva sí se guarda.
+        """
+        with self._lock:
+            stats = self._stats[key[0]]
+            if not fresh:
+                value = self._get(key)
+                if value is not None:
+                    stats["hits"] += 1
+                    return "hit", value
+                flight = self._flights.get(key)
+                if flight is not None:
+                    stats["coalesced"] += 1
+                    return "follow", flight
+            stats["bypassed" if fresh else "misses"] += 1
+            flight = Flight()
+            if not fresh:
+                self._flights[key] = flight
+            return "lead", flight
+
+    def complete(self, key, flight, value):
+        """El líder publica la respuesta (None: nada que guardar, p. ej. campaña inexistente)."""
+        with self._lock:
+            if self._flights.get(key) is flight:
+                del self._flights[key]
+            if value and self.ttl_seconds > 0:
+                self._store(key, value)
+        flight.value = value
+        flight.done.set()
+
+    def abandon(self, key, flight, error=None):
+        with self._lock:
+            if self._flights.get(key) is flight:
+                del self._flights[key]
+        flight.error = error
+        flight.done.set()
+
+    def fetch(self, key, compute, fresh=False):
+        """(valor, origen) con origen 'hit', 'coalesced', 'miss' o 'bypass'."""
+        state, payload = self.claim(key, fresh)
+        if state == "hit":
+            return payload, "hit"
+        if state == "follow":
+            value = payload.wait()
+            if value is not None:
+                return value, "coalesced"
+            # El líder no terminó a tiempo o no había nada que compartir
+            return compute(), "miss"
+        try:
+            value = compute()
+        except Exception as e:
+            self.abandon(key, payload, e)
+            raise
+        self.complete(key, payload, value)
+        return value, "bypass" if fresh else "miss"
+
+    # --- Mantenimiento y métricas ---
+
+    def discard_campaign(self, campaign_id):
+        with self._lock:
+            for key in [k for k in self._entries if k[0] == campaign_id]:
+                self._drop(key)
+
+    def handle_change(self, campaign_id, collection, record_id, record):
+        # Las claves viejas ya no coinciden; se sueltan para no ocupar sitio
+        self.discard_campaign(record_id if collection == "campaigns" else campaign_id)
+        if collection == "campaigns" and record is None:
+            with self._lock:
+                self._stats.pop(record_id, None)
+
+    def stats(self, campaign_id=None):
+        """Aciertos por campaña (o totales): hit_rate cuenta también las peticiones coalescidas."""
+        with self._lock:
+            if campaign_id is not None:
+                counters = dict(self._stats.get(campaign_id) or {"hits": 0, "misses": 0, "coalesced": 0, "bypassed": 0})
+                counters["entries"] = sum(1 for k in self._entries if k[0] == campaign_id)
+            else:
+                counters = {"hits": 0, "misses": 0, "coalesced": 0, "bypassed": 0}
+                for campaign_stats in self._stats.values():
+                    for name, value in campaign_stats.items():
+                        counters[name] += value
+                counters["entries"] = len(self._entries)
+                counters["bytes"] = self._bytes
+        total = counters["hits"] + counters["misses"] + counters["coalesced"] + counters["bypassed"]
+        counters["hit_rate"] = round((counters["hits"] + counters["coalesced"]) / total, 3) if total else 0.0
+        return counters
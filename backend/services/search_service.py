@@ -0,0 +1,371 @@
+import bisect
+import math
+import os
+import re
+import tempfile
+import threading
+import unicodedata
+from collections import Counter
+from contextlib import nullcontext
+
+from services import serializer
+
+SEARCH_SNAPSHOT_FILENAME = "_search_index.json"
+SEARCH_LOG_FILENAME = "_search_log.jsonl"
+SEARCH_INDEX_VERSION = 1
+
+# Entradas del log a partir de las cuales se reescribe el snapshot
+COMPACT_AFTER = 500
+
+# Parámetros BM25
+BM25_K1 = 1.2
+BM25_B = 0.75
+
+SESSION_FIELDS = ('title', 'summary', 'notes', 'recap')
+
+STOPWORDS = {
+    'a', 'al', 'algo', 'con', 'como', 'de', 'del', 'el', 'ella', 'en', 'era', 'es',
+    'esa', 'ese', 'eso', 'esta', 'este', 'esto', 'fue', 'ha', 'la', 'las', 'le', 'les',
+    'lo', 'los', 'mas', 'me', 'mi', 'muy', 'no', 'o', 'para', 'pero', 'por', 'que',
+    'se', 'si', 'sin', 'su', 'sus', 'te', 'tu', 'un', 'una', 'uno', 'unos', 'unas', 'y', 'ya',
+    'the', 'of', 'and', 'to', 'in', 'is',
+}
+
+_TOKEN_RE = re.compile(r"\w+")
+
+
+def fold(text):
+    """Minúsculas y sin acentos: 'Dragón' -> 'dragon', 'Ñandú' -> 'nandu'."""
+    decomposed = unicodedata.normalize('NFKD', text.casefold())
+    return ''.join(c for c in decomposed if not unicodedata.combining(c))
+
+
+def tokenize(text):
+    return [t for t in _TOKEN_RE.findall(fold(text)) if len(t) > 1 and t not in STOPWORDS]
+
+
+def _collect_text(value, out):
+    if isinstance(value, str):
+        out.append(value)
+    elif isinstance(value, dict):
+        for v in value.values():
+            _collect_text(v, out)
+    elif isinstance(value, list):
+        for v in value:
+            _collect_text(v, out)
+
+
+def _stat_key(path):
+    try:
+        st = os.stat(path)
+    except FileNotFoundError:
+        return None
+    return st.st_mtime_ns, st.st_size
+
+
+def document_for(collection, record):
+    """Documento indexable (metadatos + frecuencias de términos) de un registro."""
+    parts = []
+    if collection == "vault":
+        content = record.get('content') or {}
+        _collect_text(content, parts)
+        _collect_text(record.get('tags') or [], parts)
+        label = content.get('name') or content.get('title') or (content.get('description') or '')[:60] or "Sin nombre"
+        meta = {"type": record.get('type')}
+    else:
+        for field in SESSION_FIELDS:
+            _collect_text(record.get(field) or '', parts)
+        label = f"Sesión {record.get('number', '?')}: {record.get('title') or 'Sin título'}"
+        meta = {"number": record.get('number')}
+
+    tf = Counter(tokenize(' '.join(parts)))
+    return {
+        "kind": collection,
+        "id": record['id'],
+        "label": label,
+        "meta": meta,
+        "len": sum(tf.values()),
+        "tf": dict(tf),
+    }
+
+
+class CampaignSearchIndex:
+    """Índice invertido de una campaña, persistido como snapshot + log de cambios.
+
+    En memoria: postings {término: {doc_key: tf}} y docs {doc_key: doc}.
+    En disco: el snapshot guarda ambos; cada alta/baja se añade como una
+    línea al log, que se compacta en el snapshot cada COMPACT_AFTER entradas.
+
+    Con varios workers cada proceso tiene su copia en memoria: 'locker'
+    (p. ej. FileService.locked) serializa las escrituras entre procesos y
+    refresh() recarga si el snapshot o el log cambiaron desde lo último visto.
+    """
+
+    def __init__(self, campaign_path, locker=None):
+        self.campaign_path = campaign_path
+        self.locker = locker or (lambda path: nullcontext())
+        self.snapshot_path = os.path.join(campaign_path, SEARCH_SNAPSHOT_FILENAME)
+        self.log_path = os.path.join(campaign_path, SEARCH_LOG_FILENAME)
+        self.docs = {}
+        self.postings = {}
+        self.total_len = 0
+        self.log_entries = 0
+        self._vocabulary = None
+        self._seen = None
+        self.lock = threading.RLock()
+
+    # --- Carga y persistencia ---
+
+    def load(self):
+        """Carga snapshot + log. Devuelve False si no hay snapshot utilizable."""
+        try:
+            with open(self.snapshot_path, 'rb') as f:
+                snapshot = serializer.loads(f.read())
+        except (FileNotFoundError, ValueError):
+            return False
+        if snapshot.get('version') != SEARCH_INDEX_VERSION:
+            return False
+
+        self.docs = snapshot['docs']
+        self.postings = snapshot['postings']
+        self.total_len = sum(d['len'] for d in self.docs.values())
+        self._vocabulary = None
+        self.log_entries = 0
+
+        if os.path.exists(self.log_path):
+            with open(self.log_path, 'rb') as f:
+                for line in f:
+                    try:
+                        entry = serializer.loads(line)
+                    except ValueError:
+                        # Última línea a medias tras un corte: se ignora
+                        continue
+                    if entry['op'] == 'put':
+                        self._put(entry['key'], entry['doc'])
+                    else:
+                        self._delete(entry['key'])
+                    self.log_entries += 1
+        self._seen = self._disk_state()
+        return True
+
+    def _disk_state(self):
+        return _stat_key(self.snapshot_path), _stat_key(self.log_path)
+
+    def _refresh(self):
+        if self._seen is not None and self._disk_state() != self._seen:
+            self.load()
+
+    def refresh(self):
+        """Recarga si otro proceso ha escrito en el índice desde la última vez."""
+        with self.lock:
+            if self._seen is None or self._disk_state() == self._seen:
+                return
+            with self.locker(self.log_path):
+                self._refresh()
+
+    def write_snapshot(self):
+        data = {"version": SEARCH_INDEX_VERSION, "docs": self.docs, "postings": self.postings}
+        fd, tmp_path = tempfile.mkstemp(dir=self.campaign_path, prefix=".tmp_", suffix=".json")
+        try:
+            with os.fdopen(fd, 'wb') as f:
+                f.write(serializer.dumps(data))
+            os.replace(tmp_path, self.snapshot_path)
+        except BaseException:
+            if os.path.exists(tmp_path):
+                os.remove(tmp_path)
+            raise
+        if os.path.exists(self.log_path):
+            os.remove(self.log_path)
+        self.log_entries = 0
+        self._seen = self._disk_state()
+
+    def _append_log(self, entry):
+        with open(self.log_path, 'ab') as f:
+            f.write(serializer.dumps(entry) + b"\n")
+        self.log_entries += 1
+        if self.log_entries >= COMPACT_AFTER:
+            self.write_snapshot()
+        else:
+            self._seen = self._disk_state()
+
+    # --- Mutaciones ---
+
+    def _put(self, key, doc):
+        self._delete(key)
+        self.docs[key] = doc
+        self.total_len += doc['len']
+        for term, count in doc['tf'].items():
+            posting = self.postings.get(term)
+            if posting is None:
+                posting = self.postings[term] = {}
+                self._vocabulary = None
+            posting[key] = count
+
+    def _delete(self, key):
+        doc = self.docs.pop(key, None)
+        if not doc:
+            return
+        self.total_len -= doc['len']
+        for term in doc['tf']:
+            posting = self.postings.get(term)
+            if posting is None:
+                continue
+            posting.pop(key, None)
+            if not posting:
+                del self.postings[term]
+                self._vocabulary = None
+
+    def put(self, key, doc):
+        with self.lock, self.locker(self.log_path):
+            # Primero lo que hayan escrito otros procesos, para no pisarlo al compactar
+            self._refresh()
+            self._put(key, doc)
+            self._append_log({"op": "put", "key": key, "doc": doc})
+
+    def delete(self, key):
+        with self.lock, self.locker(self.log_path):
+            self._refresh()
+            if key not in self.docs:
+                return
+            self._delete(key)
+            self._append_log({"op": "del", "key": key})
+
+    def rebuild(self, documents):
+        with self.lock, self.locker(self.log_path):
+            self.docs = {}
+            self.postings = {}
+            self.total_len = 0
+            self._vocabulary = None
+            for key, doc in documents.items():
+                self._put(key, doc)
+            self.write_snapshot()
+
+    # --- Consultas ---
+
+    def _expand(self, term):
+        """Términos del vocabulario que empiezan por 'term' (búsqueda mientras se escribe)."""
+        if self._vocabulary is None:
+            self._vocabulary = sorted(self.postings)
+        vocabulary = self._vocabulary
+        position = bisect.bisect_left(vocabulary, term)
+        matches = []
+        while position < len(vocabulary) and vocabulary[position].startswith(term):
+            matches.append(vocabulary[position])
+            position += 1
+        return matches
+
+    def search(self, query, limit=20, kinds=None):
+        terms = tokenize(query)
+        if not terms:
+            return []
+
+        with self.lock:
+            n_docs = len(self.docs)
+            if not n_docs:
+                return []
+            avg_len = self.total_len / n_docs or 1
+
+            scores = Counter()
+            for position, term in enumerate(terms):
+                # El último término se trata como prefijo
+                expanded = self._expand(term) if position == len(terms) - 1 else [term]
+                for candidate in expanded:
+                    posting = self.postings.get(candidate)
+                    if not posting:
+                        continue
+                    idf = math.log(1 + (n_docs - len(posting) + 0.5) / (len(posting) + 0.5))
+                    for key, tf in posting.items():
+                        doc_len = self.docs[key]['len']
+                        norm = tf + BM25_K1 * (1 - BM25_B + BM25_B * doc_len / avg_len)
+                        scores[key] += idf * tf * (BM25_K1 + 1) / norm
+
+            results = []
+            for key, score in scores.most_common():
+                doc = self.docs[key]
+                if kinds and doc['kind'] not in kinds:
+                    continue
+                results.append({
+                    "id": doc['id'],
+                    "kind": doc['kind'],
+                    "label": doc['label'],
+                    **doc['meta'],
+                    "score": round(score, 4),
+                })
+                if len(results) >= limit:
+                    break
+            return results
+
+
+class SearchService:
+    """Índices de búsqueda por campaña, cargados bajo demanda y mantenidos vía FileService.subscribe."""
+
+    def __init__(self, file_service):
+        self.file_service = file_service
+        self._indexes = {}
+        self._lock = threading.Lock()
+
+    def _documents(self, campaign_id):
+        documents = {}
+        for collection in ("vault", "sessions"):
+            for record in self.file_service.load_records(campaign_id, collection).values():
+                documents[f"{collection}:{record['id']}"] = document_for(collection, record)
+        return documents
+
+    def get_index(self, campaign_id):
+        """Índice de la campaña (None si no existe la campaña)."""
+        with self._lock:
+            index = self._indexes.get(campaign_id)
+        if index:
+            return index
+
+        if not self.file_service.campaign_exists(campaign_id):
+            return None
+        campaign_path = self.file_service._get_campaign_path(campaign_id)
+        # Con SQLite el directorio solo guarda artefactos derivados: puede faltar tras un import
+        os.makedirs(campaign_path, exist_ok=True)
+
+        index = CampaignSearchIndex(campaign_path, locker=self.file_service.locked)
+        with index.lock:
+            with index.locker(index.log_path):
+                loaded = index.load()
+            if not loaded:
+                index.rebuild(self._documents(campaign_id))
+        with self._lock:
+            return self._indexes.setdefault(campaign_id, index)
+
+    def rebuild(self, campaign_id):
+        index = self.get_index(campaign_id)
+        if index:
+            index.rebuild(self._documents(campaign_id))
+        return index
+
+    def handle_change(self, campaign_id, collection, record_id, record):
+        if collection == "campaigns":
+            if record is None:
+                with self._lock:
+                    self._indexes.pop(record_id, None)
+            return
+
+        with self._lock:
+            index = self._indexes.get(campaign_id)
+        # Si el índice no está cargado, se reconstruirá al cargarlo si hace falta;
+        # pero si existe en disco hay que mantenerlo al día, así que se carga.
+        if index is None:
+            if not os.path.exists(os.path.join(self.file_service._get_campaign_path(campaign_id), SEARCH_SNAPSHOT_FILENAME)):
+                return
+            index = self.get_index(campaign_id)
+            if index is None:
+                return
+
+        key = f"{collection}:{record_id}"
+        if record is None:
+            index.delete(key)
+        else:
+            index.put(key, document_for(collection, record))
+
+    def search(self, campaign_id, query, limit=20, kinds=None):
+        index = self.get_index(campaign_id)
+        if index is None:
+            return None
+        index.refresh()
+        return index.search(query, limit=limit, kinds=kinds)
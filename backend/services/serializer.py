@@ -0,0 +1,66 @@
+"""Serialización JSON de documentos y respuestas.
+
+Usa orjson si está instalado y, si no, json de la stdlib. Las dos dan el
+mismo formato, salvo detalles como '1e20' frente a '1e+20', y leen lo que
+escribió la otra. dumps() devuelve bytes UTF-8, sin escapes \\uXXXX de los
+acentos:
+  pretty=True   indentado a 2 espacios; lo cómodo para leerlo a mano o desde la IA
+  pretty=False  compacto, sin espacios; menos bytes y, con la stdlib, el doble de rápido
+"""
+import json
+
+try:
+    import orjson
+except ImportError:  # Opcional: sin él se usa json de la stdlib (mismo formato, más lento)
+    orjson = None
+
+# Formatos de los documentos en disco (STORAGE_FORMAT)
+STORAGE_FORMATS = ('pretty', 'compact')
+
+
+def _stdlib_dumps(data, pretty=False, default=None):
+    if pretty:
+        text = json.dumps(data, indent=2, ensure_ascii=False, default=default)
+    else:
+        text = json.dumps(data, ensure_ascii=False, separators=(',', ':'), default=default)
+    return text.encode('utf-8')
+
+
+def _stdlib_loads(raw):
+    return json.loads(raw)
+
+
+if orjson is not None:
+    # Fechas, dataclasses y subclases de str van a 'default', como con la stdlib
+    _ORJSON_OPTIONS = (orjson.OPT_NON_STR_KEYS | orjson.OPT_PASSTHROUGH_DATETIME
+                       | orjson.OPT_PASSTHROUGH_DATACLASS | orjson.OPT_PASSTHROUGH_SUBCLASS)
+
+    def _orjson_dumps(data, pretty=False, default=None):
+        option = _ORJSON_OPTIONS | orjson.OPT_INDENT_2 if pretty else _ORJSON_OPTIONS
+        try:
+            return orjson.dumps(data, default=default, option=option)
+        except orjson.JSONEncodeError:
+            # Enteros de más de 64 bits y otros casos que orjson no admite
+            return _stdlib_dumps(data, pretty, default)
+
+    def _orjson_loads(raw):
+        return orjson.loads(raw)
+
+
+# nombre -> (dumps, loads)
+BACKENDS = {"json": (_stdlib_dumps, _stdlib_loads)}
+if orjson is not None:
+    BACKENDS["orjson"] = (_orjson_dumps, _orjson_loads)
+
+BACKEND = "orjson" if orjson is not None else "json"
+_dumps, _loads = BACKENDS[BACKEND]
+
+
+def dumps(data, pretty=False, default=None):
+    """'data' en JSON (bytes UTF-8). 'default' convierte lo que no sea JSON, como en json.dumps."""
+    return _dumps(data, pretty, default)
+
+
+def loads(raw):
+    """JSON (bytes o str) a objetos de Python. Lanza ValueError si no es JSON válido."""
+    return _loads(raw)
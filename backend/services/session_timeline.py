@@ -0,0 +1,141 @@
+import threading
+
+from services.summary_queue import auto_summary
+
+# Sesiones completadas cuyo resumen entra en la memoria rodante del prompt
+DEFAULT_ROLLING_MEMORY_SESSIONS = 3
+
+TIMELINE_FIELDS = ('id', 'number', 'title', 'status', 'date', 'summary')
+
+
+class SessionTimeline:
+    """Resumen ordenado de las sesiones de una campaña.
+
+    Solo los campos que necesitan la memoria rodante, la numeración y la
+    Bitácora (sin notas, items enlazados ni snapshots de frentes). Si la
+    sesión no tiene resumen escrito se usa el automático ('summary_auto').
+    """
+
+    def __init__(self, sessions=()):
+        self._set_entries({session.get('id'): self._entry(session) for session in sessions})
+
+    def _set_entries(self, by_id):
+        self._by_id = by_id
+        self.entries = sorted(by_id.values(), key=lambda entry: entry['number'] or 0)
+        self.next_number = (self.entries[-1]['number'] or 0) + 1 if self.entries else 1
+
+    def updated(self, changes):
+        """Copia con [(id, sesión o None)] aplicados: esta puede estar en uso por otro request."""
+        by_id = dict(self._by_id)
+        for record_id, session in changes:
+            if session is None:
+                by_id.pop(record_id, None)
+            else:
+                by_id[record_id] = self._entry(session)
+        timeline = SessionTimeline()
+        timeline._set_entries(by_id)
+        return timeline
+
+    @staticmethod
+    def _entry(session):
+        entry = {field: session.get(field) for field in TIMELINE_FIELDS}
+        entry['summary_auto'] = False
+        if not entry['summary']:
+            generated = auto_summary(session, "session")
+            if generated:
+                entry['summary'] = generated
+                entry['summary_auto'] = True
+        return entry
+
+    def completed(self, limit=None, with_summary=False):
+        """Sesiones completadas en orden cronológico (las 'limit' más recientes)."""
+        entries = [
+            e for e in self.entries
+            if e['status'] == 'completed' and (e['summary'] or not with_summary)
+        ]
+        return entries[-limit:] if limit else entries
+
+    def to_dict(self, status=None):
+        entries = self.entries if status is None else [e for e in self.entries if e['status'] == status]
+        return {"sessions": entries, "next_number": self.next_number}
+
+
+def _marker(record):
+    """Lo que identifica una versión concreta de la sesión en el manifiesto."""
+    return record.get('version'), record.get('digest')
+
+
+def _up_to_date(known, record):
+    if known is None:
+        return False
+    # Aplicada por el listener: el digest del manifiesto no se conoce aún
+    if known[1] is None:
+        return known[0] == record.get('version')
+    return known == _marker(record)
+
+
+class SessionTimelineCache:
+    """SessionTimeline por campaña, al día por cambios sueltos.
+
+    Los cambios de este worker llegan por handle_change con la sesión
+    entera y se aplican sin leer nada. Si la revisión de 'sessions'
+    (StorageEngine.collection_revision) no cuadra, se compara el manifiesto
+    con lo que ya tiene la entrada y solo se leen las sesiones que difieren
+    (las escritas por otro worker); tras un cambio propio no hay ninguna.
+    """
+
+    def __init__(self, file_service):
+        self.file_service = file_service
+        # campaign_id -> (revisión, SessionTimeline, {id: marca del manifiesto})
+        self._entries = {}
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+
+    def get(self, campaign_id):
+        # La revisión se lee antes del manifiesto: si cambia entre medias,
+        # la entrada queda obsoleta y se revisa en la siguiente llamada
+        revision = self.file_service.collection_revision(campaign_id, "sessions")
+        with self._lock:
+            cached = self._entries.get(campaign_id)
+            if cached and revision is not None and cached[0] == revision:
+                self.hits += 1
+                return cached[1]
+            self.misses += 1
+
+        records = self.file_service.read_manifest(campaign_id, "sessions")
+        timeline, markers = (cached[1], cached[2]) if cached else (SessionTimeline(), {})
+        stale = [record_id for record_id, record in records.items() if not _up_to_date(markers.get(record_id), record)]
+        loaded = self.file_service.load_records(campaign_id, "sessions", stale) if stale else {}
+        changes = [(record_id, loaded.get(record_id)) for record_id in stale]
+        changes += [(record_id, None) for record_id in markers if record_id not in records]
+        if changes:
+            timeline = timeline.updated(changes)
+        # Una sesión que no se pudo leer queda sin marca: se reintenta la próxima vez
+        missing = set(stale) - set(loaded)
+        markers = {record_id: _marker(record) for record_id, record in records.items() if record_id not in missing}
+        with self._lock:
+            self._entries[campaign_id] = (revision, timeline, markers)
+        return timeline
+
+    def handle_change(self, campaign_id, collection, record_id, record):
+        with self._lock:
+            if collection == "campaigns" and record is None:
+                self._entries.pop(record_id, None)
+                return
+            cached = self._entries.get(campaign_id)
+            if collection != "sessions" or not cached:
+                return
+            # La revisión se deja como estaba: el próximo get() solo compara
+            # el manifiesto (en caché) con las marcas, sin leer sesiones
+            revision, timeline, markers = cached
+            markers = dict(markers)
+            if record is None:
+                markers.pop(record_id, None)
+            else:
+                markers[record_id] = (record.get('version'), None)
+            self._entries[campaign_id] = (revision, timeline.updated([(record_id, record)]), markers)
+
+    def stats(self):
+        with self._lock:
+            return {"hits": self.hits, "misses": self.misses, "campaigns": len(self._entries)}
@@ -0,0 +1,417 @@
+import os
+import shutil
+import sqlite3
+import threading
+from collections import OrderedDict
+from contextlib import contextmanager
+
+from services.storage_engine import StorageEngine, VersionConflict, listing_record
+from services.file_service import _id_from_filename
+from services.metrics import span, count
+from services import serializer
+
+DEFAULT_DB_FILENAME = "campaigns.sqlite3"
+
+# Parámetros por consulta: SQLite limita las variables ligadas (999 en versiones antiguas)
+IN_CHUNK = 500
+
+# Listados cacheados en memoria, (campaña, colección), en orden LRU
+DEFAULT_MAX_CACHED_LISTINGS = 64
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS documents (
+    campaign_id TEXT NOT NULL,
+    collection  TEXT NOT NULL,      -- 'campaigns' (metadata.json), 'vault' o 'sessions'
+    doc_id      TEXT NOT NULL,
+    filename    TEXT NOT NULL,      -- nombre en el layout de archivos (export/import)
+    type        TEXT,
+    status      TEXT,
+    number      INTEGER,
+    version     INTEGER NOT NULL DEFAULT 0,
+    content     TEXT,               -- JSON: 'content' de los items del vault
+    data        TEXT NOT NULL,      -- JSON: resto del documento
+    PRIMARY KEY (campaign_id, collection, doc_id)
+) WITHOUT ROWID;
+CREATE UNIQUE INDEX IF NOT EXISTS documents_filename ON documents (campaign_id, collection, filename);
+-- type/status/number se guardan para consultas a mano, pero los filtros de
+-- los listados se aplican en Python sobre el listado cacheado, igual que con
+-- los manifiestos de archivos: índices sobre ellas solo encarecían escribir
+DROP INDEX IF EXISTS documents_type;
+DROP INDEX IF EXISTS documents_status;
+DROP INDEX IF EXISTS documents_session_number;
+
+-- Contador por (campaña, colección): sustituye a los mtime de los manifiestos
+-- para que las cachés de cada proceso sepan si otro ha escrito.
+CREATE TABLE IF NOT EXISTS revisions (
+    campaign_id TEXT NOT NULL,
+    collection  TEXT NOT NULL,
+    revision    INTEGER NOT NULL,
+    PRIMARY KEY (campaign_id, collection)
+) WITHOUT ROWID;
+"""
+
+# Clave de revisión del listado global de campañas
+ALL_CAMPAIGNS = ""
+
+
+class SqliteStorage(StorageEngine):
+    """Motor SQLite embebido (WAL): mismos documentos, en una sola base de datos.
+
+    Las rutas de archivo que usan los endpoints se traducen a
+    (campaña, colección, id); el directorio de cada campaña se sigue creando
+    para los artefactos derivados (índice de búsqueda, locks).
+    """
+
+    def __init__(self, storage_path, db_path=None, fsync_mode='none', max_cached_listings=DEFAULT_MAX_CACHED_LISTINGS):
+        super().__init__(storage_path)
+        os.makedirs(storage_path, exist_ok=True)
+        self.db_path = db_path or os.path.join(storage_path, DEFAULT_DB_FILENAME)
+        # En WAL, NORMAL no corrompe ante un corte pero puede perder la última
+        # transacción; 'always' pide la misma durabilidad que el motor de archivos
+        self.synchronous = 'FULL' if fsync_mode == 'always' else 'NORMAL'
+        self._local = threading.local()
+        self._connections = []
+        self._connections_lock = threading.Lock()
+        # Listados cacheados por (campaña, colección): (revisión, {id: registro de listado}).
+        # Solo los registros de listado; los documentos completos se consultan cada vez
+        self.max_cached_listings = max_cached_listings
+        self._manifests = OrderedDict()
+        self._manifests_lock = threading.Lock()
+        self.manifest_hits = 0
+        self.manifest_misses = 0
+
+        # executescript hace su propio COMMIT: fuera de _transaction
+        self._db().executescript(SCHEMA)
+
+    # --- Conexiones y transacciones ---
+
+    def _db(self):
+        db = getattr(self._local, 'db', None)
+        if db is None:
+            db = sqlite3.connect(self.db_path, timeout=30, isolation_level=None, check_same_thread=False)
+            db.execute("PRAGMA journal_mode=WAL")
+            db.execute(f"PRAGMA synchronous={self.synchronous}")
+            self._local.db = db
+            with self._connections_lock:
+                self._connections.append(db)
+        return db
+
+    @contextmanager
+    def _transaction(self):
+        """BEGIN IMMEDIATE: toma el lock de escritura al empezar, sin upgrades a medias."""
+        db = self._db()
+        db.execute("BEGIN IMMEDIATE")
+        try:
+            yield db
+        except BaseException:
+            db.execute("ROLLBACK")
+            raise
+        db.execute("COMMIT")
+
+    def close(self):
+        with self._connections_lock:
+            connections, self._connections = self._connections, []
+        for db in connections:
+            try:
+                db.close()
+            except sqlite3.ProgrammingError:
+                # Conexión de otro hilo todavía en uso: la cierra el GC
+                pass
+        self._local = threading.local()
+        super().close()
+
+    # --- Rutas <-> claves ---
+
+    def _key(self, path):
+        """(campaign_id, collection, doc_id, filename) para una ruta de documento."""
+        parts = os.path.relpath(path, self.storage_path).split(os.sep)
+        if not parts[0].startswith("campaign_"):
+            raise ValueError(f"Not a campaign document: {path}")
+        campaign_id = parts[0][len("campaign_"):]
+        if parts[1:] == ["metadata.json"]:
+            return campaign_id, "campaigns", campaign_id, "metadata.json"
+        if len(parts) == 3 and parts[1] in ("vault", "sessions"):
+            doc_id = _id_from_filename(parts[2])
+            if doc_id:
+                return campaign_id, parts[1], doc_id, parts[2]
+        raise ValueError(f"Not a campaign document: {path}")
+
+    def _path(self, campaign_id, collection, filename):
+        if collection == "campaigns":
+            return os.path.join(self._get_campaign_path(campaign_id), filename)
+        return os.path.join(self._get_collection_path(campaign_id, collection), filename)
+
+    @staticmethod
+    def _row_to_doc(content, data):
+        doc = serializer.loads(data)
+        if content is not None:
+            doc['content'] = serializer.loads(content)
+        return doc
+
+    @staticmethod
+    def _bump(db, campaign_id, collection):
+        keys = [(campaign_id, collection)]
+        if collection == "campaigns":
+            keys.append((ALL_CAMPAIGNS, "campaigns"))
+        for key in keys:
+            db.execute(
+                "INSERT INTO revisions (campaign_id, collection, revision) VALUES (?, ?, 1) "
+                "ON CONFLICT (campaign_id, collection) DO UPDATE SET revision = revision + 1",
+                key,
+            )
+
+    def _write(self, db, path, data):
+        campaign_id, collection, doc_id, filename = self._key(path)
+        body = dict(data)
+        content = body.pop('content', None) if collection == "vault" else None
+        # Como TEXT (no BLOB): la columna se puede consultar con las funciones JSON de SQLite
+        content_json = serializer.dumps(content).decode('utf-8') if content is not None else None
+        body_json = serializer.dumps(body).decode('utf-8')
+        count("bytes_written", len(body_json) + len(content_json or ''))
+        db.execute(
+            "INSERT OR REPLACE INTO documents "
+            "(campaign_id, collection, doc_id, filename, type, status, number, version, content, data) "
+            "VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?)",
+            (
+                campaign_id, collection, doc_id, filename,
+                body.get('type'), body.get('status'), body.get('number'), body.get('version', 0),
+                content_json, body_json,
+            ),
+        )
+        self._bump(db, campaign_id, collection)
+
+    # --- Documentos ---
+
+    def load_json(self, path, readonly=False):
+        try:
+            campaign_id, collection, doc_id, _ = self._key(path)
+        except ValueError:
+            return None
+        with span("storage.read"):
+            row = self._db().execute(
+                "SELECT content, data FROM documents WHERE campaign_id = ? AND collection = ? AND doc_id = ?",
+                (campaign_id, collection, doc_id),
+            ).fetchone()
+            if row is None:
+                return None
+            doc = self._row_to_doc(*row)
+        count("files_read")
+        count("bytes_parsed", len(row[1]) + len(row[0] or ''))
+        return doc
+
+    def save_json(self, path, data):
+        with span("storage.write"), self._transaction() as db:
+            self._write(db, path, data)
+
+    def update_json(self, path, mutate, expected_version=None, bump_version=True):
+        # La transacción hace de lock entre hilos y procesos
+        with self._transaction() as db:
+            doc = self.load_json(path)
+            if doc is None:
+                return None
+            if expected_version is not None and doc.get('version', 0) != expected_version:
+                raise VersionConflict(doc)
+            if mutate(doc) is False:
+                return doc
+            if bump_version:
+                doc['version'] = doc.get('version', 0) + 1
+            self._write(db, path, doc)
+            return doc
+
+    def remove_file(self, path):
+        with self._transaction() as db:
+            self._delete(db, path)
+
+    def trash_file(self, path):
+        # La transacción hace de lock, como en update_json: nadie reescribe
+        # el documento entre la copia y el borrado
+        with self._transaction() as db:
+            self._copy_to_trash(path, self.read_raw(path))
+            self._delete(db, path)
+
+    def _delete(self, db, path):
+        campaign_id, collection, doc_id, _ = self._key(path)
+        db.execute(
+            "DELETE FROM documents WHERE campaign_id = ? AND collection = ? AND doc_id = ?",
+            (campaign_id, collection, doc_id),
+        )
+        self._bump(db, campaign_id, collection)
+
+    def find_file(self, campaign_id, collection, item_id):
+        return self.find_files(campaign_id, collection, [item_id])[item_id]
+
+    def find_files(self, campaign_id, collection, item_ids):
+        item_ids = list(item_ids)
+        found = {}
+        db = self._db()
+        for start in range(0, len(item_ids), IN_CHUNK):
+            chunk = item_ids[start:start + IN_CHUNK]
+            rows = db.execute(
+                f"SELECT doc_id, filename FROM documents WHERE campaign_id = ? AND collection = ? "
+                f"AND doc_id IN ({','.join('?' * len(chunk))})",
+                [campaign_id, collection, *chunk],
+            )
+            for doc_id, filename in rows:
+                found[doc_id] = self._path(campaign_id, collection, filename)
+        return {item_id: found.get(item_id) for item_id in item_ids}
+
+    def list_ids(self, campaign_id, collection, filename_prefix=None):
+        db = self._db()
+        if filename_prefix is None:
+            rows = db.execute(
+                "SELECT doc_id FROM documents WHERE campaign_id = ? AND collection = ?",
+                (campaign_id, collection),
+            )
+        else:
+            # Comparación de rango en vez de LIKE: usa el índice y no hay que escapar '_'
+            rows = db.execute(
+                "SELECT doc_id FROM documents WHERE campaign_id = ? AND collection = ? "
+                "AND filename >= ? AND filename < ?",
+                (campaign_id, collection, filename_prefix, filename_prefix + "\uffff"),
+            )
+        return [doc_id for (doc_id,) in rows]
+
+    # --- Listados (equivalente a los manifiestos) ---
+
+    def _revision(self, campaign_id, collection):
+        row = self._db().execute(
+            "SELECT revision FROM revisions WHERE campaign_id = ? AND collection = ?",
+            (campaign_id, collection),
+        ).fetchone()
+        return row[0] if row else 0
+
+    def _query_collection(self, campaign_id, collection, ids=None):
+        """{id: documento} de la colección, o solo de 'ids', leídos de la tabla."""
+        db = self._db()
+        if collection == "campaigns":
+            where, params = "collection = 'campaigns'", []
+        else:
+            where, params = "campaign_id = ? AND collection = ?", [campaign_id, collection]
+        if ids is None:
+            batches = [db.execute(f"SELECT doc_id, content, data FROM documents WHERE {where}", params)]
+        else:
+            ids = list(ids)
+            batches = (
+                db.execute(
+                    f"SELECT doc_id, content, data FROM documents WHERE {where} "
+                    f"AND doc_id IN ({','.join('?' * len(chunk))})",
+                    [*params, *chunk],
+                )
+                for chunk in (ids[start:start + IN_CHUNK] for start in range(0, len(ids), IN_CHUNK))
+            )
+        records = {}
+        parsed = 0
+        with span("storage.query"):
+            for rows in batches:
+                for doc_id, content, data in rows:
+                    record = self._row_to_doc(content, data)
+                    if collection == "vault" and 'usage_count' not in record:
+                        record['usage_count'] = 0
+                    records[doc_id] = record
+                    parsed += len(data) + len(content or '')
+        count("files_read", len(records))
+        count("bytes_parsed", parsed)
+        return records
+
+    def _cached_listing(self, campaign_id, collection):
+        """(revisión, registros de listado) de la colección, cacheados por revisión."""
+        key = (ALL_CAMPAIGNS if collection == "campaigns" else campaign_id, collection)
+        # Revisión y consulta en la misma transacción de lectura: el listado
+        # corresponde exactamente a esa revisión
+        db = self._db()
+        own_transaction = not db.in_transaction
+        if own_transaction:
+            db.execute("BEGIN")
+        try:
+            revision = self._revision(*key)
+            with self._manifests_lock:
+                cached = self._manifests.get(key)
+                if cached and cached[0] == revision:
+                    self._manifests.move_to_end(key)
+                    self.manifest_hits += 1
+                    return cached
+                self.manifest_misses += 1
+            records = self._query_collection(campaign_id, collection)
+        finally:
+            if own_transaction:
+                db.execute("COMMIT")
+        entry = (revision, {record_id: listing_record(collection, record) for record_id, record in records.items()})
+        with self._manifests_lock:
+            self._manifests[key] = entry
+            self._manifests.move_to_end(key)
+            while len(self._manifests) > self.max_cached_listings:
+                self._manifests.popitem(last=False)
+        return entry
+
+    def read_manifest(self, campaign_id, collection):
+        return self._cached_listing(campaign_id, collection)[1]
+
+    def load_records(self, campaign_id, collection, ids=None):
+        records = self._query_collection(campaign_id, collection, ids)
+        if ids is None:
+            return records
+        return {record_id: records[record_id] for record_id in ids if record_id in records}
+
+    def collection_revision(self, campaign_id, collection):
+        # Contador que nunca retrocede (delete_campaign también lo incrementa)
+        key = (ALL_CAMPAIGNS if collection == "campaigns" else campaign_id, collection)
+        return str(self._revision(*key))
+
+    def rebuild_manifest(self, campaign_id, collection):
+        # No hay nada materializado que reconstruir: basta con olvidar la caché
+        key = (ALL_CAMPAIGNS if collection == "campaigns" else campaign_id, collection)
+        with self._manifests_lock:
+            self._manifests.pop(key, None)
+        return self.read_manifest(campaign_id, collection)
+
+    def _manifest_apply(self, campaign_id, collection, changes):
+        # Los listados salen de la propia tabla: ya están al día
+        return {record_id for record_id, _ in changes}
+
+    def campaign_exists(self, campaign_id):
+        return self._db().execute(
+            "SELECT 1 FROM documents WHERE campaign_id = ? AND collection = 'campaigns'", (campaign_id,)
+        ).fetchone() is not None
+
+    def create_campaign_structure(self, campaign_id):
+        # Solo el directorio raíz: índice de búsqueda y locks
+        base_path = self._get_campaign_path(campaign_id)
+        os.makedirs(base_path, exist_ok=True)
+        return base_path
+
+    def delete_campaign(self, campaign_id):
+        with self._transaction() as db:
+            deleted = db.execute("DELETE FROM documents WHERE campaign_id = ?", (campaign_id,)).rowcount
+            for collection in ("campaigns", "vault", "sessions"):
+                self._bump(db, campaign_id, collection)
+        path = self._get_campaign_path(campaign_id)
+        if os.path.exists(path):
+            shutil.rmtree(path)
+        if not deleted:
+            return False
+        with self._manifests_lock:
+            for collection in ("vault", "sessions"):
+                self._manifests.pop((campaign_id, collection), None)
+        self.on_deleted(None, "campaigns", campaign_id)
+        return True
+
+    def document_stamp(self, path):
+        # Revisión de su colección: cada escritura en la base la incrementa
+        try:
+            campaign_id, collection, _, _ = self._key(path)
+        except ValueError:
+            return None
+        return str(self._revision(campaign_id, collection))
+
+    def campaign_stamp(self, campaign_id):
+        return tuple(self._revision(campaign_id, c) for c in ("campaigns", "vault", "sessions"))
+
+    def cache_stats(self):
+        with self._manifests_lock:
+            return {
+                "engine": "sqlite",
+                "db_path": self.db_path,
+                "manifest_hits": self.manifest_hits,
+                "manifest_misses": self.manifest_misses,
+                "manifests": len(self._manifests),
+            }
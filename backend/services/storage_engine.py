@@ -0,0 +1,383 @@
+import errno
+import logging
+import os
+import tempfile
+import threading
+import time
+import zlib
+from contextlib import contextmanager
+
+from services import serializer
+
+try:
+    import fcntl
+except ImportError:  # Windows: solo locks entre hilos del mismo proceso
+    fcntl = None
+
+logger = logging.getLogger(__name__)
+
+STORAGE_ENGINES = ('json', 'sqlite')
+
+# Papelera común a todos los motores, en la raíz del almacenamiento: campañas
+# borradas (zip, ver campaign_archive) y documentos sueltos (JSON tal cual)
+TRASH_DIRNAME = "_trash"
+
+# Locks por archivo: repartidos en N franjas por hash del nombre. Entre
+# procesos se usa un lock de rango (fcntl.lockf) sobre el byte de la franja
+# en el archivo '.locks' del directorio. También protegen los manifiestos.
+# Cerrar cualquier descriptor de un archivo suelta TODOS los locks POSIX del
+# proceso sobre él, así que cada proceso abre '.locks' una sola vez por
+# directorio y no lo cierra mientras algún hilo tenga una franja tomada.
+LOCK_STRIPES = 256
+LOCKS_FILENAME = ".locks"
+
+
+# Campos de cada registro de los listados (manifiestos): lo necesario para
+# filtrar, ordenar y numerar sin abrir los documentos. Los textos largos
+# (content, notas, framework) se leen aparte con load_records.
+LISTING_FIELDS = {
+    "campaigns": ('id', 'title', 'active_session', 'version'),
+    "vault": ('id', 'type', 'status', 'usage_count', 'tags', 'version'),
+    "sessions": ('id', 'number', 'title', 'status', 'date', 'linked_items', 'version'),
+}
+
+
+def listing_record(collection, doc):
+    """Registro de 'doc' en el listado de la colección; en el vault, con 'name' para filtrar y ordenar."""
+    record = {field: doc[field] for field in LISTING_FIELDS[collection] if field in doc}
+    if collection == "vault":
+        record.setdefault('usage_count', 0)
+        content = doc.get('content') if isinstance(doc.get('content'), dict) else {}
+        name = content.get('name') or content.get('title') or ''
+        record['name'] = name if isinstance(name, str) else ''
+    return record
+
+
+class VersionConflict(Exception):
+    """El documento cambió desde la versión que el cliente tenía (HTTP 412)."""
+
+    def __init__(self, current):
+        super().__init__("Version conflict")
+        self.current = current
+
+
+def _lockf_exclusive(lock_file, offset):
+    """fcntl.lockf con reintento ante EDEADLK.
+
+    Los locks POSIX son del proceso, no del hilo: con varios workers con
+    hilos el kernel puede ver un ciclo que no existe (otro hilo del mismo
+    proceso tiene otra franja). Nunca anidamos locks de archivo, así que
+    basta con reintentar.
+    """
+    delay = 0.001
+    while True:
+        try:
+            fcntl.lockf(lock_file, fcntl.LOCK_EX, 1, offset, os.SEEK_SET)
+            return
+        except OSError as e:
+            if e.errno != errno.EDEADLK:
+                raise
+            time.sleep(delay)
+            delay = min(delay * 2, 0.05)
+
+
+def _copy_json(value):
+    """Copia profunda rápida para estructuras JSON (dict/list/escalares)."""
+    if isinstance(value, dict):
+        return {k: _copy_json(v) for k, v in value.items()}
+    if isinstance(value, list):
+        return [_copy_json(v) for v in value]
+    return value
+
+
+class StorageEngine:
+    """Interfaz común de los motores de almacenamiento.
+
+    Las rutas siguen hablando en términos de archivos
+    (campaign_{id}/metadata.json, vault/{type}_{id}.json,
+    sessions/session_{nn}_{id}.json): ese es el formato de referencia y cada
+    motor decide dónde guardarlos. Aquí vive lo que no depende del motor:
+    rutas, locks, read-modify-write y notificación de cambios.
+    """
+
+    def __init__(self, storage_path):
+        self.storage_path = storage_path
+        self._stripe_locks = [threading.Lock() for _ in range(LOCK_STRIPES)]
+        # directorio -> [archivo '.locks', inodo, hilos que lo usan, retirado]
+        self._lock_files = {}
+        self._lock_files_lock = threading.Lock()
+        # Callbacks de cambios (ver subscribe)
+        self._listeners = []
+        self._batch_listeners = []
+
+    def _get_campaign_path(self, campaign_id):
+        return os.path.join(self.storage_path, f"campaign_{campaign_id}")
+
+    def _get_collection_path(self, campaign_id, collection):
+        return os.path.join(self._get_campaign_path(campaign_id), collection)
+
+    def create_campaign_structure(self, campaign_id):
+        base_path = self._get_campaign_path(campaign_id)
+        os.makedirs(base_path, exist_ok=True)
+        os.makedirs(os.path.join(base_path, "vault"), exist_ok=True)
+        os.makedirs(os.path.join(base_path, "sessions"), exist_ok=True)
+        return base_path
+
+    def campaign_exists(self, campaign_id):
+        return os.path.isdir(self._get_campaign_path(campaign_id))
+
+    # --- Locks por archivo y concurrencia optimista ---
+
+    @contextmanager
+    def locked(self, path):
+        """Lock exclusivo sobre 'path' entre hilos y, si hay fcntl, entre procesos."""
+        dir_path = os.path.dirname(path)
+        # Misma franja para el lock de hilo y el byte de fcntl: los locks POSIX
+        # son por proceso, así que dos hilos nunca deben compartir byte sin
+        # compartir también el lock de hilo
+        stripe = zlib.crc32(os.path.abspath(path).encode('utf-8')) % LOCK_STRIPES
+        with self._stripe_locks[stripe]:
+            if fcntl is None or not os.path.isdir(dir_path):
+                yield
+                return
+            entry = self._acquire_lock_file(dir_path)
+            try:
+                _lockf_exclusive(entry[0], stripe)
+                try:
+                    yield
+                finally:
+                    fcntl.lockf(entry[0], fcntl.LOCK_UN, 1, stripe, os.SEEK_SET)
+            finally:
+                self._release_lock_file(entry)
+
+    def _acquire_lock_file(self, dir_path):
+        """Descriptor de '.locks' del directorio, compartido por todos los hilos del proceso."""
+        lock_path = os.path.join(dir_path, LOCKS_FILENAME)
+        with self._lock_files_lock:
+            entry = self._lock_files.get(dir_path)
+            try:
+                current_ino = os.stat(lock_path).st_ino
+            except FileNotFoundError:
+                current_ino = None
+            if entry is None or entry[1] != current_ino:
+                # Primera vez, o el directorio se borró y se volvió a crear
+                # (p. ej. una campaña restaurada): el descriptor viejo apunta a
+                # otro inodo y se cierra en cuanto nadie lo use
+                lock_file = open(lock_path, 'a+b')
+                if entry is not None:
+                    entry[3] = True
+                    if entry[2] == 0:
+                        entry[0].close()
+                entry = [lock_file, os.fstat(lock_file.fileno()).st_ino, 0, False]
+                self._lock_files[dir_path] = entry
+            entry[2] += 1
+            return entry
+
+    def _release_lock_file(self, entry):
+        with self._lock_files_lock:
+            entry[2] -= 1
+            if entry[3] and entry[2] == 0:
+                entry[0].close()
+
+    def _close_lock_files(self):
+        with self._lock_files_lock:
+            for entry in self._lock_files.values():
+                entry[0].close()
+            self._lock_files.clear()
+
+    def update_json(self, path, mutate, expected_version=None, bump_version=True):
+        """Read-modify-write atómico de un documento.
+
+        Con el lock del archivo tomado: carga, comprueba expected_version
+        (VersionConflict si no coincide), aplica mutate(doc), incrementa
+        'version' (salvo bump_version=False, para datos derivados que no
+        invalidan la copia del cliente) y guarda. Si mutate devuelve False
+        no se escribe nada. Devuelve el documento (guardado o no), o None
+        si no existe.
+        """
+        with self.locked(path):
+            doc = self.load_json(path)
+            if doc is None:
+                return None
+            if expected_version is not None and doc.get('version', 0) != expected_version:
+                raise VersionConflict(doc)
+            if mutate(doc) is False:
+                return doc
+            if bump_version:
+                doc['version'] = doc.get('version', 0) + 1
+            self.save_json(path, doc)
+            return doc
+
+    def subscribe(self, listener):
+        """Registra listener(campaign_id, collection, record_id, record) para cada cambio.
+
+        record es None en los borrados. Lo usan los índices derivados
+        (búsqueda, etc.) para actualizarse sin releer la colección.
+        """
+        self._listeners.append(listener)
+
+    def subscribe_batch(self, listener):
+        """Como subscribe, pero listener(campaign_id, collection, [(record_id, record)])
+        recibe cada lote de on_changed de una vez (p. ej. un _bulk de 1000 items).
+        """
+        self._batch_listeners.append(listener)
+
+    def on_saved(self, campaign_id, collection, record):
+        """Notifica que se ha creado o actualizado un registro de la colección."""
+        self.on_changed(campaign_id, collection, saved=[record])
+
+    def on_deleted(self, campaign_id, collection, record_id):
+        """Notifica que se ha borrado un registro de la colección."""
+        self.on_changed(campaign_id, collection, deleted=[record_id])
+
+    def on_changed(self, campaign_id, collection, saved=(), deleted=()):
+        """on_saved/on_deleted para un lote: el manifiesto se reescribe una sola vez."""
+        changes = [(record['id'], _copy_json(record)) for record in saved]
+        changes += [(record_id, None) for record_id in deleted]
+        if not changes:
+            return
+        applied = self._manifest_apply(campaign_id, collection, changes)
+        self._notify_changes(campaign_id, collection, [(record_id, record) for record_id, record in changes if record_id in applied])
+
+    def _notify_changes(self, campaign_id, collection, changes):
+        """Avisa a los listeners de [(id, registro o None)] ya reflejados en los listados."""
+        for record_id, record in changes:
+            self._notify(campaign_id, collection, record_id, record)
+        if changes:
+            for listener in self._batch_listeners:
+                listener(campaign_id, collection, changes)
+
+    def _notify(self, campaign_id, collection, record_id, record):
+        for listener in self._listeners:
+            listener(campaign_id, collection, record_id, record)
+
+    def read_raw(self, path):
+        """JSON del documento en bytes, para exportarlo. None si no existe."""
+        doc = self.load_json(path, readonly=True)
+        if doc is None:
+            return None
+        return serializer.dumps(doc, pretty=True)
+
+    def load_many(self, paths, readonly=False):
+        """Varios documentos en el orden de 'paths' (None si falta o no se puede leer)."""
+        results = []
+        for path in paths:
+            try:
+                results.append(self.load_json(path, readonly=readonly))
+            except ValueError as e:
+                logger.error("skipping unreadable document %s: %s", path, e)
+                results.append(None)
+        return results
+
+    def remove_file(self, path):
+        with self.locked(path):
+            self._remove_file(path)
+
+    def trash_file(self, path):
+        """Borrado suave de un documento: copia en _trash/ con la misma ruta relativa y lo borra.
+
+        Todo bajo el lock del documento, como update_json: una escritura
+        concurrente no puede colarse entre la copia y el borrado y resucitarlo.
+        """
+        with self.locked(path):
+            self._copy_to_trash(path, self.read_raw(path))
+            self._remove_file(path)
+
+    def _copy_to_trash(self, path, raw):
+        if raw is None:
+            return
+        trash_path = os.path.join(self.storage_path, TRASH_DIRNAME, os.path.relpath(path, self.storage_path))
+        os.makedirs(os.path.dirname(trash_path), exist_ok=True)
+        # El original solo se borra con la copia ya completa en disco
+        self._atomic_write(trash_path, raw)
+
+    def _atomic_write(self, path, raw):
+        """Escribe 'raw' en un temporal del mismo directorio y lo renombra encima."""
+        fd, tmp_path = tempfile.mkstemp(dir=os.path.dirname(path), prefix=".tmp_", suffix=".tmp")
+        try:
+            with os.fdopen(fd, 'wb') as f:
+                f.write(raw)
+                f.flush()
+                os.fsync(f.fileno())
+            os.replace(tmp_path, path)
+        except BaseException:
+            if os.path.exists(tmp_path):
+                os.remove(tmp_path)
+            raise
+
+    # --- A implementar por cada motor ---
+
+    def load_json(self, path, readonly=False):
+        """Documento en 'path' o None. readonly=True: objeto compartido, no modificar."""
+        raise NotImplementedError
+
+    def save_json(self, path, data):
+        raise NotImplementedError
+
+    def _remove_file(self, path):
+        """Borra el documento; quien llama ya tiene su lock (ver remove_file)."""
+        raise NotImplementedError
+
+    def find_file(self, campaign_id, collection, item_id):
+        """Ruta del documento 'item_id' de vault/sessions, o None."""
+        raise NotImplementedError
+
+    def find_files(self, campaign_id, collection, item_ids):
+        """{id: ruta o None} para varios IDs de una vez."""
+        raise NotImplementedError
+
+    def list_ids(self, campaign_id, collection, filename_prefix=None):
+        raise NotImplementedError
+
+    def read_manifest(self, campaign_id, collection):
+        """{id: registro de listado} de 'vault', 'sessions' o 'campaigns' (ver listing_record).
+
+        Compartido: no modificar.
+        """
+        raise NotImplementedError
+
+    def load_records(self, campaign_id, collection, ids=None):
+        """{id: documento completo} de la colección, o solo de 'ids' (en su orden).
+
+        Lo que falte se omite. Compartidos: no modificar.
+        """
+        raise NotImplementedError
+
+    def rebuild_manifest(self, campaign_id, collection):
+        raise NotImplementedError
+
+    def collection_revision(self, campaign_id, collection):
+        """Revisión actual de la colección: cambia con cada alta, baja o edición.
+
+        None si no se puede saber (sin ETag en los listados).
+        """
+        raise NotImplementedError
+
+    def _manifest_apply(self, campaign_id, collection, changes):
+        """Aplica [(id, registro o None)] a los listados; devuelve los IDs aplicados."""
+        raise NotImplementedError
+
+    def list_campaigns(self):
+        return list(self.load_records(None, "campaigns").values())
+
+    def delete_campaign(self, campaign_id):
+        raise NotImplementedError
+
+    def document_stamp(self, path):
+        """Firma barata del documento que cambia con cualquier escritura, aunque no
+        toque 'version' (ediciones a mano). None si no existe o no se puede saber.
+        """
+        return None
+
+    def campaign_stamp(self, campaign_id):
+        """Firma barata que cambia con cualquier escritura en la campaña (de este u otro proceso)."""
+        raise NotImplementedError
+
+    def cache_stats(self):
+        return {}
+
+    def flush(self):
+        return 0
+
+    def close(self):
+        self._close_lock_files()
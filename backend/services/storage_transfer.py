@@ -0,0 +1,58 @@
+import os
+
+from services.file_service import FileService
+
+
+def copy_campaigns(source, target, campaign_ids=None, log=None):
+    """Copia campañas completas (metadata, vault y sesiones) entre dos motores.
+
+    Conserva los nombres de archivo del layout campaign_{uuid}/vault|sessions,
+    así que un export a archivos seguido de un import deja los mismos
+    documentos. Devuelve {campaign_id: (n_items, n_sesiones)}.
+    """
+    campaigns = source.load_records(None, "campaigns")
+    copied = {}
+    for campaign_id in campaign_ids or list(campaigns):
+        metadata = campaigns.get(campaign_id)
+        if metadata is None:
+            if log:
+                log(f"campaign_{campaign_id}: no existe, se omite")
+            continue
+
+        base_path = target.create_campaign_structure(campaign_id)
+        target.save_json(os.path.join(base_path, "metadata.json"), metadata)
+        counts = []
+        for collection in ("vault", "sessions"):
+            records = source.load_records(campaign_id, collection)
+            paths = source.find_files(campaign_id, collection, list(records))
+            target_dir = target._get_collection_path(campaign_id, collection)
+            for record_id, record in records.items():
+                if paths[record_id] is None:
+                    continue
+                target.save_json(os.path.join(target_dir, os.path.basename(paths[record_id])), record)
+            target.rebuild_manifest(campaign_id, collection)
+            counts.append(len(records))
+
+        copied[campaign_id] = tuple(counts)
+        if log:
+            log(f"campaign_{campaign_id}: {counts[0]} items, {counts[1]} sesiones")
+    target.rebuild_manifest(None, "campaigns")
+    return copied
+
+
+def export_to_files(source, dest_path, campaign_ids=None, log=None):
+    """Vuelca el almacenamiento actual al layout de archivos JSON en dest_path."""
+    target = FileService(dest_path)
+    try:
+        return copy_campaigns(source, target, campaign_ids, log)
+    finally:
+        target.close()
+
+
+def import_from_files(src_path, target, campaign_ids=None, log=None):
+    """Carga un árbol campaign_{uuid}/vault|sessions en el almacenamiento actual."""
+    source = FileService(src_path)
+    try:
+        return copy_campaigns(source, target, campaign_ids, log)
+    finally:
+        source.close()
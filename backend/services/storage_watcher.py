@@ -0,0 +1,315 @@
+import logging
+import os
+import select
+import struct
+import threading
+import time
+
+try:
+    import ctypes
+    import ctypes.util
+    _libc = ctypes.CDLL(ctypes.util.find_library('c'), use_errno=True)
+    _libc.inotify_init1, _libc.inotify_add_watch
+except (OSError, AttributeError, TypeError):  # Sin inotify (macOS, Windows): se sondea
+    _libc = None
+
+INOTIFY_AVAILABLE = _libc is not None
+
+logger = logging.getLogger(__name__)
+
+STORAGE_WATCHER_MODES = ('off', 'auto', 'inotify', 'poll')
+
+# Un lote se procesa tras DEFAULT_DEBOUNCE segundos sin eventos (un git
+# checkout de una campaña entera es una ráfaga: una sola reconstrucción),
+# o como mucho DEFAULT_MAX_DELAY segundos después del primero
+DEFAULT_DEBOUNCE = 0.5
+DEFAULT_MAX_DELAY = 5.0
+DEFAULT_POLL_INTERVAL = 2.0
+
+COLLECTIONS = ("vault", "sessions")
+
+# inotify(7)
+IN_CLOSE_WRITE = 0x00000008
+IN_MOVED_FROM = 0x00000040
+IN_MOVED_TO = 0x00000080
+IN_CREATE = 0x00000100
+IN_DELETE = 0x00000200
+IN_Q_OVERFLOW = 0x00004000
+IN_IGNORED = 0x00008000
+IN_ISDIR = 0x40000000
+IN_NONBLOCK = 0o4000
+IN_CLOEXEC = 0o2000000
+WATCH_MASK = IN_CLOSE_WRITE | IN_MOVED_FROM | IN_MOVED_TO | IN_CREATE | IN_DELETE
+_EVENT_HEADER = struct.Struct('iIII')
+
+
+def _is_document(filename):
+    return filename.endswith(".json") and not filename.startswith(("_", "."))
+
+
+def _campaign_id(dirname):
+    return dirname[len("campaign_"):] if dirname.startswith("campaign_") else None
+
+
+class _InotifySource:
+    """Eventos del kernel sobre la raíz, cada campaign_*/ y sus vault/ y sessions/."""
+
+    def __init__(self, storage_path):
+        if not INOTIFY_AVAILABLE:
+            raise OSError("inotify not available")
+        self.storage_path = storage_path
+        self.fd = _libc.inotify_init1(IN_NONBLOCK | IN_CLOEXEC)
+        if self.fd < 0:
+            raise OSError(ctypes.get_errno(), "inotify_init1 failed")
+        self._paths = {}  # wd -> (campaign_id o None, colección o None)
+        try:
+            self._add(storage_path, None, None)
+            for name in os.listdir(storage_path):
+                if _campaign_id(name):
+                    self._add_campaign(_campaign_id(name))
+        except OSError:
+            os.close(self.fd)
+            raise
+
+    def _add(self, path, campaign_id, collection):
+        wd = _libc.inotify_add_watch(self.fd, os.fsencode(path), WATCH_MASK)
+        if wd < 0:
+            error = ctypes.get_errno()
+            if error == 2:  # ENOENT: se borró entre el listado y el watch
+                return
+            # ENOSPC: se agotó fs.inotify.max_user_watches
+            raise OSError(error, f"inotify_add_watch failed for {path}")
+        self._paths[wd] = (campaign_id, collection)
+
+    def _add_campaign(self, campaign_id):
+        base_path = os.path.join(self.storage_path, f"campaign_{campaign_id}")
+        self._add(base_path, campaign_id, None)
+        for collection in COLLECTIONS:
+            if os.path.isdir(os.path.join(base_path, collection)):
+                self._add(os.path.join(base_path, collection), campaign_id, collection)
+
+    def wait(self, timeout):
+        """Espera hasta 'timeout' y devuelve [(campaign_id, colección, archivo o None)]."""
+        ready, _, _ = select.select([self.fd], [], [], max(timeout, 0))
+        if not ready:
+            return []
+        try:
+            data = os.read(self.fd, 64 * 1024)
+        except BlockingIOError:
+            return []
+
+        changes = []
+        offset = 0
+        while offset < len(data):
+            wd, mask, _, length = _EVENT_HEADER.unpack_from(data, offset)
+            name = data[offset + _EVENT_HEADER.size:offset + _EVENT_HEADER.size + length].rstrip(b'\0').decode('utf-8', 'replace')
+            offset += _EVENT_HEADER.size + length
+            if mask & IN_Q_OVERFLOW:
+                # Se perdieron eventos: todo a revisar
+                changes.append((None, "campaigns", None))
+                changes.extend((None, collection, None) for collection in COLLECTIONS)
+                continue
+            if mask & IN_IGNORED:
+                self._paths.pop(wd, None)
+                continue
+            if wd not in self._paths:
+                continue
+            campaign_id, collection = self._paths[wd]
+            changes.extend(self._classify(campaign_id, collection, name, mask))
+        return changes
+
+    def _classify(self, campaign_id, collection, name, mask):
+        created_dir = mask & IN_ISDIR and mask & (IN_CREATE | IN_MOVED_TO)
+        if campaign_id is None:
+            # Raíz: aparece o desaparece una campaña entera
+            new_id = _campaign_id(name)
+            if not new_id or not mask & IN_ISDIR:
+                return []
+            if created_dir:
+                self._add_campaign(new_id)
+                # Lo escrito antes de tener los watches solo se ve releyendo
+                return [(new_id, "campaigns", None)] + [(new_id, c, None) for c in COLLECTIONS]
+            return [(new_id, "campaigns", None)]
+        if collection is None:
+            if name in COLLECTIONS and created_dir:
+                self._add(os.path.join(self.storage_path, f"campaign_{campaign_id}", name), campaign_id, name)
+                return [(campaign_id, name, None)]
+            return [(campaign_id, "campaigns", None)] if name == "metadata.json" else []
+        if mask & IN_ISDIR or not _is_document(name) or mask & IN_CREATE:
+            # Un archivo recién creado llega también con IN_CLOSE_WRITE
+            return []
+        return [(campaign_id, collection, name)]
+
+    def close(self):
+        if self.fd is not None:
+            os.close(self.fd)
+            self.fd = None
+
+
+class _PollingSource:
+    """Sin inotify: compara (mtime, tamaño) de todos los documentos cada 'interval' segundos."""
+
+    def __init__(self, storage_path, interval, stop):
+        self.storage_path = storage_path
+        self.interval = interval
+        self._stop = stop
+        self._snapshot = self._scan()
+        self._next_scan = time.monotonic() + interval
+
+    def _scan(self):
+        snapshot = {}
+        try:
+            names = os.listdir(self.storage_path)
+        except FileNotFoundError:
+            return snapshot
+        for name in names:
+            campaign_id = _campaign_id(name)
+            base_path = os.path.join(self.storage_path, name)
+            if not campaign_id or not os.path.isdir(base_path):
+                continue
+            try:
+                st = os.stat(os.path.join(base_path, "metadata.json"))
+                snapshot[(campaign_id, "campaigns", None)] = (st.st_mtime_ns, st.st_size)
+            except FileNotFoundError:
+                snapshot[(campaign_id, "campaigns", None)] = None
+            for collection in COLLECTIONS:
+                try:
+                    entries = list(os.scandir(os.path.join(base_path, collection)))
+                except FileNotFoundError:
+                    continue
+                for entry in entries:
+                    if not _is_document(entry.name):
+                        continue
+                    try:
+                        st = entry.stat()
+                    except FileNotFoundError:
+                        continue
+                    snapshot[(campaign_id, collection, entry.name)] = (st.st_mtime_ns, st.st_size)
+        return snapshot
+
+    def wait(self, timeout):
+        delay = self._next_scan - time.monotonic()
+        if timeout is not None and timeout < delay:
+            self._stop.wait(max(timeout, 0))
+            return []
+        self._stop.wait(max(delay, 0))
+        self._next_scan = time.monotonic() + self.interval
+        previous, self._snapshot = self._snapshot, self._scan()
+        return [key for key in previous.keys() | self._snapshot.keys() if previous.get(key) != self._snapshot.get(key)]
+
+    def close(self):
+        pass
+
+
+class StorageWatcher:
+    """Vigila data_storage y convierte las ediciones externas en cambios del FileService.
+
+    Los documentos se pueden editar a mano (o con git, o desde otra
+    herramienta): este hilo agrupa los eventos por colección y, tras
+    'debounce' segundos de calma, llama a FileService.apply_external_changes,
+    que reconstruye el manifiesto y avisa a los listeners (búsqueda, índice
+    vectorial, log de cambios, cachés de IA). Usa inotify si el sistema lo
+    tiene y, si no, sondea cada 'poll_interval' segundos.
+    """
+
+    def __init__(self, file_service, mode='auto', debounce=DEFAULT_DEBOUNCE,
+                 max_delay=DEFAULT_MAX_DELAY, poll_interval=DEFAULT_POLL_INTERVAL):
+        if mode not in STORAGE_WATCHER_MODES or mode == 'off':
+            raise ValueError(f"mode must be one of {STORAGE_WATCHER_MODES[1:]}")
+        self.file_service = file_service
+        self.debounce = debounce
+        self.max_delay = max_delay
+        self._stop = threading.Event()
+        self.source = None
+        if mode in ('auto', 'inotify'):
+            try:
+                self.source = _InotifySource(file_service.storage_path)
+                self.mode = 'inotify'
+            except OSError as e:
+                if mode == 'inotify':
+                    raise
+                logger.warning("inotify unavailable (%s): polling every %ss", e, poll_interval)
+        if self.source is None:
+            self.source = _PollingSource(file_service.storage_path, poll_interval, self._stop)
+            self.mode = 'poll'
+
+        # (campaign_id, colección) -> archivos cambiados, o None si hay que mirarlos todos
+        self._pending = {}
+        self._first_event = None
+        self._last_event = None
+        self._lock = threading.Lock()
+        self.stats = {"events": 0, "batches": 0, "changes": 0, "errors": 0}
+        self._thread = threading.Thread(target=self._run, name="storage-watcher", daemon=True)
+
+    def start(self):
+        self._thread.start()
+        return self
+
+    def _run(self):
+        while not self._stop.is_set():
+            # Como mucho un segundo bloqueado: así close() no espera a un evento
+            timeout = self._time_to_flush()
+            try:
+                self._queue(self.source.wait(1.0 if timeout is None else min(timeout, 1.0)))
+            except OSError:
+                # P. ej. sin watches libres para una campaña nueva: se sigue con el resto
+                logger.exception("storage watcher: error reading changes")
+                with self._lock:
+                    self.stats['errors'] += 1
+            timeout = self._time_to_flush()
+            if timeout is not None and timeout <= 0:
+                self._flush()
+
+    def _queue(self, events):
+        if not events:
+            return
+        now = time.monotonic()
+        with self._lock:
+            for campaign_id, collection, filename in events:
+                key = (campaign_id, collection)
+                if filename is None or (key in self._pending and self._pending[key] is None):
+                    self._pending[key] = None
+                else:
+                    self._pending.setdefault(key, set()).add(filename)
+            self.stats['events'] += len(events)
+            self._first_event = self._first_event or now
+            self._last_event = now
+
+    def _time_to_flush(self):
+        """Segundos hasta procesar lo pendiente (<= 0: ya toca), o None si no hay nada."""
+        with self._lock:
+            if not self._pending:
+                return None
+            return min(self._last_event + self.debounce, self._first_event + self.max_delay) - time.monotonic()
+
+    def _flush(self):
+        with self._lock:
+            pending, self._pending = self._pending, {}
+            self._first_event = self._last_event = None
+        service = self.file_service
+        # Primero las campañas (altas y bajas enteras), después sus colecciones
+        ordered = sorted(pending.items(), key=lambda kv: (kv[0][1] != "campaigns", kv[0][0] or "", kv[0][1]))
+        changed = 0
+        for (campaign_id, collection), filenames in ordered:
+            try:
+                if campaign_id is None and collection != "campaigns":
+                    for cid in service.read_manifest(None, "campaigns"):
+                        changed += service.apply_external_changes(cid, collection)
+                else:
+                    changed += service.apply_external_changes(
+                        campaign_id, collection, sorted(filenames) if filenames is not None else None)
+            except Exception:
+                logger.exception("external changes in %s/%s could not be applied", campaign_id, collection)
+                with self._lock:
+                    self.stats['errors'] += 1
+        if changed:
+            logger.info("storage watcher: %s records changed outside the API", changed)
+        with self._lock:
+            self.stats['batches'] += 1
+            self.stats['changes'] += changed
+
+    def close(self):
+        self._stop.set()
+        if self._thread.is_alive():
+            self._thread.join(timeout=5)
+        self.source.close()
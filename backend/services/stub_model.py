@@ -0,0 +1,36 @@
+class StubResponse:
+    def __init__(self, text):
+        self.text = text
+
+
+class StubChat:
+    """Imita ChatSession de google.generativeai sin llamar a la red."""
+
+    def __init__(self, history, chunk_size):
+        self.history = list(history or [])
+        self.chunk_size = chunk_size
+
+    def _answer(self, message):
+        return f"[stub] Respuesta a: {message}"
+
+    def send_message(self, message, stream=False):
+        text = self._answer(message)
+        self.history.append({"role": "user", "parts": [message]})
+        self.history.append({"role": "model", "parts": [text]})
+        if not stream:
+            return StubResponse(text)
+        return (StubResponse(text[i:i + self.chunk_size]) for i in range(0, len(text), self.chunk_size))
+
+
+class StubGenerativeModel:
+    """Sustituto de genai.GenerativeModel (activar con AI_STUB=1)."""
+
+    def __init__(self, chunk_size=8):
+        self.chunk_size = chunk_size
+
+    def start_chat(self, history=None):
+        return StubChat(history, self.chunk_size)
+
+    def generate_content(self, prompt):
+        # Resumen determinista: el principio del texto tras las instrucciones
+        return StubResponse(f"[stub] Resumen: {prompt.rsplit(chr(10) * 2, 1)[-1][:200]}")
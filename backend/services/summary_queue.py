@@ -0,0 +1,273 @@
+import hashlib
+import json
+import logging
+import os
+import tempfile
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+logger = logging.getLogger(__name__)
+
+SUMMARIES_DIRNAME = "_summaries"
+DEFAULT_SUMMARY_WORKERS = 2
+
+# Cambiar los prompts invalida los resúmenes ya hechos (entra en el hash)
+SUMMARY_PROMPT_VERSION = 1
+MAX_ATTEMPTS = 3
+
+# Un framework más corto que esto ya cabe tal cual en el prompt
+FRAMEWORK_MIN_CHARS = 1200
+
+# tipo -> (campo de origen, campo con el resumen automático, instrucciones)
+SUMMARY_KINDS = {
+    "framework": (
+        "framework", "auto_framework_summary",
+        "Resume el siguiente trasfondo de una campaña de rol en un máximo de 250 palabras. "
+        "Conserva nombres propios, facciones, lugares, tono y conflictos abiertos. "
+        "Responde solo con el resumen.",
+    ),
+    "session": (
+        "notes", "auto_summary",
+        "Resume las notas de esta sesión de rol en un máximo de 120 palabras: qué pasó, "
+        "qué decidieron los personajes y qué quedó pendiente. Responde solo con el resumen.",
+    ),
+}
+
+
+def content_hash(kind, text):
+    raw = f"{kind}:{SUMMARY_PROMPT_VERSION}:{text}".encode('utf-8')
+    return hashlib.sha256(raw).hexdigest()
+
+
+def auto_summary(doc, kind):
+    """Resumen automático vigente del documento, o None si falta o es de otro texto."""
+    source_field, summary_field, _ = SUMMARY_KINDS[kind]
+    summary = doc.get(summary_field)
+    text = doc.get(source_field) or ''
+    if not isinstance(summary, dict) or not text:
+        return None
+    return summary.get('text') if summary.get('hash') == content_hash(kind, text) else None
+
+
+def needs_summary(doc, kind):
+    """True si el documento tiene texto que resumir y su resumen no está al día."""
+    source_field, _, _ = SUMMARY_KINDS[kind]
+    text = doc.get(source_field) or ''
+    if kind == "framework" and len(text) < FRAMEWORK_MIN_CHARS:
+        return False
+    if kind == "session" and doc.get('status') != 'completed':
+        return False
+    return bool(text.strip()) and auto_summary(doc, kind) is None
+
+
+def _write_atomic(path, text):
+    fd, tmp_path = tempfile.mkstemp(dir=os.path.dirname(path), prefix=".tmp_", suffix=".tmp")
+    try:
+        with os.fdopen(fd, 'w', encoding='utf-8') as f:
+            f.write(text)
+        os.replace(tmp_path, path)
+    except BaseException:
+        if os.path.exists(tmp_path):
+            os.remove(tmp_path)
+        raise
+
+
+def _pid_alive(pid):
+    try:
+        os.kill(pid, 0)
+    except ProcessLookupError:
+        return False
+    except PermissionError:
+        return True
+    return True
+
+
+class SummaryQueue:
+    """Cola de resúmenes automáticos (framework y notas de sesiones completadas).
+
+    En disco, bajo {storage}/_summaries/:
+      queue/    un archivo por trabajo pendiente ({campaña}.{tipo}.{id}.json)
+      running/  trabajos reclamados, con el pid del proceso que los ejecuta
+      failed/   trabajos que agotaron los reintentos
+      cache/    resúmenes por hash del texto: el mismo texto no se resume dos veces
+
+    Reclamar es un os.rename de queue/ a running/: con varios workers solo
+    uno gana. Un trabajo cuyo proceso murió vuelve a la cola al arrancar.
+    El trabajo no guarda el texto: se lee del documento al ejecutarlo, y el
+    resumen solo se escribe si el texto sigue siendo el mismo.
+
+    'summarize(prompt) -> str' llama al modelo; corre en los hilos del pool.
+    """
+
+    def __init__(self, file_service, summarize, workers=DEFAULT_SUMMARY_WORKERS):
+        self.file_service = file_service
+        self.summarize = summarize
+        base = os.path.join(file_service.storage_path, SUMMARIES_DIRNAME)
+        self.queue_dir = os.path.join(base, "queue")
+        self.running_dir = os.path.join(base, "running")
+        self.failed_dir = os.path.join(base, "failed")
+        self.cache_dir = os.path.join(base, "cache")
+        for path in (self.queue_dir, self.running_dir, self.failed_dir, self.cache_dir):
+            os.makedirs(path, exist_ok=True)
+        self._executor = ThreadPoolExecutor(max_workers=workers, thread_name_prefix="summary")
+        self._closed = False
+        self._lock = threading.Lock()
+        self._idle = threading.Condition(self._lock)
+        self._inflight = 0
+        self.stats = {"enqueued": 0, "completed": 0, "cache_hits": 0, "model_calls": 0, "failed": 0}
+
+    # --- Encolar ---
+
+    def _count(self, key):
+        with self._lock:
+            self.stats[key] += 1
+
+    def enqueue(self, campaign_id, kind, target_id=None):
+        name = f"{campaign_id}.{kind}.{target_id or campaign_id}.json"
+        job = {"campaign_id": campaign_id, "kind": kind, "target_id": target_id, "attempts": 0}
+        # Si ya estaba en cola se sobrescribe: el trabajo leerá el texto actual
+        _write_atomic(os.path.join(self.queue_dir, name), json.dumps(job))
+        self._count("enqueued")
+        self._submit(name)
+
+    def _submit(self, name):
+        if self._closed:
+            return
+        with self._lock:
+            self._inflight += 1
+        self._executor.submit(self._tracked, name)
+
+    def _tracked(self, name):
+        try:
+            self._run(name)
+        finally:
+            with self._idle:
+                self._inflight -= 1
+                self._idle.notify_all()
+
+    def wait_idle(self, timeout=None):
+        """Espera a que no quede nada en marcha en este proceso (tests, comandos)."""
+        with self._idle:
+            return self._idle.wait_for(lambda: self._inflight == 0, timeout)
+
+    def handle_change(self, campaign_id, collection, record_id, record):
+        """Listener del motor: encola lo que haya quedado sin resumen al día."""
+        if record is None:
+            return
+        if collection == "campaigns" and needs_summary(record, "framework"):
+            self.enqueue(record_id, "framework")
+        elif collection == "sessions" and needs_summary(record, "session"):
+            self.enqueue(campaign_id, "session", record_id)
+
+    def recover(self):
+        """Al arrancar: devuelve a la cola lo de procesos muertos y encola todo lo pendiente."""
+        for name in os.listdir(self.running_dir):
+            base, _, pid = name.rpartition(".pid")
+            if pid.isdigit() and not _pid_alive(int(pid)):
+                try:
+                    os.rename(os.path.join(self.running_dir, name), os.path.join(self.queue_dir, base))
+                except FileNotFoundError:
+                    pass
+        for name in sorted(os.listdir(self.queue_dir)):
+            if name.endswith(".json"):
+                self._submit(name)
+
+    # --- Ejecutar ---
+
+    def _run(self, name):
+        running_path = os.path.join(self.running_dir, f"{name}.pid{os.getpid()}")
+        try:
+            os.rename(os.path.join(self.queue_dir, name), running_path)
+        except FileNotFoundError:
+            # Otro hilo u otro worker se lo llevó
+            return
+        try:
+            with open(running_path, encoding='utf-8') as f:
+                job = json.load(f)
+            try:
+                self._process(job)
+            except Exception as e:
+                self._retry(name, job, e)
+        except ValueError:
+            logger.warning("summary %s: unreadable job, dropped", name)
+        finally:
+            try:
+                os.remove(running_path)
+            except FileNotFoundError:
+                pass
+
+    def _retry(self, name, job, error):
+        job['attempts'] = job.get('attempts', 0) + 1
+        logger.warning("summary %s failed (attempt %s): %s", name, job['attempts'], error)
+        if job['attempts'] >= MAX_ATTEMPTS:
+            _write_atomic(os.path.join(self.failed_dir, name), json.dumps(dict(job, error=str(error))))
+            self._count("failed")
+            return
+        if os.path.exists(os.path.join(self.queue_dir, name)):
+            # Mientras tanto se volvió a encolar: ese trabajo ya lo cubre
+            return
+        # Espera en el propio hilo del pool: el pool es pequeño y los fallos, raros
+        time.sleep(min(2 ** job['attempts'], 30))
+        _write_atomic(os.path.join(self.queue_dir, name), json.dumps(job))
+        self._submit(name)
+
+    def _document_path(self, job):
+        service = self.file_service
+        if job['kind'] == "framework":
+            return os.path.join(service._get_campaign_path(job['campaign_id']), "metadata.json")
+        return service.find_file(job['campaign_id'], "sessions", job['target_id'])
+
+    def _process(self, job):
+        kind = job['kind']
+        source_field, summary_field, instructions = SUMMARY_KINDS[kind]
+        path = self._document_path(job)
+        doc = self.file_service.load_json(path, readonly=True) if path else None
+        if doc is None or not needs_summary(doc, kind):
+            return
+
+        text = doc[source_field]
+        digest = content_hash(kind, text)
+        # Dos trabajos con el mismo texto (en este proceso o en otro): el
+        # segundo espera y usa la caché. Lock por franjas del motor, sin un
+        # lock por digest que crezca sin límite
+        cache_path = os.path.join(self.cache_dir, f"{digest}.txt")
+        with self.file_service.locked(cache_path):
+            summary = self._cached(digest)
+            if summary is None:
+                self._count("model_calls")
+                summary = (self.summarize(f"{instructions}\n\n{text}") or '').strip()
+                if not summary:
+                    raise ValueError("empty summary")
+                _write_atomic(cache_path, summary)
+            else:
+                self._count("cache_hits")
+
+        def apply(current):
+            # Si el texto cambió mientras tanto, ya hay otro trabajo en cola
+            if content_hash(kind, current.get(source_field) or '') != digest:
+                return False
+            current[summary_field] = {"hash": digest, "text": summary}
+
+        # Sin subir 'version': el resumen no es una edición del usuario y el
+        # cliente que tiene el documento abierto no debe recibir un 412
+        updated = self.file_service.update_json(path, apply, bump_version=False)
+        if updated is not None and updated.get(summary_field, {}).get('hash') == digest:
+            collection = "campaigns" if kind == "framework" else "sessions"
+            self.file_service.on_saved(job['campaign_id'], collection, updated)
+        self._count("completed")
+
+    def _cached(self, digest):
+        try:
+            with open(os.path.join(self.cache_dir, f"{digest}.txt"), encoding='utf-8') as f:
+                return f.read()
+        except FileNotFoundError:
+            return None
+
+    def pending(self):
+        return len([n for n in os.listdir(self.queue_dir) if n.endswith(".json")])
+
+    def close(self):
+        """Deja de aceptar trabajos; lo pendiente sigue en disco para el próximo arranque."""
+        self._closed = True
+        self._executor.shutdown(wait=False, cancel_futures=True)
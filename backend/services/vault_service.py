@@ -0,0 +1,157 @@
+import math
+import os
+import re
+
+from services.id_service import generate_id
+
+BULK_OPS = ('create', 'update', 'status', 'delete')
+UPDATABLE_FIELDS = ('status', 'tags', 'content', 'usage_count')
+MAX_BULK_OPERATIONS = 1000
+
+# El tipo va en el nombre del archivo ({type}_{id}.json): nada de separadores
+# de ruta ni puntos (mismo patrón que campaign_archive)
+_TYPE_RE = re.compile(r"^[\w-]+$")
+
+
+def valid_type(value):
+    return isinstance(value, str) and bool(_TYPE_RE.match(value))
+
+
+def new_vault_item(data):
+    """Item nuevo del vault a partir del body de creación."""
+    return {
+        "id": generate_id(),
+        "type": data['type'],
+        "status": "reserve",
+        "usage_count": 0, # Nuevo campo para seguimiento
+        "version": 1, # Control de concurrencia optimista (If-Match)
+        "tags": data.get('tags', []),
+        "content": data.get('content', {})
+    }
+
+
+def usage_count(item):
+    """usage_count del item como número >= 0: 0 si falta o no es numérico (p. ej. editado a mano)."""
+    value = item.get('usage_count')
+    if isinstance(value, bool) or not isinstance(value, (int, float)):
+        try:
+            value = float(value)
+        except (TypeError, ValueError):
+            return 0
+    return value if math.isfinite(value) and value > 0 else 0
+
+
+def vault_item_path(service, campaign_id, item):
+    return os.path.join(service._get_campaign_path(campaign_id), "vault", f"{item['type']}_{item['id']}.json")
+
+
+def _expand(operations):
+    """Normaliza el lote: [(índice, op)], con {'ids': [...]} desdoblado en una op por ID."""
+    expanded = []
+    for index, op in enumerate(operations):
+        if isinstance(op, dict) and isinstance(op.get('ids'), list):
+            for item_id in op['ids']:
+                expanded.append((index, {**{k: v for k, v in op.items() if k != 'ids'}, 'id': item_id}))
+        else:
+            expanded.append((index, op))
+    return expanded
+
+
+def _validate(op):
+    if not isinstance(op, dict) or op.get('op') not in BULK_OPS:
+        return f"op must be one of {', '.join(BULK_OPS)}"
+    if op['op'] == 'create':
+        if not op.get('type'):
+            return "type is required"
+        return None if valid_type(op['type']) else "type must contain only letters, digits, '_' or '-'"
+    if not isinstance(op.get('id'), str):
+        return "id is required"
+    if op['op'] == 'status' and 'status' not in op:
+        return "status is required"
+    return None
+
+
+def _changes(op):
+    if op['op'] == 'status':
+        return {'status': op['status']}
+    return {field: op[field] for field in UPDATABLE_FIELDS if field in op}
+
+
+def apply_bulk(service, campaign_id, operations):
+    """Ejecuta un lote de operaciones sobre el vault y devuelve un resultado por operación.
+
+    Los IDs se resuelven de una vez, cada archivo se escribe una sola vez
+    (las ops sobre el mismo ID se aplican en orden sobre el mismo documento)
+    y el manifiesto se actualiza una vez al final. 'expected_version' en una
+    op de update/status hace que falle con 412 si el item ya cambió.
+    """
+    expanded = _expand(operations)
+    results = []
+    saved, deleted = [], []
+    by_id = {}
+
+    for index, op in expanded:
+        error = _validate(op)
+        result = {"index": index, "op": op.get('op') if isinstance(op, dict) else None}
+        results.append(result)
+        if error:
+            result.update(status=400, error=error)
+        elif op['op'] == 'create':
+            item = new_vault_item(op)
+            service.save_json(vault_item_path(service, campaign_id, item), item)
+            saved.append(item)
+            result.update(status=201, id=item['id'], item=item)
+        else:
+            result['id'] = op['id']
+            by_id.setdefault(op['id'], []).append((op, result))
+
+    paths = service.find_files(campaign_id, "vault", list(by_id))
+    for item_id, entries in by_id.items():
+        path = paths[item_id]
+        if not path:
+            for _, result in entries:
+                result.update(status=404, error="Item not found")
+            continue
+
+        # Lo que va detrás de un delete ya no tiene sobre qué aplicarse
+        delete_at = next((i for i, (op, _) in enumerate(entries) if op['op'] == 'delete'), None)
+        if delete_at is not None:
+            service.trash_file(path)
+            deleted.append(item_id)
+            for i, (_, result) in enumerate(entries):
+                if i < delete_at:
+                    result.update(status=200, superseded=True)
+                elif i == delete_at:
+                    result.update(status=200)
+                else:
+                    result.update(status=404, error="Item deleted earlier in the batch")
+            continue
+
+        def mutate(doc, entries=entries):
+            original_version = doc.get('version', 0)
+            changed = False
+            for op, result in entries:
+                expected = op.get('expected_version')
+                if expected is not None and expected != original_version:
+                    result.update(status=412, error="Version conflict")
+                    continue
+                doc.update(_changes(op))
+                result['status'] = 200
+                changed = True
+            return changed
+
+        item = service.update_json(path, mutate)
+        if item is None:
+            for _, result in entries:
+                result.update(status=404, error="Item not found")
+            continue
+        for _, result in entries:
+            if result['status'] == 200:
+                result['item'] = item
+            else:
+                result['current'] = item
+        if any(result['status'] == 200 for _, result in entries):
+            saved.append(item)
+
+    service.on_changed(campaign_id, "vault", saved=saved, deleted=deleted)
+    return results
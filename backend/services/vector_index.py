@@ -0,0 +1,371 @@
+import hashlib
+import heapq
+import math
+import mmap
+import os
+import tempfile
+import threading
+from array import array
+from collections import Counter
+from contextlib import nullcontext
+from operator import mul
+
+from services.search_service import tokenize, _collect_text, _stat_key
+from services.metrics import span
+from services import serializer
+
+try:
+    import numpy as np
+except ImportError:  # Opcional: sin NumPy el archivo se mapea con mmap y el coseno va en Python
+    np = None
+
+VECTOR_DATA_FILENAME = "_vectors.f32"
+VECTOR_META_FILENAME = "_vectors.json"
+VECTOR_INDEX_VERSION = 1
+
+DEFAULT_EMBEDDER = "hashing"
+EMBEDDERS = ("hashing", "gemini")
+DEFAULT_EMBEDDING_DIM = 256
+DEFAULT_VECTOR_TOP_K = 12
+# Por debajo de esta similitud un item no se considera relacionado con la pregunta
+DEFAULT_VECTOR_MIN_SCORE = 0.12
+
+# Filas reservadas al crear el archivo; después crece al doble
+INITIAL_CAPACITY = 64
+EMBED_BATCH = 100
+
+
+def embedding_text(item):
+    """Texto de un item del vault para el embedder: tipo, contenido y tags."""
+    parts = [item.get('type') or '']
+    _collect_text(item.get('content') or {}, parts)
+    _collect_text(item.get('tags') or [], parts)
+    return ' '.join(parts)
+
+
+def _normalize(vector):
+    norm = math.sqrt(sum(v * v for v in vector))
+    return [v / norm for v in vector] if norm else vector
+
+
+class HashingEmbedder:
+    """Embeddings por feature hashing: deterministas, sin red ni modelo.
+
+    Cada término (y su prefijo de 5 letras, para acercar plurales y
+    derivados) suma ±1·log(1+tf) en una de 'dim' posiciones. Sirve para
+    tests offline y como opción por defecto; la similitud es léxica.
+    """
+
+    def __init__(self, dim=DEFAULT_EMBEDDING_DIM):
+        self.dim = dim
+        self.name = f"hashing-{dim}"
+
+    def _features(self, text):
+        counts = Counter()
+        for token in tokenize(text):
+            counts[token] += 1.0
+            if len(token) > 5:
+                counts[f"{token[:5]}~"] += 0.5
+        return counts
+
+    def embed(self, texts):
+        vectors = []
+        for text in texts:
+            vector = [0.0] * self.dim
+            for feature, weight in self._features(text).items():
+                digest = int.from_bytes(hashlib.blake2b(feature.encode('utf-8'), digest_size=8).digest(), 'little')
+                sign = 1.0 if digest >> 63 else -1.0
+                vector[digest % self.dim] += sign * math.log1p(weight)
+            vectors.append(_normalize(vector))
+        return vectors
+
+
+class GeminiEmbedder:
+    """Embeddings de la API de Gemini (necesita GOOGLE_API_KEY)."""
+
+    def __init__(self, model="models/text-embedding-004", dim=768):
+        self.model = model
+        self.dim = dim
+        self.name = f"gemini:{model}"
+
+    def embed(self, texts):
+        import google.generativeai as genai
+        api_key = os.getenv("GOOGLE_API_KEY")
+        if not api_key:
+            raise ValueError("GOOGLE_API_KEY not found in environment variables")
+        genai.configure(api_key=api_key)
+        result = genai.embed_content(model=self.model, content=list(texts), task_type="retrieval_document")
+        return [_normalize(list(v)) for v in result['embedding']]
+
+
+def create_embedder(name=DEFAULT_EMBEDDER, dim=DEFAULT_EMBEDDING_DIM):
+    if name == "hashing":
+        return HashingEmbedder(dim)
+    if name == "gemini":
+        return GeminiEmbedder()
+    raise ValueError(f"EMBEDDER must be one of {EMBEDDERS}")
+
+
+class CampaignVectorIndex:
+    """Vectores de los items del vault de una campaña, en un archivo mapeado en memoria.
+
+    _vectors.f32 es una matriz float32 (capacidad × dim) y _vectors.json dice
+    qué fila es de qué item, con el hash del texto embebido: si un item
+    cambia sin cambiar su texto (usage_count, status) no se vuelve a embeber.
+    Con NumPy la matriz es un np.memmap y la búsqueda es un producto
+    matriz-vector; sin NumPy, un memoryview sobre mmap.
+
+    Como el índice de búsqueda: 'locker' serializa las escrituras entre
+    procesos y refresh() recarga si otro proceso cambió los metadatos.
+    """
+
+    def __init__(self, campaign_path, embedder, locker=None):
+        self.embedder = embedder
+        self.locker = locker or (lambda path: nullcontext())
+        self.data_path = os.path.join(campaign_path, VECTOR_DATA_FILENAME)
+        self.meta_path = os.path.join(campaign_path, VECTOR_META_FILENAME)
+        self.meta = None
+        self._matrix = None
+        self._mmap = None
+        self._seen = None
+        self.lock = threading.RLock()
+
+    # --- Carga y persistencia ---
+
+    def _empty_meta(self, capacity=INITIAL_CAPACITY):
+        return {
+            "version": VECTOR_INDEX_VERSION, "embedder": self.embedder.name, "dim": self.embedder.dim,
+            "capacity": capacity, "rows": {}, "hashes": {}, "free": [],
+        }
+
+    def _unmap(self):
+        if np is None and self._matrix is not None:
+            self._matrix.release()
+            self._mmap.close()
+        self._matrix = self._mmap = None
+
+    def _map(self):
+        self._unmap()
+        shape = (self.meta['capacity'], self.meta['dim'])
+        if np is not None:
+            self._matrix = np.memmap(self.data_path, dtype=np.float32, mode='r+', shape=shape)
+        else:
+            with open(self.data_path, 'r+b') as f:
+                self._mmap = mmap.mmap(f.fileno(), 0)
+            self._matrix = memoryview(self._mmap).cast('f')
+
+    def load(self):
+        """Carga metadatos y mapea la matriz. False si falta o es de otro embedder."""
+        try:
+            with open(self.meta_path, 'rb') as f:
+                meta = serializer.loads(f.read())
+        except (FileNotFoundError, ValueError):
+            return False
+        if (meta.get('version') != VECTOR_INDEX_VERSION or meta.get('embedder') != self.embedder.name
+                or meta.get('dim') != self.embedder.dim or not os.path.exists(self.data_path)):
+            return False
+        self.meta = meta
+        self._map()
+        self._seen = _stat_key(self.meta_path)
+        return True
+
+    def refresh(self):
+        """Recarga si otro proceso ha escrito en el índice desde la última vez."""
+        with self.lock:
+            if self._seen is not None and _stat_key(self.meta_path) != self._seen:
+                self.load()
+
+    def _write_meta(self):
+        fd, tmp_path = tempfile.mkstemp(dir=os.path.dirname(self.meta_path), prefix=".tmp_", suffix=".tmp")
+        try:
+            with os.fdopen(fd, 'wb') as f:
+                f.write(serializer.dumps(self.meta))
+            os.replace(tmp_path, self.meta_path)
+        except BaseException:
+            if os.path.exists(tmp_path):
+                os.remove(tmp_path)
+            raise
+        self._seen = _stat_key(self.meta_path)
+
+    def _grow(self, needed):
+        capacity = self.meta['capacity']
+        while capacity < needed:
+            capacity *= 2
+        if capacity == self.meta['capacity']:
+            return
+        self._unmap()
+        os.truncate(self.data_path, capacity * self.meta['dim'] * 4)
+        self.meta['capacity'] = capacity
+        self._map()
+
+    def _flush(self):
+        if np is not None:
+            self._matrix.flush()
+        else:
+            self._mmap.flush()
+
+    # --- Mutaciones ---
+
+    def rebuild(self, items):
+        """Índice nuevo con estos items (archivo nuevo: otros procesos siguen leyendo el viejo)."""
+        with self.lock, self.locker(self.meta_path):
+            capacity = INITIAL_CAPACITY
+            while capacity < len(items):
+                capacity *= 2
+            self.meta = self._empty_meta(capacity)
+            fd, tmp_path = tempfile.mkstemp(dir=os.path.dirname(self.data_path), prefix=".tmp_", suffix=".tmp")
+            os.close(fd)
+            os.truncate(tmp_path, capacity * self.embedder.dim * 4)
+            os.replace(tmp_path, self.data_path)
+            self._map()
+            self._upsert(items)
+            self._write_meta()
+
+    def upsert(self, items):
+        with self.lock, self.locker(self.meta_path):
+            self.refresh()
+            if self._upsert(items):
+                self._write_meta()
+
+    def _upsert(self, items):
+        pending = []
+        for item in items:
+            text = embedding_text(item)
+            digest = hashlib.sha1(text.encode('utf-8')).hexdigest()
+            if self.meta['hashes'].get(item['id']) != digest:
+                pending.append((item['id'], text, digest))
+        if not pending:
+            return False
+
+        rows = self.meta['rows']
+        self._grow(len(rows) + len(pending))
+        dim = self.meta['dim']
+        for start in range(0, len(pending), EMBED_BATCH):
+            batch = pending[start:start + EMBED_BATCH]
+            with span("model.embed"):
+                vectors = self.embedder.embed([text for _, text, _ in batch])
+            for (item_id, _, digest), vector in zip(batch, vectors):
+                row = rows.get(item_id)
+                if row is None:
+                    row = self.meta['free'].pop() if self.meta['free'] else len(rows) + len(self.meta['free'])
+                    rows[item_id] = row
+                if np is not None:
+                    self._matrix[row] = vector
+                else:
+                    self._matrix[row * dim:(row + 1) * dim] = array('f', vector)
+                self.meta['hashes'][item_id] = digest
+        self._flush()
+        return True
+
+    def delete(self, item_ids):
+        with self.lock, self.locker(self.meta_path):
+            self.refresh()
+            removed = False
+            for item_id in item_ids:
+                row = self.meta['rows'].pop(item_id, None)
+                if row is not None:
+                    self.meta['hashes'].pop(item_id, None)
+                    self.meta['free'].append(row)
+                    removed = True
+            if removed:
+                self._write_meta()
+
+    # --- Consulta ---
+
+    def search(self, query_vector, k, exclude_ids=(), min_score=None):
+        """[(similitud coseno, item_id)] de los k items más cercanos."""
+        with self.lock:
+            self.refresh()
+            excluded = set(exclude_ids)
+            entries = [(row, item_id) for item_id, row in self.meta['rows'].items() if item_id not in excluded]
+            if not entries or k <= 0:
+                return []
+            if np is not None:
+                rows = np.fromiter((row for row, _ in entries), dtype=np.int64, count=len(entries))
+                scores = self._matrix[rows] @ np.asarray(query_vector, dtype=np.float32)
+                top = np.argsort(-scores)[:k]
+                hits = [(float(scores[i]), entries[i][1]) for i in top]
+            else:
+                dim = self.meta['dim']
+                matrix = self._matrix
+                hits = heapq.nlargest(k, (
+                    (sum(map(mul, matrix[row * dim:(row + 1) * dim], query_vector)), item_id)
+                    for row, item_id in entries
+                ))
+        if min_score is not None:
+            hits = [hit for hit in hits if hit[0] >= min_score]
+        return hits
+
+
+class VectorIndexService:
+    """Índices vectoriales por campaña, cargados bajo demanda y mantenidos con cada lote de cambios del vault."""
+
+    def __init__(self, file_service, embedder):
+        self.file_service = file_service
+        self.embedder = embedder
+        self._indexes = {}
+        self._lock = threading.Lock()
+
+    def get_index(self, campaign_id):
+        """Índice de la campaña (None si no existe la campaña)."""
+        with self._lock:
+            index = self._indexes.get(campaign_id)
+        if index:
+            return index
+        if not self.file_service.campaign_exists(campaign_id):
+            return None
+        campaign_path = self.file_service._get_campaign_path(campaign_id)
+        # Con SQLite el directorio solo guarda artefactos derivados: puede faltar tras un import
+        os.makedirs(campaign_path, exist_ok=True)
+
+        index = CampaignVectorIndex(campaign_path, self.embedder, locker=self.file_service.locked)
+        with index.lock:
+            with index.locker(index.meta_path):
+                loaded = index.load()
+            if not loaded:
+                index.rebuild(list(self.file_service.load_records(campaign_id, "vault").values()))
+        with self._lock:
+            return self._indexes.setdefault(campaign_id, index)
+
+    def rebuild(self, campaign_id):
+        index = self.get_index(campaign_id)
+        if index:
+            index.rebuild(list(self.file_service.load_records(campaign_id, "vault").values()))
+        return index
+
+    def handle_changes(self, campaign_id, collection, changes):
+        """Listener por lotes (StorageEngine.subscribe_batch): un embed y una escritura por lote."""
+        if collection == "campaigns":
+            with self._lock:
+                for record_id, record in changes:
+                    if record is None:
+                        self._indexes.pop(record_id, None)
+            return
+        if collection != "vault":
+            return
+
+        with self._lock:
+            index = self._indexes.get(campaign_id)
+        # Sin índice en disco no hay nada que mantener: se construirá al consultarlo
+        if index is None:
+            campaign_path = self.file_service._get_campaign_path(campaign_id)
+            if not os.path.exists(os.path.join(campaign_path, VECTOR_META_FILENAME)):
+                return
+            index = self.get_index(campaign_id)
+            if index is None:
+                return
+        saved = [record for _, record in changes if record is not None]
+        deleted = [record_id for record_id, record in changes if record is None]
+        if saved:
+            index.upsert(saved)
+        if deleted:
+            index.delete(deleted)
+
+    def search(self, campaign_id, query, k=DEFAULT_VECTOR_TOP_K, exclude_ids=(), min_score=DEFAULT_VECTOR_MIN_SCORE):
+        """[(similitud, item_id)] más cercanos a la pregunta, o None si no existe la campaña."""
+        index = self.get_index(campaign_id)
+        if index is None:
+            return None
+        with span("model.embed"):
+            query_vector = self.embedder.embed([query])[0]
+        return index.search(query_vector, k, exclude_ids=exclude_ids, min_score=min_score)
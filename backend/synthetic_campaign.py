@@ -0,0 +1,165 @@
+"""Generador de campañas sintéticas para benchmarks y pruebas de carga.
+
+    python synthetic_campaign.py --storage /tmp/bench --items 500 --sessions 60 --framework-chars 40000
+
+Escribe a través del motor de almacenamiento (el mismo layout en disco que
+la aplicación: campaign_{id}/metadata.json, vault/{tipo}_{id}.json,
+sessions/session_NN_{id}.json y manifiestos, o las filas de SQLite con
+--engine sqlite). Con la misma --seed genera exactamente el mismo texto.
+"""
+import argparse
+import os
+import random
+from datetime import datetime, timedelta
+
+from services.file_service import FileService
+from services.id_service import generate_id
+from services.sqlite_storage import SqliteStorage
+from services.vault_service import new_vault_item, vault_item_path
+
+VAULT_TYPES = ("character", "npc", "scene", "secret", "location", "monster", "item")
+
+# Escrituras por lote de manifiesto (on_changed)
+BATCH_SIZE = 500
+
+WORDS = (
+    "bruja pantano herrero enano montaña rey reina dragón torre bosque río castillo ladrón gremio "
+    "templo sacerdote orco elfo puerto barco tormenta ruinas cripta espada corona traición alianza "
+    "mercader frontera niebla lobo cuervo hechizo profecía sangre ceniza hierro plata oro mapa "
+    "posada camino puente faro isla abismo susurro juramento exilio rebelión heredero sombra luz"
+).split()
+SYLLABLES = ("ar", "bel", "cor", "dra", "el", "fen", "gor", "hal", "is", "ka", "lor", "mir", "nor", "os", "quel", "ra", "sil", "tor", "ur", "vel", "zar")
+
+
+def _name(rng):
+    return ''.join(rng.choice(SYLLABLES) for _ in range(rng.randint(2, 3))).capitalize()
+
+
+def _text(rng, words):
+    sentences = []
+    while words > 0:
+        length = min(words, rng.randint(6, 16))
+        sentence = ' '.join(rng.choice(WORDS) for _ in range(length))
+        sentences.append(sentence.capitalize() + '.')
+        words -= length
+    return ' '.join(sentences)
+
+
+def _content(rng, item_type, description_words):
+    content = {"name": _name(rng), "description": _text(rng, description_words)}
+    if item_type == "character":
+        content.update(player_name=_name(rng), race=rng.choice(WORDS), background=_text(rng, description_words),
+                       bonds=[_text(rng, 8) for _ in range(2)])
+    elif item_type == "npc":
+        content.update(archetype=rng.choice(WORDS), relationship=rng.choice(WORDS))
+    elif item_type == "location":
+        content.update(aspects=', '.join(rng.sample(WORDS, 3)))
+    return content
+
+
+def generate_campaign(service, items_per_type=50, sessions=20, framework_chars=20000,
+                      description_words=60, notes_words=400, seed=0, types=VAULT_TYPES, title=None):
+    """Crea una campaña completa y devuelve su ID.
+
+    items_per_type items de cada tipo de 'types' (con tags, usos y estados
+    variados), 'sessions' sesiones (todas completadas con resumen y notas
+    salvo la última) y un framework de ~framework_chars caracteres.
+    """
+    rng = random.Random(seed)
+    campaign_id = generate_id()
+    base_path = service.create_campaign_structure(campaign_id)
+
+    items = []
+    for item_type in types:
+        for _ in range(items_per_type):
+            item = new_vault_item({
+                "type": item_type,
+                "tags": rng.sample(WORDS, 2),
+                "content": _content(rng, item_type, description_words),
+            })
+            item['usage_count'] = rng.randint(0, 30)
+            item['status'] = rng.choice(("reserve", "reserve", "active", "used"))
+            items.append(item)
+    for start in range(0, len(items), BATCH_SIZE):
+        batch = items[start:start + BATCH_SIZE]
+        for item in batch:
+            service.save_json(vault_item_path(service, campaign_id, item), item)
+        service.on_changed(campaign_id, "vault", saved=batch)
+
+    started = datetime(2024, 1, 1)
+    session_docs = []
+    for number in range(1, sessions + 1):
+        completed = number < sessions
+        session = {
+            "id": generate_id(),
+            "number": number,
+            "title": f"Sesión {number}: {_name(rng)}",
+            "date": (started + timedelta(days=7 * number)).isoformat(),
+            "strong_start": _text(rng, 30),
+            "recap": _text(rng, 40) if completed else "",
+            "summary": _text(rng, 80) if completed else "",
+            "notes": _text(rng, notes_words),
+            "linked_items": [item['id'] for item in rng.sample(items, min(len(items), 8))],
+            "status": "completed" if completed else "planned",
+            "version": 1,
+        }
+        path = os.path.join(base_path, "sessions", f"session_{number:02d}_{session['id']}.json")
+        service.save_json(path, session)
+        session_docs.append(session)
+    for start in range(0, len(session_docs), BATCH_SIZE):
+        service.on_changed(campaign_id, "sessions", saved=session_docs[start:start + BATCH_SIZE])
+
+    metadata = {
+        "id": campaign_id,
+        "title": title or f"Sintética {_name(rng)}",
+        "elevator_pitch": _text(rng, 40),
+        "moods": ', '.join(rng.sample(WORDS, 3)),
+        "truths": [_text(rng, 12) for _ in range(6)],
+        "fronts": [{"name": _name(rng), "grim_portents": [{"text": _text(rng, 8), "done": False} for _ in range(3)]}
+                   for _ in range(3)],
+        "safety_tools": "Líneas y velos",
+        "framework": _text(rng, framework_chars // 7)[:framework_chars],
+        "framework_summary": "",
+        "use_full_framework": False,
+        "active_session": session_docs[-1]['id'] if session_docs else None,
+        "version": 1,
+    }
+    service.save_json(os.path.join(base_path, "metadata.json"), metadata)
+    service.on_saved(campaign_id, "campaigns", metadata)
+    return campaign_id
+
+
+def open_storage(storage_path, engine="json"):
+    """Motor de almacenamiento sin la aplicación (sin listeners: solo datos y manifiestos)."""
+    if engine == "sqlite":
+        return SqliteStorage(storage_path)
+    return FileService(storage_path)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--storage', required=True, help="directorio de datos (DATA_STORAGE_PATH)")
+    parser.add_argument('--engine', choices=("json", "sqlite"), default="json")
+    parser.add_argument('--campaigns', type=int, default=1)
+    parser.add_argument('--items', type=int, default=50, help="items del vault por tipo")
+    parser.add_argument('--sessions', type=int, default=20)
+    parser.add_argument('--framework-chars', type=int, default=20000)
+    parser.add_argument('--notes-words', type=int, default=400, help="palabras de notas por sesión")
+    parser.add_argument('--seed', type=int, default=0)
+    args = parser.parse_args()
+
+    os.makedirs(args.storage, exist_ok=True)
+    service = open_storage(args.storage, args.engine)
+    try:
+        for i in range(args.campaigns):
+            campaign_id = generate_campaign(
+                service, items_per_type=args.items, sessions=args.sessions,
+                framework_chars=args.framework_chars, notes_words=args.notes_words, seed=args.seed + i,
+            )
+            print(campaign_id)
+    finally:
+        service.close()
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,59 @@
+import json
+
+
+def parse_sse(body):
+    events = []
+    for block in body.strip().split("\n\n"):
+        event, data = "message", None
+        for line in block.split("\n"):
+            if line.startswith("event: "):
+                event = line[len("event: "):]
+            elif line.startswith("data: "):
+                data = json.loads(line[len("data: "):])
+        events.append((event, data))
+    return events
+
+
+def test_chat_stream(client):
+    campaign = client.post('/api/campaigns/', json={"title": "Stream"}).get_json()
+
+    response = client.post(f"/api/campaigns/{campaign['id']}/chat/stream", json={"query": "¿Quién vigila la torre?", "mode": "vault"})
+    assert response.status_code == 200
+    assert response.mimetype == 'text/event-stream'
+
+    events = parse_sse(response.get_data(as_text=True))
+    assert events[-1][0] == "done"
+    chunks = [data["text"] for event, data in events if event == "message"]
+    assert len(chunks) > 1
+    assert "".join(chunks) == "[stub] Respuesta a: ¿Quién vigila la torre?"
+
+
+def test_chat_stream_unknown_campaign(client):
+    response = client.post("/api/campaigns/nope/chat/stream", json={"query": "hola"})
+    assert response.status_code == 404
+
+
+def test_chat_stream_client_disconnect(client):
+    campaign = client.post('/api/campaigns/', json={"title": "Stream"}).get_json()
+
+    response = client.post(f"/api/campaigns/{campaign['id']}/chat/stream", json={"query": "x" * 200}, buffered=False)
+    first = next(response.response)
+    assert first.startswith(b"data: ")
+    # Cerrar a mitad equivale a que el cliente se desconecte
+    response.close()
+
+
+def test_follow_up_reuses_conversation(client):
+    campaign = client.post('/api/campaigns/', json={"title": "Memoria"}).get_json()
+    url = f"/api/campaigns/{campaign['id']}/chat/stream"
+
+    first = parse_sse(client.post(url, json={"query": "uno"}).get_data(as_text=True))[-1][1]
+    second = parse_sse(client.post(url, json={"query": "dos"}).get_data(as_text=True))[-1][1]
+    assert first["reused_conversation"] is False
+    assert second["reused_conversation"] is True
+    assert second["history_messages"] == first["history_messages"] + 2
+
+    # Cambiar el contexto de la campaña abre una conversación nueva
+    client.put(f"/api/campaigns/{campaign['id']}", json={"truths": ["Los dioses han muerto"]})
+    third = parse_sse(client.post(url, json={"query": "tres"}).get_data(as_text=True))[-1][1]
+    assert third["reused_conversation"] is False
@@ -0,0 +1,17 @@
+import app as app_module
+
+
+def test_ai_settings_come_from_app_config(make_app):
+    app = make_app(AI_CONVERSATION_TTL=5, AI_CONTEXT_TOKEN_BUDGET=1234, AI_TURN_CONTEXT_TOKEN_BUDGET=99)
+    assert app.extensions['conversation_store'].ttl_seconds == 5
+    assert app.extensions['context_builder'].budget_tokens == 1234
+    assert app.extensions['context_builder'].turn_budget_tokens == 99
+
+
+def test_shutdown_forgets_the_app(make_app):
+    app = make_app()
+    assert app in app_module._running_apps
+    app_module.shutdown_services(app)
+    assert app not in app_module._running_apps
+    # Idempotente: el fixture vuelve a cerrarla al terminar
+    app_module.shutdown_services(app)
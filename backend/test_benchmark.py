@@ -0,0 +1,31 @@
+import os
+
+from benchmark import run_benchmarks, compare
+from synthetic_campaign import VAULT_TYPES, generate_campaign, open_storage
+
+
+def test_generator_writes_real_layout(tmp_path):
+    storage = str(tmp_path)
+    service = open_storage(storage)
+    cid = generate_campaign(service, items_per_type=3, sessions=4, framework_chars=5000)
+
+    vault = service.read_manifest(cid, "vault")
+    assert len(vault) == 3 * len(VAULT_TYPES)
+    files = os.listdir(os.path.join(storage, f"campaign_{cid}", "vault"))
+    assert sum(1 for name in files if name.startswith("npc_")) == 3
+    sessions = sorted(service.read_manifest(cid, "sessions").values(), key=lambda s: s['number'])
+    assert [s['status'] for s in sessions] == ["completed"] * 3 + ["planned"]
+    assert [c['id'] for c in service.list_campaigns()] == [cid]
+    metadata = service.load_json(os.path.join(storage, f"campaign_{cid}", "metadata.json"))
+    assert len(metadata['framework']) == 5000 and metadata['active_session'] == sessions[-1]['id']
+    service.close()
+
+
+def test_every_case_runs(tmp_path):
+    report = run_benchmarks(str(tmp_path), items_per_type=2, sessions=3, framework_chars=2000,
+                            iterations=1, min_time=0, warmup=0, log=None)
+    assert len(report['results']) > 30
+    assert all(r['n'] >= 1 and r['p99_ms'] >= r['p50_ms'] for r in report['results'].values())
+
+    slower = {**report, "results": {name: {**r, "p50_ms": r['p50_ms'] * 2} for name, r in report['results'].items()}}
+    assert compare(report, slower, log=lambda line: None) == list(report['results'])
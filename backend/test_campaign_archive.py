@@ -0,0 +1,79 @@
+import io
+import zipfile
+
+
+def make_campaign(client):
+    campaign = client.post('/api/campaigns/', json={"title": "Archivo"}).get_json()
+    cid = campaign['id']
+    item = client.post(f"/api/campaigns/{cid}/vault", json={"type": "npc", "content": {"name": "Vigía"}}).get_json()
+    client.put(f"/api/campaigns/{cid}/sessions/{campaign['active_session']}", json={"linked_items": [item['id']]})
+    return cid, item
+
+
+def test_export_import_remaps_ids(client):
+    cid, item = make_campaign(client)
+
+    response = client.get(f"/api/campaigns/{cid}/export")
+    assert response.status_code == 200 and response.mimetype == 'application/zip'
+    data = response.get_data()
+    names = zipfile.ZipFile(io.BytesIO(data)).namelist()
+    assert names[:2] == ["archive.json", "metadata.json"] and len(names) == 4
+
+    imported = client.post('/api/campaigns/import', data=data, content_type='application/zip')
+    assert imported.status_code == 201
+    new = imported.get_json()
+    new_id = new["campaign"]["id"]
+    assert new_id != cid and new["imported"] == {"vault": 1, "sessions": 1}
+
+    items = client.get(f"/api/campaigns/{new_id}/vault").get_json()
+    assert [i["content"]["name"] for i in items] == ["Vigía"] and items[0]["id"] != item["id"]
+    session = client.get(f"/api/campaigns/{new_id}/sessions/{new['campaign']['active_session']}").get_json()
+    assert session["linked_items"] == [items[0]["id"]]
+
+
+def test_import_rejects_invalid_archives(client):
+    assert client.post('/api/campaigns/import', data=b"no soy un zip").status_code == 400
+
+    buffer = io.BytesIO()
+    with zipfile.ZipFile(buffer, 'w') as archive:
+        archive.writestr("metadata.json", '{"title": "X"}')
+        archive.writestr("../fuera.json", "{}")
+    assert client.post('/api/campaigns/import', data=buffer.getvalue()).status_code == 400
+    assert client.get('/api/campaigns/').get_json() == []
+
+
+def test_delete_goes_to_trash_and_restores(client):
+    cid, item = make_campaign(client)
+
+    deleted = client.delete(f"/api/campaigns/{cid}").get_json()
+    assert client.get('/api/campaigns/').get_json() == []
+    trash = client.get('/api/campaigns/_trash').get_json()
+    assert [(t["name"], t["title"]) for t in trash] == [(deleted["trash"], "Archivo")]
+
+    assert client.post(f"/api/campaigns/_trash/{deleted['trash']}/restore").status_code == 201
+    assert [c["id"] for c in client.get('/api/campaigns/').get_json()] == [cid]
+    assert [i["id"] for i in client.get(f"/api/campaigns/{cid}/vault").get_json()] == [item["id"]]
+    assert client.get('/api/campaigns/_trash').get_json() == []
+
+
+def test_restore_rejects_ids_that_are_not_generated_ids(make_app, tmp_path):
+    storage = tmp_path / "storage"
+    client = make_app(DATA_STORAGE_PATH=str(storage)).test_client()
+    trash = storage / "_trash"
+    trash.mkdir(exist_ok=True)
+
+    def write_trash(name, campaign_id, item_id):
+        buffer = io.BytesIO()
+        with zipfile.ZipFile(buffer, 'w') as archive:
+            archive.writestr("metadata.json", '{"id": "%s", "title": "X"}' % campaign_id)
+            archive.writestr("vault/item.json", '{"id": "%s", "type": "npc"}' % item_id)
+        (trash / name).write_bytes(buffer.getvalue())
+
+    good = "0f8fad5b-d9cb-469f-a165-70867728950e"
+    write_trash("campaign_a.20260101T000000.zip", good, "../../fuera")
+    write_trash("campaign_b.20260101T000000.zip", "..", good)
+    for name in ("campaign_a.20260101T000000.zip", "campaign_b.20260101T000000.zip"):
+        assert client.post(f"/api/campaigns/_trash/{name}/restore").status_code == 409
+        assert (trash / name).exists()
+    assert client.get('/api/campaigns/').get_json() == []
+    assert not (storage / "fuera.json").exists() and not list(storage.glob("*/vault/*"))
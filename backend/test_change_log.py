@@ -0,0 +1,72 @@
+import pytest
+
+
+@pytest.mark.parametrize("engine", ["json", "sqlite"])
+def test_changes_since(make_app, engine):
+    client = make_app(STORAGE_ENGINE=engine).test_client()
+    cid = client.post('/api/campaigns/', json={"title": "Cambios"}).get_json()['id']
+
+    start = client.get(f"/api/campaigns/{cid}/changes").get_json()
+    # Alta de la campaña: sesión inicial y metadata
+    assert [(c['collection'], c['op']) for c in start['changes']] == [("sessions", "put"), ("campaigns", "put")]
+    since, log = start['last_seq'], start['log']
+
+    item = client.post(f"/api/campaigns/{cid}/vault", json={"type": "npc"}).get_json()
+    client.put(f"/api/campaigns/{cid}/vault/{item['id']}", json={"status": "active"})
+    client.delete(f"/api/campaigns/{cid}/vault/{item['id']}")
+
+    page = client.get(f"/api/campaigns/{cid}/changes?since={since}&log={log}").get_json()
+    assert [c['seq'] for c in page['changes']] == [since + 1, since + 2, since + 3]
+    assert [c['op'] for c in page['changes']] == ["put", "put", "delete"]
+    assert page['changes'][1]['record']['status'] == "active"
+    assert page['changes'][2]['record'] is None
+
+    assert client.get(f"/api/campaigns/{cid}/changes?since={page['last_seq']}&log={log}").get_json()['changes'] == []
+    assert client.get(f"/api/campaigns/{cid}/changes?since=0&log=otro").get_json()['reset'] is True
+    assert client.get("/api/campaigns/nope/changes").status_code == 404
+
+
+def test_compaction_keeps_latest_change_per_record(make_app):
+    app = make_app()
+    client = app.test_client()
+    cid = client.post('/api/campaigns/', json={"title": "Compacta"}).get_json()['id']
+    app.extensions['change_log'].compact_min_bytes = 2000
+
+    items = [client.post(f"/api/campaigns/{cid}/vault", json={"type": "npc"}).get_json() for _ in range(3)]
+    for n in range(20):
+        for item in items:
+            client.put(f"/api/campaigns/{cid}/vault/{item['id']}", json={"usage_count": n})
+
+    page = client.get(f"/api/campaigns/{cid}/changes").get_json()
+    assert page['last_seq'] == 2 + 3 + 60
+    assert len(page['changes']) < 65
+    latest = {c['id']: c['record'] for c in page['changes'] if c['collection'] == "vault"}
+    assert sorted(latest) == sorted(i['id'] for i in items)
+    assert all(record['usage_count'] == 19 for record in latest.values())
+
+
+def test_stream_sends_pending_changes_then_closes_on_reset(client):
+    cid = client.post('/api/campaigns/', json={"title": "Vivo"}).get_json()['id']
+
+    response = client.get(f"/api/campaigns/{cid}/changes/stream?since=0", buffered=False)
+    assert response.mimetype == 'text/event-stream'
+    first, second = next(response.response), next(response.response)
+    response.close()
+    assert first.startswith(b"id: 1\nevent: change\n")
+    assert second.startswith(b"id: 2\nevent: change\n")
+
+    reset = client.get(f"/api/campaigns/{cid}/changes/stream?log=otro").get_data(as_text=True)
+    assert reset.startswith("event: reset")
+
+
+def test_changes_reject_non_positive_limits(client):
+    cid = client.post('/api/campaigns/', json={"title": "Límites"}).get_json()['id']
+
+    for limit in ("0", "-5", "abc"):
+        response = client.get(f"/api/campaigns/{cid}/changes?limit={limit}")
+        assert response.status_code == 400, limit
+
+    page = client.get(f"/api/campaigns/{cid}/changes?limit=1").get_json()
+    assert len(page['changes']) == 1 and page['more'] is True
+    rest = client.get(f"/api/campaigns/{cid}/changes?since={page['last_seq']}&limit=1").get_json()
+    assert len(rest['changes']) == 1 and rest['more'] is False
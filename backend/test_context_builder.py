@@ -0,0 +1,96 @@
+from services.context_builder import ContextBuilder, estimate_tokens, fit_items, rank_items
+
+
+def make_item(item_id, name, description="", item_type="npc", usage_count=0, tags=None):
+    return {
+        "id": item_id,
+        "type": item_type,
+        "status": "reserve",
+        "usage_count": usage_count,
+        "tags": tags or [],
+        "content": {"name": name, "description": description},
+    }
+
+
+def test_rank_items_prefers_query_overlap_then_links_then_usage():
+    items = [
+        make_item("a", "Posadero", "Sirve cerveza en la posada", usage_count=10),
+        make_item("b", "Dragón rojo", "Duerme bajo la montaña"),
+        make_item("c", "Guardia", "Vigila la puerta"),
+    ]
+    ranked = [item["id"] for _, item in rank_items(items, query="¿Dónde duerme el dragon?")]
+    assert ranked[0] == "b"
+
+    ranked = [item["id"] for _, item in rank_items(items, linked_ids=["c"])]
+    assert ranked[:2] == ["c", "a"]
+
+
+def test_fit_items_summarizes_then_drops():
+    items = [
+        make_item("a", "Corto", "breve"),
+        make_item("b", "Largo", "x " * 400),
+        make_item("c", "Otro largo", "y " * 400),
+    ]
+    texts, report = fit_items(items, budget_tokens=80)
+    assert report["included"] == ["a"]
+    assert report["summarized"] == ["Largo"]
+    assert report["dropped"] == ["Otro largo"]
+    assert sum(estimate_tokens(t) for t in texts) <= 80
+
+
+def test_fit_text_truncates_to_section_budget():
+    builder = ContextBuilder(budget_tokens=100)
+    text, report = builder.fit_text("framework", "palabra " * 500)
+    assert report["truncated"] is True
+    assert estimate_tokens(text) <= builder.section_budget("framework") + 1
+
+
+def test_turn_context_only_includes_matching_items():
+    builder = ContextBuilder(turn_budget_tokens=200)
+    items = [
+        make_item("a", "Bruja del pantano", "Prepara pociones"),
+        make_item("b", "Herrero", "Forja espadas", tags=["pantano"]),
+        make_item("c", "Bardo", "Canta"),
+    ]
+    texts, report = builder.turn_context("Qué sabe la gente del PANTANO", items, exclude_ids=["b"])
+    assert report["included"] == ["a"]
+    assert len(texts) == 1
+
+
+def test_chat_prompt_respects_budget_and_adds_relevant_items(client):
+    campaign = client.post('/api/campaigns/', json={"title": "Presupuesto", "framework": "mundo " * 20000}).get_json()
+    for i in range(50):
+        client.post(f"/api/campaigns/{campaign['id']}/vault", json={"type": "npc", "content": {"name": f"PNJ {i}", "description": "relleno " * 100}})
+    client.post(f"/api/campaigns/{campaign['id']}/vault", json={"type": "npc", "content": {"name": "Gólem de obsidiana", "description": "Guarda la cripta"}})
+
+    response = client.post(f"/api/campaigns/{campaign['id']}/chat", json={"query": "¿Qué guarda el golem?"})
+    assert response.status_code == 200
+    assert "CONTEXTO RELEVANTE DEL VAULT" in response.get_json()["response"]
+    assert "Gólem de obsidiana" in response.get_json()["response"]
+    assert int(response.headers["X-Prompt-Tokens-Est"]) < 8000
+
+
+if __name__ == "__main__":
+    test_rank_items_prefers_query_overlap_then_links_then_usage()
+    test_fit_items_summarizes_then_drops()
+    test_fit_text_truncates_to_section_budget()
+    test_turn_context_only_includes_matching_items()
+    test_chat_prompt_respects_budget_and_adds_relevant_items()
+    print("OK")
+
+
+def test_usage_count_that_is_not_a_number_ranks_as_zero():
+    items = [make_item("a", "Editado a mano", usage_count="muchas"), make_item("b", "Usado", usage_count=3),
+             make_item("c", "Sin campo", usage_count=None)]
+    ranked = rank_items(items)
+    assert [item["id"] for _, item in ranked] == ["b", "a", "c"]
+    assert ranked[1][0] == ranked[2][0] == 0
+
+
+def test_truths_share_the_world_budget_with_fronts(client):
+    truths = [f"Verdad número {i}: " + "los dioses callan " * 20 for i in range(200)]
+    campaign = client.post('/api/campaigns/', json={"title": "Verdades", "truths": truths, "fronts": ["El culto"]}).get_json()
+
+    response = client.post(f"/api/campaigns/{campaign['id']}/chat", json={"query": "hola"})
+    assert response.status_code == 200
+    assert int(response.headers["X-Prompt-Tokens-Est"]) < 8000
@@ -0,0 +1,150 @@
+import os
+
+import pytest
+
+from services.file_service import FileService
+from services.metrics import begin_request, end_request
+
+
+@pytest.fixture
+def service(tmp_path):
+    service = FileService(str(tmp_path))
+    service.create_campaign_structure("c1")
+    yield service
+    service.close()
+
+
+def vault_path(service, filename):
+    return os.path.join(service._get_collection_path("c1", "vault"), filename)
+
+
+def bump_mtime(path):
+    # El mtime de un directorio tiene la resolución del reloj del kernel:
+    # se adelanta a mano para que dos cambios seguidos no compartan marca
+    st = os.stat(path)
+    os.utime(path, ns=(st.st_atime_ns, st.st_mtime_ns + 1_000_000_000))
+
+
+def io_counts(action):
+    metrics, token = begin_request()
+    try:
+        result = action()
+    finally:
+        end_request(token)
+    return result, metrics.counts
+
+
+# --- Índice ID -> archivo ---
+
+def test_index_follows_creates_and_deletes_without_rescanning(service):
+    service.save_json(vault_path(service, "npc_a1.json"), {"id": "a1"})
+    # El primer lock del directorio crea su '.locks' (y cambia su mtime una vez)
+    with service.locked(vault_path(service, "npc_a1.json")):
+        pass
+    assert service.find_file("c1", "vault", "a1") == vault_path(service, "npc_a1.json")
+
+    def create_and_delete():
+        service.save_json(vault_path(service, "npc_b2.json"), {"id": "b2"})
+        service.remove_file(vault_path(service, "npc_a1.json"))
+        return service.find_files("c1", "vault", ["a1", "b2"])
+
+    found, counts = io_counts(create_and_delete)
+    assert found == {"a1": None, "b2": vault_path(service, "npc_b2.json")}
+    assert counts.get("dir_scans", 0) == 0
+
+
+def test_index_is_rebuilt_when_directory_mtime_changes(service):
+    service.save_json(vault_path(service, "npc_a1.json"), {"id": "a1"})
+    assert service.list_ids("c1", "vault") == ["a1"]
+
+    dir_path = service._get_collection_path("c1", "vault")
+    os.remove(vault_path(service, "npc_a1.json"))
+    bump_mtime(dir_path)
+
+    ids, counts = io_counts(lambda: service.list_ids("c1", "vault"))
+    assert ids == [] and counts["dir_scans"] == 1
+    # Ya reconstruido: la siguiente consulta no vuelve a listar el directorio
+    _, counts = io_counts(lambda: service.find_file("c1", "vault", "a1"))
+    assert counts.get("dir_scans", 0) == 0
+
+
+def test_index_sees_files_added_out_of_band(service):
+    service.save_json(vault_path(service, "npc_a1.json"), {"id": "a1"})
+    assert service.find_file("c1", "vault", "c3") is None
+
+    with open(vault_path(service, "location_c3.json"), "w", encoding="utf-8") as f:
+        f.write('{"id": "c3"}')
+    bump_mtime(service._get_collection_path("c1", "vault"))
+
+    assert service.find_file("c1", "vault", "c3") == vault_path(service, "location_c3.json")
+    assert sorted(service.list_ids("c1", "vault")) == ["a1", "c3"]
+    assert service.list_ids("c1", "vault", filename_prefix="location_") == ["c3"]
+
+
+# --- Caché de documentos ---
+
+def test_cache_counts_hits_and_misses_and_writes_through(service):
+    path = vault_path(service, "npc_a1.json")
+    service.save_json(path, {"id": "a1", "version": 1})
+
+    # Write-through: lo recién guardado se sirve sin leer el archivo
+    doc, counts = io_counts(lambda: service.load_json(path))
+    assert doc == {"id": "a1", "version": 1} and counts.get("files_read", 0) == 0
+    assert service.cache_stats()["hits"] == 1 and service.cache_stats()["misses"] == 0
+
+    # Las copias no comparten estado con la caché
+    doc["version"] = 99
+    assert service.load_json(path)["version"] == 1
+
+    service._cache_drop(path)
+    _, counts = io_counts(lambda: service.load_json(path))
+    assert counts["files_read"] == 1
+    assert service.cache_stats()["misses"] == 1
+
+
+def test_cache_is_validated_by_mtime_and_size(service):
+    path = vault_path(service, "npc_a1.json")
+    service.save_json(path, {"id": "a1", "name": "Ana"})
+    st = os.stat(path)
+
+    # Otro proceso reescribe el archivo con otro tamaño
+    with open(path, "w", encoding="utf-8") as f:
+        f.write('{"id": "a1", "name": "Beatriz"}')
+    os.utime(path, ns=(st.st_atime_ns, st.st_mtime_ns))
+    assert service.load_json(path)["name"] == "Beatriz"
+
+    # Mismo tamaño, otro mtime
+    with open(path, "w", encoding="utf-8") as f:
+        f.write('{"id": "a1", "name": "Beatrix"}')
+    bump_mtime(path)
+    assert service.load_json(path)["name"] == "Beatrix"
+
+    os.remove(path)
+    assert service.load_json(path) is None
+    assert service.cache_stats()["entries"] == 0
+
+
+def test_cache_evicts_least_recently_used_within_its_byte_cap(tmp_path):
+    service = FileService(str(tmp_path), cache_max_bytes=100)
+    service.create_campaign_structure("c1")
+    paths = [vault_path(service, f"npc_{i}.json") for i in range(3)]
+    for i, path in enumerate(paths):
+        service.save_json(path, {"id": str(i), "pad": "x" * 10})
+    size = os.path.getsize(paths[0])
+    assert 2 * size <= 100 < 3 * size
+
+    # Solo caben dos: se fue el primero
+    stats = service.cache_stats()
+    assert stats["entries"] == 2 and stats["bytes"] == 2 * size
+    assert paths[0] not in service._doc_cache
+
+    # Usar el segundo lo protege: la próxima expulsión se lleva el tercero
+    service.load_json(paths[1])
+    service.load_json(paths[0])
+    assert list(service._doc_cache) == [paths[1], paths[0]]
+
+    # Un documento mayor que toda la caché no se cachea
+    big = vault_path(service, "npc_big.json")
+    service.save_json(big, {"id": "big", "pad": "x" * 200})
+    assert big not in service._doc_cache and service.cache_stats()["bytes"] <= 100
+    service.close()
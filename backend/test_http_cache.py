@@ -0,0 +1,73 @@
+import gzip
+import json
+import os
+
+import pytest
+
+
+@pytest.mark.parametrize("engine", ["json", "sqlite"])
+def test_conditional_list_requests(make_app, engine):
+    client = make_app(STORAGE_ENGINE=engine).test_client()
+    cid = client.post('/api/campaigns/', json={"title": "Caché"}).get_json()['id']
+    client.post(f"/api/campaigns/{cid}/vault", json={"type": "npc", "content": {"name": "Ana"}})
+
+    for url in (f"/api/campaigns/{cid}/vault", f"/api/campaigns/{cid}/sessions", "/api/campaigns/"):
+        first = client.get(url)
+        etag = first.headers['ETag']
+        assert first.headers['Cache-Control'] == 'private, no-cache'
+        again = client.get(url, headers={"If-None-Match": etag})
+        assert again.status_code == 304 and again.data == b""
+
+    etag = client.get(f"/api/campaigns/{cid}/vault").headers['ETag']
+    client.post(f"/api/campaigns/{cid}/vault", json={"type": "npc", "content": {"name": "Beto"}})
+    changed = client.get(f"/api/campaigns/{cid}/vault", headers={"If-None-Match": etag})
+    assert changed.status_code == 200 and len(changed.get_json()) == 2
+
+
+def test_large_bodies_are_gzipped(client):
+    cid = client.post('/api/campaigns/', json={"title": "Grande"}).get_json()['id']
+    client.post(f"/api/campaigns/{cid}/vault", json={"type": "npc", "content": {"bio": "palabras " * 500}})
+
+    response = client.get(f"/api/campaigns/{cid}/vault", headers={"Accept-Encoding": "gzip"})
+    assert response.headers['Content-Encoding'] == 'gzip'
+    assert response.headers['ETag'].endswith('-gzip"')
+    assert json.loads(gzip.decompress(response.data))[0]['content']['bio'].startswith("palabras")
+    # La ETag con sufijo sigue valiendo para revalidar
+    assert client.get(f"/api/campaigns/{cid}/vault", headers={"If-None-Match": response.headers['ETag']}).status_code == 304
+
+    assert 'Content-Encoding' not in client.get(f"/api/campaigns/{cid}/vault").headers
+
+
+def test_document_etag_is_version_and_stamp(client):
+    campaign = client.post('/api/campaigns/', json={"title": "Doc", "elevator_pitch": "x" * 4000}).get_json()
+    url = f"/api/campaigns/{campaign['id']}"
+
+    response = client.get(url, headers={"Accept-Encoding": "gzip"})
+    etag = response.headers['ETag']
+    assert etag.startswith('"1.') and etag.endswith('-gzip"')
+    assert client.get(url, headers={"If-None-Match": etag}).status_code == 304
+    # If-Match con la ETag comprimida se entiende como la versión 1
+    assert client.put(url, json={"title": "Doc 2"}, headers={"If-Match": etag}).status_code == 200
+    assert client.put(url, json={"title": "Doc 3"}, headers={"If-Match": '"1-gzip"'}).status_code == 412
+    assert client.get(url, headers={"If-None-Match": etag}).status_code == 200
+
+
+def test_hand_edited_document_is_not_a_304(make_app):
+    app = make_app()
+    client = app.test_client()
+    cid = client.post('/api/campaigns/', json={"title": "Antes"}).get_json()['id']
+    url = f"/api/campaigns/{cid}"
+    etag = client.get(url).headers['ETag']
+
+    # Edición a mano sin tocar 'version' (o un documento antiguo que no la tiene)
+    path = os.path.join(app.config['DATA_STORAGE_PATH'], f"campaign_{cid}", "metadata.json")
+    with open(path, encoding='utf-8') as f:
+        metadata = json.load(f)
+    metadata['title'] = "Después, editado a mano"
+    metadata.pop('version')
+    with open(path, 'w', encoding='utf-8') as f:
+        json.dump(metadata, f)
+
+    response = client.get(url, headers={"If-None-Match": etag})
+    assert response.status_code == 200 and response.get_json()['title'] == "Después, editado a mano"
+    assert response.headers['ETag'].startswith('"0.')
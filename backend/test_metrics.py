@@ -0,0 +1,36 @@
+import os
+import pstats
+
+from synthetic_campaign import generate_campaign, open_storage
+
+
+def test_metrics_and_server_timing(make_app, tmp_path):
+    storage = str(tmp_path / "generated")
+    generator = open_storage(storage)
+    cid = generate_campaign(generator, items_per_type=2, sessions=2, framework_chars=1000)
+    # App nueva sobre los datos: su caché de documentos está vacía
+    client = make_app(DATA_STORAGE_PATH=storage, SUMMARY_WORKERS=0).test_client()
+
+    timing = client.get(f"/api/campaigns/{cid}/vault").headers['Server-Timing']
+    assert "storage.read_many;dur=" in timing and "app;dur=" in timing
+    assert "files_read=" in timing and "bytes_parsed=" in timing
+    assert "prompt.build;dur=" in client.post(f"/api/campaigns/{cid}/chat", json={"query": "hola"}).headers['Server-Timing']
+
+    response = client.get('/metrics')
+    assert response.headers['Content-Type'].startswith('text/plain; version=0.0.4')
+    body = response.get_data(as_text=True)
+    assert f'http_requests_total{{method="GET",route="/api/campaigns/<campaign_id>/vault",status="200",pid="{os.getpid()}"}}' in body
+    assert 'app_span_seconds_bucket{span="model.call",pid=' in body
+    assert 'app_request_files_read_count{route="/api/campaigns/<campaign_id>/vault"' in body
+    assert "# TYPE http_request_duration_seconds histogram" in body
+
+
+def test_slow_requests_are_profiled(make_app, tmp_path):
+    profiles = str(tmp_path / "profiles")
+    client = make_app(SUMMARY_WORKERS=0, PROFILE_SLOW_MS=0.001, PROFILE_DIR=profiles).test_client()
+    client.post('/api/campaigns/', json={"title": "Perfil"})
+
+    names = os.listdir(profiles)
+    assert len(names) == 1 and names[0].endswith("_POST_api_campaigns_" + names[0].rsplit('_', 1)[-1])
+    stats = pstats.Stats(os.path.join(profiles, names[0]))
+    assert any(func[2] == "create_campaign" for func in stats.stats)
@@ -0,0 +1,93 @@
+import threading
+import time
+
+from services.response_cache import ResponseCache, normalize_query
+
+
+def test_single_flight_shares_one_call():
+    cache = ResponseCache()
+    calls = []
+    release = threading.Event()
+
+    def compute():
+        calls.append(1)
+        release.wait(5)
+        return "respuesta"
+
+    results = []
+    threads = [threading.Thread(target=lambda: results.append(cache.fetch(("c", 1, "q"), compute))) for _ in range(5)]
+    for t in threads:
+        t.start()
+    time.sleep(0.1)
+    release.set()
+    for t in threads:
+        t.join()
+
+    assert len(calls) == 1
+    assert sorted(source for _, source in results) == ["coalesced"] * 4 + ["miss"]
+    assert cache.fetch(("c", 1, "q"), compute) == ("respuesta", "hit")
+    assert cache.stats("c")["hit_rate"] == round(5 / 6, 3)
+
+
+def test_bounds_and_expiry():
+    cache = ResponseCache(ttl_seconds=60, max_entries=2)
+    for i in range(3):
+        cache.fetch(("c", i), lambda: "x")
+    assert cache.stats()["entries"] == 2
+    assert cache.fetch(("c", 0), lambda: "y") == ("y", "miss")
+
+    cache.ttl_seconds = -1
+    cache.fetch(("c", 9), lambda: "old")
+    assert cache.fetch(("c", 9), lambda: "new") == ("new", "miss")
+    assert normalize_query("  ¿Quién  es ANA? ") == normalize_query("quien es ana")
+
+
+def test_chat_uses_cache_until_context_changes(make_app):
+    client = make_app(SUMMARY_WORKERS=0).test_client()
+    cid = client.post('/api/campaigns/', json={"title": "Caché IA"}).get_json()['id']
+    url = f"/api/campaigns/{cid}/chat"
+
+    first = client.post(url, json={"query": "¿Quién vigila la torre?"})
+    # Como primer turno de nuevo (reset): misma respuesta
+    again = client.post(url, json={"query": "quien vigila la torre", "reset": True})
+    assert first.headers['X-AI-Cache'] == "miss" and again.headers['X-AI-Cache'] == "hit"
+    assert again.get_json() == first.get_json()
+
+    assert client.post(url, json={"query": "quien vigila la torre", "fresh": True}).headers['X-AI-Cache'] == "bypass"
+    assert client.post(url, json={"query": "quien vigila la torre", "mode": "session", "sessionId": "s1"}).headers['X-AI-Cache'] == "miss"
+
+    stream = client.post(f"{url}/stream", json={"query": "¿Quién vigila la torre?", "reset": True})
+    assert stream.headers['X-AI-Cache'] == "hit"
+
+    # Cualquier escritura en la campaña cambia la versión del contexto
+    client.put(f"/api/campaigns/{cid}", json={"truths": ["La torre cayó"]})
+    assert client.post(url, json={"query": "¿Quién vigila la torre?", "reset": True}).headers['X-AI-Cache'] == "miss"
+
+    stats = client.get(f"{url}/cache").get_json()
+    assert stats["hits"] == 2 and stats["misses"] == 3 and stats["bypassed"] == 1
+
+    disabled = make_app(SUMMARY_WORKERS=0, AI_RESPONSE_CACHE_TTL=0).test_client()
+    cid = disabled.post('/api/campaigns/', json={"title": "Sin caché"}).get_json()['id']
+    assert 'X-AI-Cache' not in disabled.post(f"/api/campaigns/{cid}/chat", json={"query": "hola"}).headers
+
+
+def test_follow_up_questions_do_not_share_answers_across_conversation_states(make_app):
+    client = make_app(SUMMARY_WORKERS=0).test_client()
+    app_store = client.application.extensions['conversation_store']
+    cid = client.post('/api/campaigns/', json={"title": "Seguimientos"}).get_json()['id']
+    url = f"/api/campaigns/{cid}/chat"
+
+    assert client.post(url, json={"query": "¿Quién vigila la torre?"}).headers['X-AI-Cache'] == "miss"
+    assert client.post(url, json={"query": "¿Y por qué?"}).headers['X-AI-Cache'] == "miss"
+    # La misma pregunta, pero ahora como seguimiento de otra conversación
+    assert client.post(url, json={"query": "¿Quién vigila la torre?"}).headers['X-AI-Cache'] == "miss"
+
+    # Tras un reset vuelve a ser un primer turno: acierto, y queda en el historial
+    hit = client.post(url, json={"query": "¿Quién vigila la torre?", "reset": True})
+    assert hit.headers['X-AI-Cache'] == "hit"
+    history = app_store.peek((cid, "vault", None)).chat.history
+    assert len(history) == 4 and history[-1]["parts"] == [hit.get_json()["response"]]
+
+    # El seguimiento parte de ese historial, igual que tras una respuesta nueva
+    assert client.post(url, json={"query": "¿Y por qué?"}).headers['X-AI-Cache'] == "hit"
+    assert len(app_store.peek((cid, "vault", None)).chat.history) == 6
@@ -0,0 +1,104 @@
+import os
+
+import pytest
+
+from services.search_service import SEARCH_LOG_FILENAME, SEARCH_SNAPSHOT_FILENAME
+
+
+def search(client, cid, query, **params):
+    response = client.get(f"/api/campaigns/{cid}/search", query_string={"q": query, **params})
+    assert response.status_code == 200, response.get_json()
+    return response.get_json()
+
+
+def add(client, cid, kind, name, description=""):
+    return client.post(f"/api/campaigns/{cid}/vault", json={
+        "type": kind, "content": {"name": name, "description": description}}).get_json()
+
+
+@pytest.fixture
+def campaign(client):
+    return client.post('/api/campaigns/', json={"title": "Búsqueda"}).get_json()['id']
+
+
+def test_bm25_ranking(client, campaign):
+    lair = add(client, campaign, "location", "Cubil", "El dragón duerme aquí; el dragón vigila su oro.")
+    passing = add(client, campaign, "npc", "Bardo", "Canta sobre un dragón, la taberna, el camino, la lluvia, "
+                                                     "el puerto, los barcos y las ferias del reino.")
+    smith = add(client, campaign, "npc", "Herrera", "Forja espadas.")
+
+    results = search(client, campaign, "dragón")
+    # Más apariciones en un texto más corto puntúan más
+    assert [r['id'] for r in results] == [lair['id'], passing['id']]
+    assert results[0]['score'] > results[1]['score'] > 0
+    assert results[0]['kind'] == "vault" and results[0]['type'] == "location" and results[0]['label'] == "Cubil"
+
+    # Los términos raros pesan más que los comunes
+    results = search(client, campaign, "oro dragón")
+    assert results[0]['id'] == lair['id']
+    assert [r['id'] for r in search(client, campaign, "forja")] == [smith['id']]
+
+
+def test_accents_and_case_are_folded(client, campaign):
+    item = add(client, campaign, "npc", "Ñandú", "Guardián del Dragón Rojo")
+
+    for query in ("dragon", "DRAGÓN", "guardian", "nandu", "drag"):
+        assert [r['id'] for r in search(client, campaign, query)] == [item['id']], query
+    assert search(client, campaign, "dragona") == []
+
+
+def test_sessions_and_kind_filter(client, campaign):
+    session = client.post(f"/api/campaigns/{campaign}/sessions", json={"recap": "Huyeron del dragón"}).get_json()
+    item = add(client, campaign, "npc", "Dragón")
+
+    assert {r['id'] for r in search(client, campaign, "dragon")} == {session['id'], item['id']}
+    assert [r['id'] for r in search(client, campaign, "dragon", kind="sessions")] == [session['id']]
+    assert len(search(client, campaign, "dragon", limit=1)) == 1
+
+
+def test_updates_and_deletes_reach_the_index(client, campaign):
+    item = add(client, campaign, "npc", "Grifo")
+    assert search(client, campaign, "grifo")
+
+    client.put(f"/api/campaigns/{campaign}/vault/{item['id']}", json={"content": {"name": "Mantícora"}})
+    assert search(client, campaign, "grifo") == []
+    assert [r['id'] for r in search(client, campaign, "manticora")] == [item['id']]
+
+    client.delete(f"/api/campaigns/{campaign}/vault/{item['id']}")
+    assert search(client, campaign, "manticora") == []
+
+
+def test_index_survives_a_restart_from_snapshot_and_log(make_app):
+    app = make_app()
+    client = app.test_client()
+    cid = client.post('/api/campaigns/', json={"title": "Reinicio"}).get_json()['id']
+    kept = add(client, cid, "npc", "Basilisco")
+    removed = add(client, cid, "npc", "Quimera")
+    # La primera búsqueda crea el snapshot; lo que sigue va al log
+    assert search(client, cid, "basilisco")
+    late = add(client, cid, "location", "Torre del Basilisco")
+    client.delete(f"/api/campaigns/{cid}/vault/{removed['id']}")
+
+    campaign_path = app.extensions['file_service']._get_campaign_path(cid)
+    assert os.path.exists(os.path.join(campaign_path, SEARCH_SNAPSHOT_FILENAME))
+    log_path = os.path.join(campaign_path, SEARCH_LOG_FILENAME)
+    with open(log_path, encoding="utf-8") as f:
+        assert len(f.readlines()) == 2
+    # Un corte a mitad de la última línea no impide cargar el resto
+    with open(log_path, "a", encoding="utf-8") as f:
+        f.write('{"op":"put","key":"vault:x"')
+
+    restarted = make_app(DATA_STORAGE_PATH=app.config['DATA_STORAGE_PATH']).test_client()
+    assert {r['id'] for r in search(restarted, cid, "basilisco")} == {kept['id'], late['id']}
+    assert search(restarted, cid, "quimera") == []
+
+
+@pytest.mark.parametrize("limit", ["-1", "0", "abc"])
+def test_invalid_limit_is_rejected(client, campaign, limit):
+    response = client.get(f"/api/campaigns/{campaign}/search?q=npc&limit={limit}")
+    assert response.status_code == 400
+
+
+def test_query_is_required(client, campaign):
+    assert client.get(f"/api/campaigns/{campaign}/search?q=%20").status_code == 400
+    assert client.get("/api/campaigns/missing/search?q=npc").status_code == 404
@@ -0,0 +1,80 @@
+import re
+
+from routes.ai_routes import get_rolling_memory
+
+
+def files_read(response):
+    match = re.search(r'files_read=(\d+)', response.headers['Server-Timing'])
+    return int(match.group(1)) if match else 0
+
+
+def complete(client, cid, session, summary):
+    client.put(f"/api/campaigns/{cid}/sessions/{session['id']}", json={"status": "completed", "summary": summary, "title": f"T{session['number']}"})
+
+
+def test_timeline_tracks_sessions(client):
+    cid = client.post('/api/campaigns/', json={"title": "Crónica"}).get_json()['id']
+    sessions = [client.get(f"/api/campaigns/{cid}/sessions").get_json()[0]]
+    sessions += [client.post(f"/api/campaigns/{cid}/sessions", json={}).get_json() for _ in range(3)]
+    assert [s['number'] for s in sessions] == [1, 2, 3, 4]
+
+    complete(client, cid, sessions[0], "Llegan al pueblo")
+    complete(client, cid, sessions[2], "Cae la torre")
+    timeline = client.get(f"/api/campaigns/{cid}/sessions/timeline").get_json()
+    assert [s['number'] for s in timeline['sessions']] == [1, 2, 3, 4]
+    assert timeline['next_number'] == 5
+    assert 'notes' not in timeline['sessions'][0]
+
+    completed = client.get(f"/api/campaigns/{cid}/sessions/timeline?status=completed").get_json()
+    assert [s['summary'] for s in completed['sessions']] == ["Llegan al pueblo", "Cae la torre"]
+
+    # Borrar la última sesión libera su número
+    client.delete(f"/api/campaigns/{cid}/sessions/{sessions[3]['id']}")
+    assert client.post(f"/api/campaigns/{cid}/sessions", json={}).get_json()['number'] == 4
+
+
+def test_rolling_memory_window_is_configurable(make_app):
+    app = make_app(ROLLING_MEMORY_SESSIONS=2)
+    client = app.test_client()
+    cid = client.post('/api/campaigns/', json={"title": "Memoria"}).get_json()['id']
+    first = client.get(f"/api/campaigns/{cid}/sessions").get_json()[0]
+    complete(client, cid, first, "Uno")
+    for summary in ("Dos", "Tres"):
+        complete(client, cid, client.post(f"/api/campaigns/{cid}/sessions", json={}).get_json(), summary)
+
+    with app.app_context():
+        assert get_rolling_memory(cid) == "- Sesión 2 (T2): Dos\n- Sesión 3 (T3): Tres\n"
+        assert get_rolling_memory(cid, limit=0) == ""
+        assert get_rolling_memory(cid, limit=5).count("- Sesión") == 3
+
+
+def test_new_sessions_do_not_reread_the_others(make_app):
+    app = make_app()
+    client = app.test_client()
+    service = app.extensions['file_service']
+    cid = client.post('/api/campaigns/', json={"title": "Larga"}).get_json()['id']
+    for _ in range(7):
+        client.post(f"/api/campaigns/{cid}/sessions", json={})
+    assert client.get(f"/api/campaigns/{cid}/sessions/timeline").get_json()['next_number'] == 9
+
+    # Sin caché de documentos: solo el manifiesto sale de disco
+    service._cache_drop_prefix(service._get_campaign_path(cid))
+    created = client.post(f"/api/campaigns/{cid}/sessions", json={})
+    assert created.get_json()['number'] == 9 and files_read(created) <= 2
+    timeline = client.get(f"/api/campaigns/{cid}/sessions/timeline")
+    assert [s['number'] for s in timeline.get_json()['sessions']] == list(range(1, 10))
+    assert files_read(timeline) == 0
+
+
+def test_timeline_picks_up_sessions_written_by_another_worker(make_app, tmp_path):
+    storage = str(tmp_path / "compartido")
+    first, second = make_app(DATA_STORAGE_PATH=storage).test_client(), make_app(DATA_STORAGE_PATH=storage).test_client()
+    cid = first.post('/api/campaigns/', json={"title": "Dos workers"}).get_json()['id']
+    session = first.get(f"/api/campaigns/{cid}/sessions").get_json()[0]
+    assert first.get(f"/api/campaigns/{cid}/sessions/timeline").get_json()['sessions'][0]['summary'] == ""
+
+    complete(second, cid, session, "Desde el otro worker")
+    second.post(f"/api/campaigns/{cid}/sessions", json={})
+    timeline = first.get(f"/api/campaigns/{cid}/sessions/timeline").get_json()
+    assert [s['summary'] for s in timeline['sessions']] == ["Desde el otro worker", ""]
+    assert timeline['next_number'] == 3
@@ -0,0 +1,241 @@
+import json
+import os
+import re
+import threading
+
+import pytest
+
+from services.file_service import FileService
+from services.metrics import begin_request, end_request
+from services.sqlite_storage import SqliteStorage
+from services.storage_transfer import copy_campaigns, export_to_files
+
+
+@pytest.mark.parametrize("engine", ["json", "sqlite"])
+def test_campaign_flow(make_app, engine):
+    client = make_app(STORAGE_ENGINE=engine).test_client()
+    campaign = client.post('/api/campaigns/', json={"title": "Motor"}).get_json()
+    cid = campaign['id']
+
+    for i, kind in enumerate(["npc", "npc", "location"]):
+        client.post(f"/api/campaigns/{cid}/vault", json={"type": kind, "content": {"name": f"Cosa {i}"}})
+    assert len(client.get(f"/api/campaigns/{cid}/vault?type=npc").get_json()) == 2
+
+    item = client.get(f"/api/campaigns/{cid}/vault?type=location").get_json()[0]
+    updated = client.put(f"/api/campaigns/{cid}/vault/{item['id']}", json={"status": "active"}, headers={"If-Match": '"1"'})
+    assert updated.status_code == 200 and updated.get_json()["version"] == 2
+    stale = client.put(f"/api/campaigns/{cid}/vault/{item['id']}", json={"status": "reserve"}, headers={"If-Match": '"1"'})
+    assert stale.status_code == 412
+
+    session = client.post(f"/api/campaigns/{cid}/sessions", json={}).get_json()
+    assert session["number"] == 2
+    assert [s["number"] for s in client.get(f"/api/campaigns/{cid}/sessions").get_json()] == [1, 2]
+    assert client.delete(f"/api/campaigns/{cid}/sessions/{session['id']}").status_code == 200
+
+    assert [c["id"] for c in client.get('/api/campaigns/').get_json()] == [cid]
+    assert client.delete(f"/api/campaigns/{cid}").status_code == 200
+    assert client.get('/api/campaigns/').get_json() == []
+
+
+def read_tree(root):
+    """{ruta relativa: documento} de los documentos de un layout de archivos."""
+    tree = {}
+    for dirpath, _, filenames in os.walk(root):
+        for filename in filenames:
+            if filename.endswith(".json") and not filename.startswith("_"):
+                with open(os.path.join(dirpath, filename), encoding='utf-8') as f:
+                    tree[os.path.relpath(os.path.join(dirpath, filename), root)] = json.load(f)
+    return tree
+
+
+def test_export_import_round_trip(make_app, tmp_path):
+    app = make_app()
+    client = app.test_client()
+    cid = client.post('/api/campaigns/', json={"title": "Ida y vuelta"}).get_json()['id']
+    client.post(f"/api/campaigns/{cid}/vault", json={"type": "npc", "tags": ["a"], "content": {"name": "Ñandú"}})
+    client.post(f"/api/campaigns/{cid}/sessions", json={"recap": "Hola"})
+    files_path = app.config['DATA_STORAGE_PATH']
+
+    sqlite = SqliteStorage(str(tmp_path / "sqlite"))
+    files = FileService(files_path)
+    copied = copy_campaigns(files, sqlite)
+    assert copied == {cid: (1, 2)}
+
+    export_path = str(tmp_path / "export")
+    export_to_files(sqlite, export_path)
+    assert read_tree(export_path) == read_tree(files_path)
+    files.close()
+    sqlite.close()
+
+
+def test_load_many_keeps_order_and_skips_corrupt_files(tmp_path):
+    service = FileService(str(tmp_path), load_workers=4)
+    cid = "c1"
+    dir_path = os.path.join(service.create_campaign_structure(cid), "vault")
+    paths = []
+    for i in range(20):
+        path = os.path.join(dir_path, f"npc_{i:04d}.json")
+        service.save_json(path, {"id": f"{i:04d}", "type": "npc", "version": 1})
+        paths.append(path)
+    with open(paths[3], 'w', encoding='utf-8') as f:
+        f.write('{"id": "0003", roto')
+    service.close()
+    service = FileService(service.storage_path, load_workers=4)
+
+    missing = os.path.join(dir_path, "npc_missing.json")
+    docs = service.load_many(paths + [missing])
+    assert [d['id'] if d else None for d in docs] == [f"{i:04d}" if i != 3 else None for i in range(20)] + [None]
+    assert service.cache_stats()['entries'] == 19
+
+    # La reconstrucción del manifiesto sigue adelante sin el documento roto
+    assert sorted(service.rebuild_manifest(cid, "vault")) == [f"{i:04d}" for i in range(20) if i != 3]
+    service.close()
+
+
+def test_compact_format_and_reformat(make_app):
+    app = make_app(STORAGE_FORMAT="compact")
+    client = app.test_client()
+    cid = client.post('/api/campaigns/', json={"title": "Compacta"}).get_json()['id']
+    item = client.post(f"/api/campaigns/{cid}/vault", json={"type": "npc", "content": {"name": "Ñandú"}}).get_json()
+    response = client.get(f"/api/campaigns/{cid}/vault")
+    assert "Ñandú".encode('utf-8') in response.get_data() and response.get_json() == [item]
+
+    service = app.extensions['file_service']
+    path = service.find_file(cid, "vault", item['id'])
+    with open(path, 'rb') as f:
+        assert b"\n" not in f.read()
+
+    # Migración a 'pretty': mismo contenido, misma versión, legible por la app
+    result = app.test_cli_runner().invoke(args=['reformat-storage', '--format', 'pretty'])
+    assert result.exit_code == 0 and "reescritos en formato pretty" in result.output
+    with open(path, encoding='utf-8') as f:
+        text = f.read()
+    assert text.startswith('{\n  "') and json.loads(text) == item
+    assert client.get(f"/api/campaigns/{cid}/vault").get_json() == [item]
+    assert service.reformat_documents(storage_format="pretty")['rewritten'] == 0
+
+
+@pytest.mark.parametrize("engine_class", [FileService, SqliteStorage])
+def test_trash_file_copies_before_removing(engine_class, tmp_path):
+    engine = engine_class(str(tmp_path))
+    engine.create_campaign_structure("c1")
+    path = os.path.join(engine._get_collection_path("c1", "vault"), "npc_n1.json")
+    engine.save_json(path, {"id": "n1", "type": "npc", "content": {"name": "Ñandú"}})
+
+    engine.trash_file(path)
+
+    assert engine.load_json(path) is None
+    trash_dir = tmp_path / "_trash" / "campaign_c1" / "vault"
+    assert os.listdir(trash_dir) == ["npc_n1.json"]
+    assert json.loads((trash_dir / "npc_n1.json").read_text(encoding="utf-8"))["content"] == {"name": "Ñandú"}
+    engine.close()
+
+
+@pytest.mark.parametrize("engine_class", [FileService, SqliteStorage])
+def test_trash_file_excludes_concurrent_updates(engine_class, tmp_path):
+    engine = engine_class(str(tmp_path))
+    engine.create_campaign_structure("c1")
+    path = os.path.join(engine._get_collection_path("c1", "vault"), "npc_n1.json")
+    engine.save_json(path, {"id": "n1", "type": "npc", "version": 1})
+
+    copied, release = threading.Event(), threading.Event()
+    copy_to_trash = engine._copy_to_trash
+
+    def slow_copy(*args):
+        copy_to_trash(*args)
+        copied.set()
+        release.wait(5)
+
+    engine._copy_to_trash = slow_copy
+    trasher = threading.Thread(target=engine.trash_file, args=(path,))
+    trasher.start()
+    assert copied.wait(5)
+
+    # Un PUT que llega entre la copia y el borrado espera al lock y ya no encuentra el documento
+    results = []
+    updater = threading.Thread(target=lambda: results.append(engine.update_json(path, lambda doc: None)))
+    updater.start()
+    updater.join(0.2)
+    assert updater.is_alive()
+    release.set()
+    trasher.join(5)
+    updater.join(5)
+    assert results == [None]
+    assert engine.load_json(path) is None
+    engine.close()
+
+def test_manifest_keeps_listing_fields_only(make_app):
+    app = make_app()
+    client = app.test_client()
+    cid = client.post('/api/campaigns/', json={"title": "Ligera", "framework": "mundo " * 5000}).get_json()['id']
+    item = client.post(f"/api/campaigns/{cid}/vault", json={"type": "npc", "content": {"name": "Ana", "bio": "texto " * 5000}}).get_json()
+
+    # Los listados siguen devolviendo los documentos completos
+    assert client.get(f"/api/campaigns/{cid}/vault").get_json() == [item]
+    assert client.get(f"/api/campaigns/{cid}/vault?fields=status").get_json() == [{"id": item['id'], "status": "reserve"}]
+    assert client.get('/api/campaigns/').get_json()[0]['framework'].startswith("mundo")
+
+    service = app.extensions['file_service']
+    vault_manifest = os.path.join(service._get_collection_path(cid, "vault"), "_index.json")
+    campaigns_manifest = os.path.join(app.config['DATA_STORAGE_PATH'], "_campaigns.json")
+    assert os.path.getsize(vault_manifest) < 1000 and os.path.getsize(campaigns_manifest) < 1000
+    assert service.read_manifest(cid, "vault")[item['id']]['name'] == "Ana"
+
+    # Una edición a mano que solo cambia el contenido también se detecta
+    path = service.find_file(cid, "vault", item['id'])
+    with open(path, 'w', encoding='utf-8') as f:
+        json.dump(dict(item, content={"name": "Ana", "bio": "otra historia"}), f)
+    assert service.apply_external_changes(cid, "vault", [os.path.basename(path)]) == 1
+    assert client.get(f"/api/campaigns/{cid}/vault").get_json()[0]['content']['bio'] == "otra historia"
+
+
+def files_read(response):
+    match = re.search(r'files_read=(\d+)', response.headers['Server-Timing'])
+    return int(match.group(1)) if match else 0
+
+
+def test_listing_fields_are_served_from_the_manifest(make_app):
+    app = make_app()
+    client = app.test_client()
+    cid = client.post('/api/campaigns/', json={"title": "Listados"}).get_json()['id']
+    for i in range(5):
+        client.post(f"/api/campaigns/{cid}/vault", json={"type": "npc", "content": {"name": f"NPC {i}"}})
+        client.post(f"/api/campaigns/{cid}/sessions", json={})
+    client.get(f"/api/campaigns/{cid}/vault")
+
+    # Otro proceso, con la caché de documentos vacía: solo lee el manifiesto
+    cold = make_app(DATA_STORAGE_PATH=app.config['DATA_STORAGE_PATH']).test_client()
+    sessions = cold.get(f"/api/campaigns/{cid}/sessions?fields=number,status")
+    # La campaña nace con la sesión 1
+    assert [s['number'] for s in sessions.get_json()] == [1, 2, 3, 4, 5, 6]
+    assert set(sessions.get_json()[0]) == {'id', 'number', 'status'}
+    assert files_read(sessions) == 1
+    vault = cold.get(f"/api/campaigns/{cid}/vault?fields=type,status")
+    assert len(vault.get_json()) == 5 and files_read(vault) == 1
+
+    # Sin fields, documentos completos
+    assert 'notes' in cold.get(f"/api/campaigns/{cid}/sessions").get_json()[0]
+
+
+def test_sqlite_caches_bounded_listings_and_reads_documents_by_id(tmp_path):
+    engine = SqliteStorage(str(tmp_path), max_cached_listings=2)
+    for cid in ("c1", "c2", "c3"):
+        engine.create_campaign_structure(cid)
+        for i in range(3):
+            path = os.path.join(engine._get_collection_path(cid, "vault"), f"npc_{cid}n{i}.json")
+            engine.save_json(path, {"id": f"{cid}n{i}", "type": "npc", "content": {"name": f"N{i}"}, "version": 1})
+        assert len(engine.read_manifest(cid, "vault")) == 3
+    assert engine.cache_stats()["manifests"] == 2
+    assert 'content' not in engine.read_manifest("c3", "vault")["c3n0"]
+
+    metrics, token = begin_request()
+    try:
+        docs = engine.load_records("c1", "vault", ["c1n2", "c1n0", "missing"])
+    finally:
+        end_request(token)
+    assert list(docs) == ["c1n2", "c1n0"] and docs["c1n0"]["content"] == {"name": "N0"}
+    assert metrics.counts["files_read"] == 2
+
+    indexes = {name for (name,) in engine._db().execute("SELECT name FROM sqlite_master WHERE type = 'index'")}
+    assert "documents_filename" in indexes and not indexes & {"documents_type", "documents_status", "documents_session_number"}
+    engine.close()
@@ -0,0 +1,50 @@
+import multiprocessing
+import os
+import threading
+
+import pytest
+
+from services.storage_engine import StorageEngine, fcntl
+
+PROCESSES = 3
+THREADS = 4
+INCREMENTS = 150
+
+
+def _read_modify_write(engine, path):
+    with engine.locked(path):
+        with open(path, encoding='utf-8') as f:
+            value = int(f.read())
+        # Ventana entre leer y escribir: sin exclusión real se pierden incrementos
+        os.sched_yield()
+        with open(path, 'w', encoding='utf-8') as f:
+            f.write(str(value + 1))
+
+
+def _worker(directory):
+    engine = StorageEngine(directory)
+    paths = [os.path.join(directory, f"counter_{t}.txt") for t in range(THREADS)]
+    threads = [threading.Thread(target=lambda p=p: [_read_modify_write(engine, p) for _ in range(INCREMENTS)])
+               for p in paths]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    engine.close()
+
+
+@pytest.mark.skipif(fcntl is None, reason="needs fcntl")
+def test_locks_exclude_threads_of_several_processes(tmp_path):
+    for t in range(THREADS):
+        (tmp_path / f"counter_{t}.txt").write_text("0")
+    # Cada hilo de un proceso suelta sus locks mientras otros hilos del mismo
+    # proceso tienen los suyos tomados en el mismo directorio
+    context = multiprocessing.get_context("fork")
+    processes = [context.Process(target=_worker, args=(str(tmp_path),)) for _ in range(PROCESSES)]
+    for process in processes:
+        process.start()
+    for process in processes:
+        process.join(timeout=120)
+        assert process.exitcode == 0
+
+    assert [int((tmp_path / f"counter_{t}.txt").read_text()) for t in range(THREADS)] == [PROCESSES * INCREMENTS] * THREADS
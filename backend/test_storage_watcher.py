@@ -0,0 +1,94 @@
+import json
+import os
+import time
+
+import pytest
+
+from services.id_service import generate_id
+from services.storage_watcher import INOTIFY_AVAILABLE
+from services.vault_service import new_vault_item
+
+
+MODES = [pytest.param("inotify", marks=pytest.mark.skipif(not INOTIFY_AVAILABLE, reason="needs Linux inotify")), "poll"]
+
+
+@pytest.fixture
+def make_watched_app(make_app):
+    def make(mode):
+        return make_app(SUMMARY_WORKERS=0, STORAGE_WATCHER=mode,
+                        STORAGE_WATCHER_DEBOUNCE=0.3, STORAGE_WATCHER_POLL_INTERVAL=0.05)
+    return make
+
+
+def wait_for(condition, timeout=5):
+    deadline = time.monotonic() + timeout
+    while not condition():
+        assert time.monotonic() < deadline, "timed out"
+        time.sleep(0.02)
+
+
+def write_by_hand(path, doc):
+    with open(path, 'w', encoding='utf-8') as f:
+        json.dump(doc, f, indent=2, ensure_ascii=False)
+
+
+@pytest.mark.parametrize("mode", MODES)
+def test_external_edits_reach_listings_search_and_change_log(make_watched_app, mode):
+    app = make_watched_app(mode)
+    watcher = app.extensions['storage_watcher']
+    assert watcher.mode == mode
+    client = app.test_client()
+    cid = client.post('/api/campaigns/', json={"title": "A mano"}).get_json()['id']
+    kept, removed = [client.post(f"/api/campaigns/{cid}/vault", json={"type": "npc", "content": {"name": name}}).get_json()
+                     for name in ("Brujo", "Herrera")]
+    # Las escrituras de la propia API no cuentan como cambios externos
+    wait_for(lambda: watcher.stats['batches'] >= 1)
+    time.sleep(0.5)
+    assert watcher.stats['changes'] == 0
+    since = client.get(f"/api/campaigns/{cid}/changes").get_json()['last_seq']
+
+    vault_dir = os.path.join(app.config['DATA_STORAGE_PATH'], f"campaign_{cid}", "vault")
+    write_by_hand(os.path.join(vault_dir, f"npc_{kept['id']}.json"), dict(kept, content={"name": "Zarovar el Gris"}))
+    os.remove(os.path.join(vault_dir, f"npc_{removed['id']}.json"))
+    added = new_vault_item({"type": "location", "content": {"name": "Faro Hundido"}})
+    write_by_hand(os.path.join(vault_dir, f"location_{added['id']}.json"), added)
+    wait_for(lambda: watcher.stats['changes'] >= 3)
+
+    names = sorted(item['content']['name'] for item in client.get(f"/api/campaigns/{cid}/vault").get_json())
+    assert names == ["Faro Hundido", "Zarovar el Gris"]
+    assert [hit['id'] for hit in client.get(f"/api/campaigns/{cid}/search?q=zarovar").get_json()] == [kept['id']]
+    page = client.get(f"/api/campaigns/{cid}/changes?since={since}").get_json()
+    assert sorted((c['id'], c['op']) for c in page['changes']) == sorted(
+        [(kept['id'], "put"), (removed['id'], "delete"), (added['id'], "put")])
+
+
+@pytest.mark.parametrize("mode", MODES)
+def test_burst_is_applied_in_one_batch(make_watched_app, mode):
+    app = make_watched_app(mode)
+    watcher = app.extensions['storage_watcher']
+    client = app.test_client()
+    cid = client.post('/api/campaigns/', json={"title": "Checkout"}).get_json()['id']
+    items = [client.post(f"/api/campaigns/{cid}/vault", json={"type": "npc", "content": {"name": f"Figurante {i}"}}).get_json()
+             for i in range(40)]
+    wait_for(lambda: watcher.stats['batches'] >= 1)
+    time.sleep(0.5)
+    batches = watcher.stats['batches']
+
+    # Como un git checkout: cambian todos los items y aparece otra campaña entera
+    vault_dir = os.path.join(app.config['DATA_STORAGE_PATH'], f"campaign_{cid}", "vault")
+    for item in items:
+        write_by_hand(os.path.join(vault_dir, f"npc_{item['id']}.json"), dict(item, status="used"))
+    new_cid = generate_id()
+    base = os.path.join(app.config['DATA_STORAGE_PATH'], f"campaign_{new_cid}")
+    os.makedirs(os.path.join(base, "vault"))
+    os.makedirs(os.path.join(base, "sessions"))
+    item = new_vault_item({"type": "npc", "content": {"name": "Clon"}})
+    write_by_hand(os.path.join(base, "vault", f"npc_{item['id']}.json"), item)
+    write_by_hand(os.path.join(base, "metadata.json"), {"id": new_cid, "title": "Clonada", "version": 1})
+    wait_for(lambda: watcher.stats['changes'] >= 41)
+    time.sleep(0.5)
+
+    assert watcher.stats['batches'] == batches + 1 and watcher.stats['errors'] == 0
+    assert {i['status'] for i in client.get(f"/api/campaigns/{cid}/vault").get_json()} == {"used"}
+    assert new_cid in [c['id'] for c in client.get('/api/campaigns/').get_json()]
+    assert len(client.get(f"/api/campaigns/{new_cid}/vault").get_json()) == 1
@@ -0,0 +1,91 @@
+import json
+import os
+
+from routes.ai_routes import assemble_prompt_context
+from services.file_service import FileService
+from services.id_service import generate_id
+from services.summary_queue import SummaryQueue, auto_summary, content_hash
+
+FRAMEWORK = "Las Tierras Rotas. " * 100
+
+
+def test_framework_and_session_notes_are_summarized(make_app):
+    app = make_app()
+    client = app.test_client()
+    queue = app.extensions['summary_queue']
+    cid = client.post('/api/campaigns/', json={"title": "Resúmenes", "framework": FRAMEWORK}).get_json()['id']
+    session = client.get(f"/api/campaigns/{cid}/sessions").get_json()[0]
+    client.put(f"/api/campaigns/{cid}/sessions/{session['id']}", json={"status": "completed", "notes": "Cruzan el río."})
+    assert queue.wait_idle(timeout=5)
+
+    metadata = client.get(f"/api/campaigns/{cid}").get_json()
+    assert metadata['auto_framework_summary']['text'].startswith("[stub] Resumen: Las Tierras Rotas.")
+    with app.app_context():
+        context = assemble_prompt_context(app.extensions['file_service'], cid)
+    assert context['framework'] == metadata['auto_framework_summary']['text']
+    assert "Cruzan el río." in context['rolling_memory']
+
+    entry = client.get(f"/api/campaigns/{cid}/sessions/timeline").get_json()['sessions'][0]
+    assert entry['summary_auto'] is True
+
+    # Al cambiar el texto el resumen anterior deja de valer
+    updated = client.put(f"/api/campaigns/{cid}", json={"framework": FRAMEWORK + "Y el mar."}).get_json()
+    assert auto_summary(updated, "framework") is None
+    assert queue.wait_idle(timeout=5)
+    metadata = client.get(f"/api/campaigns/{cid}").get_json()
+    assert metadata['auto_framework_summary']['hash'] == content_hash("framework", FRAMEWORK + "Y el mar.")
+    assert queue.stats['failed'] == 0
+
+
+def make_campaign(service, framework):
+    cid = generate_id()
+    path = service.create_campaign_structure(cid)
+    metadata = {"id": cid, "title": "x", "framework": framework, "version": 1}
+    service.save_json(os.path.join(path, "metadata.json"), metadata)
+    return cid
+
+
+def test_same_text_is_summarized_once_and_jobs_survive_restart(tmp_path):
+    service = FileService(str(tmp_path))
+    calls = []
+
+    def fake_model(prompt):
+        calls.append(prompt)
+        return "resumen corto"
+
+    stopped = SummaryQueue(service, fake_model)
+    stopped.close()
+    first = make_campaign(service, FRAMEWORK)
+    second = make_campaign(service, FRAMEWORK)
+    # Encolados con la cola parada: quedan en disco
+    for cid in (first, second):
+        stopped.enqueue(cid, "framework")
+    assert stopped.pending() == 2 and calls == []
+
+    queue = SummaryQueue(service, fake_model)
+    queue.recover()
+    assert queue.wait_idle(timeout=5)
+    assert len(calls) == 1 and queue.stats['cache_hits'] == 1
+    assert queue.pending() == 0
+    for cid in (first, second):
+        with open(os.path.join(service._get_campaign_path(cid), "metadata.json"), encoding='utf-8') as f:
+            summary = json.load(f)['auto_framework_summary']
+        assert summary == {"hash": content_hash("framework", FRAMEWORK), "text": "resumen corto"}
+    queue.close()
+    service.close()
+
+
+def test_background_summary_does_not_invalidate_the_clients_copy(make_app):
+    app = make_app()
+    client = app.test_client()
+    cid = client.post('/api/campaigns/', json={"title": "Sin 412"}).get_json()['id']
+    session = client.get(f"/api/campaigns/{cid}/sessions").get_json()[0]
+    saved = client.put(f"/api/campaigns/{cid}/sessions/{session['id']}", json={"status": "completed", "notes": "Huyen."})
+    assert app.extensions['summary_queue'].wait_idle(timeout=5)
+
+    current = client.get(f"/api/campaigns/{cid}/sessions/{session['id']}").get_json()
+    assert current['auto_summary'] and current['version'] == saved.get_json()['version']
+    # El cliente sigue editando con la ETag que recibió al guardar
+    again = client.put(f"/api/campaigns/{cid}/sessions/{session['id']}", json={"title": "La huida"},
+                       headers={"If-Match": saved.headers['ETag']})
+    assert again.status_code == 200 and again.get_json()['auto_summary'] == current['auto_summary']
@@ -0,0 +1,69 @@
+import os
+
+
+def bulk(client, campaign_id, operations):
+    response = client.post(f"/api/campaigns/{campaign_id}/vault/_bulk", json={"operations": operations})
+    assert response.status_code == 200
+    return response.get_json()
+
+
+def test_bulk_mixed_operations(client):
+    campaign = client.post('/api/campaigns/', json={"title": "Bulk"}).get_json()
+    cid = campaign['id']
+
+    created = bulk(client, cid, [{"op": "create", "type": "npc", "content": {"name": f"NPC {i}"}} for i in range(3)])
+    assert created["ok"] == 3
+    ids = [r["id"] for r in created["results"]]
+
+    result = bulk(client, cid, [
+        {"op": "status", "ids": ids[:2], "status": "active"},
+        {"op": "update", "id": ids[0], "usage_count": 4},
+        {"op": "delete", "id": ids[2]},
+        {"op": "status", "id": "missing", "status": "active"},
+        {"op": "explode"},
+    ])
+    statuses = [r["status"] for r in result["results"]]
+    assert statuses == [200, 200, 200, 200, 404, 400]
+    assert result["failed"] == 2
+
+    items = {i["id"]: i for i in client.get(f"/api/campaigns/{cid}/vault").get_json()}
+    assert set(items) == set(ids[:2])
+    assert items[ids[0]]["status"] == "active" and items[ids[0]]["usage_count"] == 4
+    # Dos ops sobre el mismo item: una sola escritura
+    assert items[ids[0]]["version"] == 2
+
+
+def test_bulk_version_conflict(client):
+    cid = client.post('/api/campaigns/', json={"title": "Bulk"}).get_json()['id']
+    item = client.post(f"/api/campaigns/{cid}/vault", json={"type": "npc"}).get_json()
+
+    result = bulk(client, cid, [{"op": "status", "id": item["id"], "status": "active", "expected_version": 7}])
+    assert result["results"][0]["status"] == 412
+    assert result["results"][0]["current"]["version"] == 1
+
+
+def test_delete_session_restores_items(client):
+    campaign = client.post('/api/campaigns/', json={"title": "Bulk"}).get_json()
+    cid = campaign['id']
+    ids = [r["id"] for r in bulk(client, cid, [{"op": "create", "type": "npc"}] * 2)["results"]]
+    bulk(client, cid, [{"op": "status", "ids": ids, "status": "active"}])
+    client.put(f"/api/campaigns/{cid}/sessions/{campaign['active_session']}", json={"linked_items": ids + ["gone"]})
+
+    response = client.delete(f"/api/campaigns/{cid}/sessions/{campaign['active_session']}").get_json()
+    assert sorted(r["status"] for r in response["restored"]) == [200, 200, 404]
+    assert {i["status"] for i in client.get(f"/api/campaigns/{cid}/vault").get_json()} == {"reserve"}
+
+
+
+def test_create_rejects_types_that_are_not_filenames(make_app):
+    app = make_app()
+    client = app.test_client()
+    cid = client.post('/api/campaigns/', json={"title": "Bulk"}).get_json()['id']
+
+    result = bulk(client, cid, [{"op": "create", "type": t} for t in ("../../escape", "a/b", "x.y", 7, "pnj-ñ_2")])
+    assert [r["status"] for r in result["results"]] == [400, 400, 400, 400, 201]
+    assert client.post(f"/api/campaigns/{cid}/vault", json={"type": "../x"}).status_code == 400
+
+    storage = app.config['DATA_STORAGE_PATH']
+    assert any(name.startswith("pnj-ñ_2_") for name in os.listdir(os.path.join(storage, f"campaign_{cid}", "vault")))
+    assert not any(name.endswith(".json") for name in os.listdir(storage) if not name.startswith("_"))
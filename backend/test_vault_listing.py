@@ -0,0 +1,95 @@
+import pytest
+
+
+@pytest.fixture
+def vault(client):
+    """Campaña con un vault variado; devuelve (client, campaign_id, {nombre: item})."""
+    cid = client.post('/api/campaigns/', json={"title": "Listado"}).get_json()['id']
+    specs = [
+        ("npc", {"name": "Álvaro"}, ["aliado", "ciudad"], "active", 5),
+        ("npc", {"name": "alba"}, ["ciudad"], "reserve", 2),
+        ("npc", {"name": "Bruno"}, ["enemigo"], "reserve", 9),
+        ("location", {"name": "Albufera"}, ["ciudad"], "active", 0),
+        ("scene", {"title": "Emboscada"}, [], "reserve", 1),
+    ]
+    items = {}
+    for kind, content, tags, status, uses in specs:
+        item = client.post(f"/api/campaigns/{cid}/vault", json={"type": kind, "content": content, "tags": tags}).get_json()
+        item = client.put(f"/api/campaigns/{cid}/vault/{item['id']}", json={"status": status, "usage_count": uses}).get_json()
+        items[content.get("name") or content["title"]] = item
+    return client, cid, items
+
+
+def names(response):
+    assert response.status_code == 200, response.get_json()
+    return [i['content'].get('name') or i['content'].get('title') for i in response.get_json()]
+
+
+def test_filters(vault):
+    client, cid, items = vault
+    url = f"/api/campaigns/{cid}/vault"
+
+    assert set(names(client.get(f"{url}?type=npc"))) == {"alba", "Bruno", "Álvaro"}
+    assert set(names(client.get(f"{url}?type=location,scene"))) == {"Albufera", "Emboscada"}
+    assert set(names(client.get(f"{url}?status=active"))) == {"Albufera", "Álvaro"}
+    # tags exige todas
+    assert names(client.get(f"{url}?tags=ciudad,aliado")) == ["Álvaro"]
+    assert set(names(client.get(f"{url}?type=npc&tags=ciudad"))) == {"alba", "Álvaro"}
+    # name: prefijo sin distinguir mayúsculas, también sobre 'title'
+    assert set(names(client.get(f"{url}?name=AL"))) == {"alba", "Albufera"}
+    assert names(client.get(f"{url}?name=embos")) == ["Emboscada"]
+    # Sin parámetros, todo el vault con los documentos completos
+    response = client.get(url)
+    assert response.headers['X-Total-Count'] == "5"
+    assert sorted(response.get_json(), key=lambda i: i['id']) == sorted(items.values(), key=lambda i: i['id'])
+
+
+def test_fields_projection(vault):
+    client, cid, items = vault
+    projected = client.get(f"/api/campaigns/{cid}/vault?type=npc&fields=status,usage_count").get_json()
+    assert all(set(i) == {'id', 'status', 'usage_count'} for i in projected)
+    assert {i['id']: i['usage_count'] for i in projected} == {items[n]['id']: items[n]['usage_count'] for n in ("Álvaro", "alba", "Bruno")}
+
+    # Un campo que no está en el listado sale del documento completo
+    projected = client.get(f"/api/campaigns/{cid}/vault?name=bru&fields=content").get_json()
+    assert projected == [{"id": items["Bruno"]['id'], "content": {"name": "Bruno"}}]
+
+
+def test_sort_and_cursor_pages(vault):
+    client, cid, _ = vault
+    url = f"/api/campaigns/{cid}/vault"
+    assert names(client.get(f"{url}?sort=-usage_count")) == ["Bruno", "Álvaro", "alba", "Emboscada", "Albufera"]
+    assert names(client.get(f"{url}?sort=name")) == ["alba", "Albufera", "Bruno", "Emboscada", "Álvaro"]
+
+    pages, cursor = [], ""
+    while True:
+        response = client.get(f"{url}?sort=name&limit=2{cursor}")
+        pages.append(names(response))
+        assert response.headers['X-Total-Count'] == "5"
+        if 'X-Next-Cursor' not in response.headers:
+            break
+        cursor = f"&cursor={response.headers['X-Next-Cursor']}"
+    assert pages == [["alba", "Albufera"], ["Bruno", "Emboscada"], ["Álvaro"]]
+
+
+def test_cursor_is_tied_to_its_sort(vault):
+    client, cid, items = vault
+    # usage_count editado a mano con un tipo raro: se ordena como 0, sin 500
+    client.put(f"/api/campaigns/{cid}/vault/{items['Emboscada']['id']}", json={"usage_count": "muchas"})
+    url = f"/api/campaigns/{cid}/vault"
+
+    first = client.get(f"{url}?sort=-usage_count&limit=3")
+    assert [i['usage_count'] for i in first.get_json()] == [9, 5, 2]
+    cursor = first.headers['X-Next-Cursor']
+    rest = client.get(f"{url}?sort=-usage_count&limit=3&cursor={cursor}")
+    assert {str(i['usage_count']) for i in rest.get_json()} == {"0", "muchas"}
+
+    assert client.get(f"{url}?sort=name&cursor={cursor}").status_code == 400
+    assert client.get(f"{url}?sort=name&cursor=bm9wZQ==").status_code == 400
+
+
+@pytest.mark.parametrize("query", ["limit=0", "limit=-3", "limit=abc", "sort=version"])
+def test_invalid_parameters_are_rejected(vault, query):
+    client, cid, _ = vault
+    response = client.get(f"/api/campaigns/{cid}/vault?{query}")
+    assert response.status_code == 400 and "error" in response.get_json()
@@ -0,0 +1,69 @@
+import os
+
+import pytest
+
+from routes.ai_routes import prepare_chat
+from services.vector_index import HashingEmbedder, VECTOR_META_FILENAME
+
+
+def bulk_create(client, cid, contents):
+    operations = [{"op": "create", "type": "npc", "content": content} for content in contents]
+    results = client.post(f"/api/campaigns/{cid}/vault/_bulk", json={"operations": operations}).get_json()['results']
+    return [r['id'] for r in results]
+
+
+def test_hashing_embedder_is_deterministic():
+    embedder = HashingEmbedder(64)
+    a, b, c = embedder.embed(["La bruja del pantano", "la BRUJA del pantano", "Un herrero enano"])
+    assert a == b and len(a) == 64
+    assert abs(sum(v * v for v in a) - 1.0) < 1e-6
+    assert sum(x * y for x, y in zip(a, c)) < 0.5
+
+
+@pytest.mark.parametrize("engine", ["json", "sqlite"])
+def test_index_follows_vault_changes(make_app, tmp_path, engine):
+    path = str(tmp_path / "shared")
+    app = make_app(DATA_STORAGE_PATH=path, STORAGE_ENGINE=engine)
+    client = app.test_client()
+    cid = client.post('/api/campaigns/', json={"title": "Vectores"}).get_json()['id']
+    vectors = app.extensions['vector_index']
+
+    witch, smith = bulk_create(client, cid, [
+        {"name": "Morgana", "description": "Bruja que vive en el pantano"},
+        {"name": "Durin", "description": "Herrero enano de la montaña"},
+    ])
+    assert [i for _, i in vectors.search(cid, "¿quién vive en el pantano?")] == [witch]
+
+    # Índice creado: los cambios siguientes se aplican incrementalmente
+    client.put(f"/api/campaigns/{cid}/vault/{smith}", json={"content": {"name": "Durin", "description": "Barquero del pantano"}})
+    assert set(i for _, i in vectors.search(cid, "pantano")) == {witch, smith}
+    client.delete(f"/api/campaigns/{cid}/vault/{witch}")
+    assert [i for _, i in vectors.search(cid, "pantano")] == [smith]
+    assert os.path.exists(os.path.join(path, f"campaign_{cid}", VECTOR_META_FILENAME))
+
+    # Otro proceso abre el índice desde disco sin reconstruirlo
+    other = make_app(DATA_STORAGE_PATH=path, STORAGE_ENGINE=engine, SUMMARY_WORKERS=0)
+    index = other.extensions['vector_index'].get_index(cid)
+    assert list(index.meta['rows']) == [smith]
+    assert [i for _, i in other.extensions['vector_index'].search(cid, "barquero")] == [smith]
+
+
+def test_chat_uses_vector_candidates(make_app):
+    app = make_app()
+    client = app.test_client()
+    cid = client.post('/api/campaigns/', json={"title": "Chat"}).get_json()['id']
+    witch, _ = bulk_create(client, cid, [
+        {"name": "Morgana", "description": "Bruja que vive en el pantano"},
+        {"name": "Durin", "description": "Herrero enano de la montaña"},
+    ])
+
+    with app.test_request_context():
+        _, user_query, release, stats = prepare_chat(cid, {"query": "¿Qué trama la bruja?"})
+        release(True)
+    assert stats['context']['turn']['retrieval'] == "vector"
+    assert stats['context']['turn']['included'] == 1
+    assert "Morgana" in user_query and "Durin" not in user_query
+
+    # Desactivado: vuelve la selección léxica
+    app = make_app(VECTOR_INDEX=False)
+    assert 'vector_index' not in app.extensions
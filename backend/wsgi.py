@@ -0,0 +1,6 @@
+"""Punto de entrada WSGI: gunicorn wsgi:app (ver gunicorn.conf.py y 'flask serve')."""
+from app import create_app
+
+app = create_app()
+
+__all__ = ['app']
@@ -7,12 +7,16 @@ import { useChat } from '../context/ChatContext';
 
 export default function AIAssistant() {
     // Leemos todo del contexto
-    const { messages, addMessage, isOpen, setIsOpen, aiContext } = useChat();
+    const { messages, addMessage, appendToLastMessage, isOpen, setIsOpen, aiContext } = useChat();
     const { campaignId, mode, sessionId } = aiContext;
     
     const [query, setQuery] = useState('');
     const [loading, setLoading] = useState(false);
     const messagesEndRef = useRef<HTMLDivElement>(null);
+    const abortRef = useRef<AbortController | null>(null);
+
+    // Cancelar el stream en curso si el panel se desmonta
+    useEffect(() => () => abortRef.current?.abort(), []);
 
     const scrollToBottom = () => {
         messagesEndRef.current?.scrollIntoView({ behavior: "smooth" });
@@ -25,22 +29,29 @@ export default function AIAssistant() {
     const handleSend = async () => {
         if (!query.trim() || loading || !campaignId) return;
 
+        // Chat vacío en pantalla = conversación nueva también en el servidor
+        const isNewConversation = messages.length === 0;
         addMessage({ role: 'user', text: query });
         const currentQuery = query;
         setQuery('');
         setLoading(true);
 
+        const controller = new AbortController();
+        abortRef.current = controller;
+        let received = false;
         try {
-            const res = await api.ai.ask(campaignId, currentQuery, mode, sessionId);
-            if (res.response) {
-                addMessage({ role: 'ai', text: res.response });
-            } else {
-                addMessage({ role: 'ai', text: "Lo siento, hubo un error conectando con la mente colmena." });
-            }
+            addMessage({ role: 'ai', text: '' });
+            await api.ai.askStream(campaignId, currentQuery, mode, (text) => {
+                received = true;
+                appendToLastMessage(text);
+            }, sessionId, controller.signal, isNewConversation);
+            if (!received) appendToLastMessage("Lo siento, hubo un error conectando con la mente colmena.");
         } catch (error) {
+            if (controller.signal.aborted) return;
             console.error(error);
-            addMessage({ role: 'ai', text: "Error de comunicación con el servidor." });
+            appendToLastMessage(received ? "\n\n_(respuesta interrumpida)_" : "Error de comunicación con el servidor.");
         } finally {
+            abortRef.current = null;
             setLoading(false);
         }
     };
@@ -94,11 +94,10 @@ export default function CampaignSidebar({ isOpen, onClose, campaignId }: Campaig
         }));
 
         setMetadata({ ...meta, truths: truths.slice(0, 6), fronts });
-        const sess = await api.sessions.list(campaignId);
+        const sess = await api.sessions.list(campaignId, ['number', 'title', 'status', 'date']);
         setSessions(sess.sort((a: any, b: any) => b.number - a.number));
 
-        const vault = await api.vault.list(campaignId);
-        setCharacters(vault.filter((i:any) => i.type === 'character'));
+        setCharacters(await api.vault.list(campaignId, { type: 'character' }));
     };
 
     const persistChanges = async (newData: any) => {
@@ -46,7 +46,7 @@ export default function TopNavBar({
         try {
             const [campaign, sessions] = await Promise.all([
                 api.campaigns.get(campaignId),
-                api.sessions.list(campaignId)
+                api.sessions.list(campaignId, ['number', 'status'])
             ]);
             let targetSessionId = campaign.active_session;
             if (!targetSessionId && sessions.length > 0) {
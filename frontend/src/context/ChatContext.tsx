@@ -15,6 +15,7 @@ interface AIContextData {
 interface ChatContextType {
     messages: Message[];
     addMessage: (msg: Message) => void;
+    appendToLastMessage: (text: string) => void;
     isOpen: boolean;
     setIsOpen: (open: boolean) => void;
     clearChat: () => void;
@@ -35,12 +36,21 @@ export const ChatProvider = ({ children }: { children: ReactNode }) => {
         setMessages(prev => [...prev, msg]);
     };
 
+    // Para respuestas en streaming: concatena texto al último mensaje
+    const appendToLastMessage = (text: string) => {
+        setMessages(prev => {
+            if (prev.length === 0) return prev;
+            const last = prev[prev.length - 1];
+            return [...prev.slice(0, -1), { ...last, text: last.text + text }];
+        });
+    };
+
     const clearChat = () => {
         setMessages([]);
     };
 
     return (
-        <ChatContext.Provider value={{ messages, addMessage, isOpen, setIsOpen, clearChat, aiContext, setAiContext }}>
+        <ChatContext.Provider value={{ messages, addMessage, appendToLastMessage, isOpen, setIsOpen, clearChat, aiContext, setAiContext }}>
             {children}
         </ChatContext.Provider>
     );
@@ -18,9 +18,9 @@ export default function Bitacora() {
 
     const loadSessions = async () => {
         if (!id) return;
-        const list = await api.sessions.list(id);
-        // Filtrar solo las completadas
-        setSessions(list.filter((s: any) => s.status === 'completed').reverse());
+        // Solo las completadas, sin cargar notas ni items de cada sesión
+        const timeline = await api.sessions.timeline(id, 'completed');
+        setSessions(timeline.sessions.reverse());
     };
 
     return (
@@ -60,7 +60,12 @@ export default function Bitacora() {
                                     </div>
                                     <div className="p-6 prose prose-invert prose-sm max-w-none text-gray-300">
                                         {session.summary ? (
-                                            <ReactMarkdown>{session.summary}</ReactMarkdown>
+                                            <>
+                                                <ReactMarkdown>{session.summary}</ReactMarkdown>
+                                                {session.summary_auto && (
+                                                    <p className="text-xs italic text-gray-500">Resumen generado automáticamente a partir de las notas.</p>
+                                                )}
+                                            </>
                                         ) : (
                                             <p className="italic text-gray-500">Sin resumen registrado.</p>
                                         )}
@@ -1,6 +1,6 @@
 import { useParams, useLocation, useNavigate } from 'react-router-dom';
 import { useState, useEffect, useRef, useLayoutEffect } from 'react';
-import { api } from '../services/api';
+import { api, type VaultOperation } from '../services/api';
 import { FontAwesomeIcon } from '@fortawesome/react-fontawesome';
 import { 
     faCheck, faLink, faTimes, faChevronDown, faChevronRight, faSave, faPlus, faUnlink, faBolt, faBookOpen, faPen, faShieldAlt, faGem, faCheckSquare, faSquare, faWandMagicSparkles, faSpinner
@@ -211,7 +211,7 @@ export default function SessionRunner() {
             if (passedId) {
                 target = await api.sessions.get(id, passedId);
             } else {
-                const sessions = await api.sessions.list(id);
+                const sessions = await api.sessions.list(id, ['number', 'status']);
                 const camp = await api.campaigns.get(id);
                 const activeId = camp.active_session;
                 target = activeId ? sessions.find((s:any) => s.id === activeId) : null;
@@ -219,6 +219,8 @@ export default function SessionRunner() {
                     const sorted = sessions.sort((a: any, b: any) => b.number - a.number);
                     target = sorted.find((s:any) => s.status !== 'completed') || sorted[0];
                 }
+                // El listado solo trae los campos de listado: la sesión completa aparte
+                if (target) target = await api.sessions.get(id, target.id);
             }
 
             if (target) {
@@ -319,6 +321,7 @@ export default function SessionRunner() {
         const finalDate = new Date().toISOString();
         const linkedIds = session.linked_items || [];
         const finalLinkedItems = [];
+        const operations: VaultOperation[] = [];
         for (const itemId of linkedIds) {
             const item = vaultItems.find(i => i.id === itemId);
             if (!item) continue;
@@ -327,11 +330,13 @@ export default function SessionRunner() {
                 finalLinkedItems.push(itemId);
                 const isReusable = REUSABLE_TYPES.includes(item.type);
                 const newUsage = (item.usage_count || 0) + 1;
-                await api.vault.update(id, itemId, { status: isReusable ? 'reserve' : 'archived', usage_count: newUsage });
+                operations.push({ op: 'update', id: itemId, status: isReusable ? 'reserve' : 'archived', usage_count: newUsage });
             } else {
-                await api.vault.update(id, itemId, { status: 'reserve' });
+                operations.push({ op: 'status', id: itemId, status: 'reserve' });
             }
         }
+        // Un solo lote para todos los items de la sesión
+        if (operations.length) await api.vault.bulk(id, operations);
         const finalSession = { ...session, status: 'completed', date: finalDate, linked_items: finalLinkedItems, summary: generatedSummary };
         await api.sessions.update(id, session.id, finalSession);
         const newSession = await api.sessions.create(id, { recap: generatedSummary });
@@ -250,7 +250,7 @@ export default function VaultManager() {
             loadData();
             setAiContext({ campaignId: id, mode: 'vault' });
         }
-    }, [id, setAiContext]);
+    }, [id, filterType, setAiContext]);
 
     useEffect(() => {
         const handleClickOutside = async (event: MouseEvent) => {
@@ -267,10 +267,10 @@ export default function VaultManager() {
         setLoading(true);
         try {
             const [vaultData, campData] = await Promise.all([
-                api.vault.list(id),
+                api.vault.list(id, filterType !== 'all' ? { type: filterType } : undefined),
                 api.campaigns.get(id).then(camp => {
                     if (camp.active_session) return api.sessions.get(id, camp.active_session);
-                    return api.sessions.list(id).then(list => list.length > 0 ? list[0] : null);
+                    return api.sessions.list(id, ['number']).then(list => list.length > 0 ? api.sessions.get(id, list[0].id) : null);
                 })
             ]);
             setItems(vaultData);
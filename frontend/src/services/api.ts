@@ -1,14 +1,81 @@
 const API_BASE_URL = 'http://localhost:5000/api';
 
+export interface VaultQuery {
+    type?: string;
+    status?: string;
+    tags?: string[];
+    name?: string;
+    fields?: string[];
+    sort?: 'usage_count' | '-usage_count' | 'name' | '-name';
+    limit?: number;
+    cursor?: string;
+}
+
+export interface VaultOperation {
+    op: 'create' | 'update' | 'status' | 'delete';
+    id?: string;
+    ids?: string[];
+    expected_version?: number;
+    [field: string]: any;
+}
+
+export interface CampaignChange {
+    seq: number;
+    ts: number;
+    collection: 'campaigns' | 'vault' | 'sessions';
+    id: string;
+    op: 'put' | 'delete';
+    record: any | null;
+}
+
+export interface ChangesPage {
+    log: string;
+    last_seq: number;
+    changes: CampaignChange[];
+    more: boolean;
+    // El log ya no es el que conocía el cliente: recargar todo
+    reset: boolean;
+}
+
+const toQuery = (params?: Record<string, any>) => {
+    if (!params) return '';
+    const query = new URLSearchParams();
+    Object.entries(params).forEach(([key, value]) => {
+        if (value === undefined || value === null || value === '') return;
+        query.set(key, Array.isArray(value) ? value.join(',') : String(value));
+    });
+    const str = query.toString();
+    return str ? `?${str}` : '';
+};
+
+// Última respuesta de cada GET con su ETag: si el servidor contesta 304 se
+// reutiliza sin descargar ni parsear de nuevo. Se devuelve una copia porque
+// los componentes ordenan y editan lo que reciben.
+const etagCache = new Map<string, { etag: string; data: any }>();
+
+const getJson = async (url: string) => {
+    const cached = etagCache.get(url);
+    const res = await fetch(url, cached ? { headers: { 'If-None-Match': cached.etag } } : undefined);
+    if (res.status === 304 && cached) return structuredClone(cached.data);
+    const data = await res.json();
+    const etag = res.headers.get('ETag');
+    if (res.ok && etag) {
+        etagCache.set(url, { etag, data });
+        return structuredClone(data);
+    }
+    etagCache.delete(url);
+    return data;
+};
+
 export const api = {
     campaigns: {
-        list: () => fetch(`${API_BASE_URL}/campaigns/`).then(res => res.json()),
+        list: () => getJson(`${API_BASE_URL}/campaigns/`),
         create: (data: any) => fetch(`${API_BASE_URL}/campaigns/`, {
             method: 'POST',
             headers: { 'Content-Type': 'application/json' },
             body: JSON.stringify(data)
         }).then(res => res.json()),
-        get: (id: string) => fetch(`${API_BASE_URL}/campaigns/${id}`).then(res => res.json()),
+        get: (id: string) => getJson(`${API_BASE_URL}/campaigns/${id}`),
         update: (id: string, data: any) => fetch(`${API_BASE_URL}/campaigns/${id}`, {
             method: 'PUT',
             headers: { 'Content-Type': 'application/json' },
@@ -17,7 +84,8 @@ export const api = {
         delete: (id: string) => fetch(`${API_BASE_URL}/campaigns/${id}`, { method: 'DELETE' }).then(res => res.json())
     },
     vault: {
-        list: (campaignId: string) => fetch(`${API_BASE_URL}/campaigns/${campaignId}/vault`).then(res => res.json()),
+        // Filtros opcionales resueltos en el servidor (type, status, tags, name, fields, sort, limit, cursor)
+        list: (campaignId: string, params?: VaultQuery) => getJson(`${API_BASE_URL}/campaigns/${campaignId}/vault${toQuery(params)}`),
         create: (campaignId: string, data: any) => fetch(`${API_BASE_URL}/campaigns/${campaignId}/vault`, {
             method: 'POST',
             headers: { 'Content-Type': 'application/json' },
@@ -28,16 +96,25 @@ export const api = {
             headers: { 'Content-Type': 'application/json' },
             body: JSON.stringify(data)
         }).then(res => res.json()),
-        delete: (campaignId: string, itemId: string) => fetch(`${API_BASE_URL}/campaigns/${campaignId}/vault/${itemId}`, { method: 'DELETE' }).then(res => res.json())
+        delete: (campaignId: string, itemId: string) => fetch(`${API_BASE_URL}/campaigns/${campaignId}/vault/${itemId}`, { method: 'DELETE' }).then(res => res.json()),
+        // Lote de operaciones: { op: 'create' | 'update' | 'status' | 'delete', id | ids, ...campos }
+        bulk: (campaignId: string, operations: VaultOperation[]) => fetch(`${API_BASE_URL}/campaigns/${campaignId}/vault/_bulk`, {
+            method: 'POST',
+            headers: { 'Content-Type': 'application/json' },
+            body: JSON.stringify({ operations })
+        }).then(res => res.json())
     },
    sessions: {
-        list: (campaignId: string) => fetch(`${API_BASE_URL}/campaigns/${campaignId}/sessions`).then(res => res.json()),
+        // Con fields solo de listado (number, title, status, date, linked_items, version) basta el manifiesto
+        list: (campaignId: string, fields?: string[]) => getJson(`${API_BASE_URL}/campaigns/${campaignId}/sessions${toQuery({ fields })}`),
         create: (campaignId: string, data?: any) => fetch(`${API_BASE_URL}/campaigns/${campaignId}/sessions`, {
             method: 'POST',
             headers: { 'Content-Type': 'application/json' },
             body: JSON.stringify(data || {})
         }).then(res => res.json()),
-        get: (campaignId: string, sessionId: string) => fetch(`${API_BASE_URL}/campaigns/${campaignId}/sessions/${sessionId}`).then(res => res.json()),
+        // Resumen ordenado (número, título, estado, fecha, resumen) y el próximo número
+        timeline: (campaignId: string, status?: string) => getJson(`${API_BASE_URL}/campaigns/${campaignId}/sessions/timeline${toQuery({ status })}`),
+        get: (campaignId: string, sessionId: string) => getJson(`${API_BASE_URL}/campaigns/${campaignId}/sessions/${sessionId}`),
         update: (campaignId: string, sessionId: string, data: any) => fetch(`${API_BASE_URL}/campaigns/${campaignId}/sessions/${sessionId}`, {
             method: 'PUT',
             headers: { 'Content-Type': 'application/json' },
@@ -45,11 +122,69 @@ export const api = {
         }).then(res => res.json()),
         delete: (campaignId: string, sessionId: string) => fetch(`${API_BASE_URL}/campaigns/${campaignId}/sessions/${sessionId}`, { method: 'DELETE' }).then(res => res.json())
     },
+    changes: {
+        // Cambios posteriores a 'since' (last_seq de la respuesta anterior) del log 'log'
+        since: (campaignId: string, since: number, log?: string): Promise<ChangesPage> => fetch(`${API_BASE_URL}/campaigns/${campaignId}/changes${toQuery({ since, log })}`).then(res => res.json()),
+        // En vivo: onChange por cada cambio, onReset si hay que recargar. Devuelve la función para cerrar.
+        subscribe: (campaignId: string, since: number, log: string, onChange: (change: CampaignChange) => void, onReset: () => void) => {
+            const source = new EventSource(`${API_BASE_URL}/campaigns/${campaignId}/changes/stream${toQuery({ since, log })}`);
+            source.addEventListener('change', (e) => onChange(JSON.parse((e as MessageEvent).data)));
+            const reset = () => {
+                source.close();
+                onReset();
+            };
+            source.addEventListener('reset', reset);
+            source.addEventListener('gone', reset);
+            return () => source.close();
+        }
+    },
+    search: {
+        query: (campaignId: string, q: string, kind?: 'vault' | 'sessions', limit?: number) => fetch(`${API_BASE_URL}/campaigns/${campaignId}/search${toQuery({ q, kind, limit })}`).then(res => res.json())
+    },
     ai: {
-        ask: (campaignId: string, query: string, mode: 'vault' | 'session', sessionId?: string) => fetch(`${API_BASE_URL}/campaigns/${campaignId}/chat`, {
+        // reset: olvida la conversación previa del servidor para (campaña, modo, sesión)
+        // fresh: respuesta nueva aunque el servidor tenga cacheada la de la misma pregunta
+        ask: (campaignId: string, query: string, mode: 'vault' | 'session', sessionId?: string, reset?: boolean, fresh?: boolean) => fetch(`${API_BASE_URL}/campaigns/${campaignId}/chat`, {
             method: 'POST',
             headers: { 'Content-Type': 'application/json' },
-            body: JSON.stringify({ query, mode, sessionId })
-        }).then(res => res.json())
+            body: JSON.stringify({ query, mode, sessionId, reset, fresh })
+        }).then(res => res.json()),
+        // Respuesta por trozos (SSE sobre fetch). Cancelable con un AbortController.
+        askStream: async (campaignId: string, query: string, mode: 'vault' | 'session', onChunk: (text: string) => void, sessionId?: string, signal?: AbortSignal, reset?: boolean, fresh?: boolean) => {
+            const res = await fetch(`${API_BASE_URL}/campaigns/${campaignId}/chat/stream`, {
+                method: 'POST',
+                headers: { 'Content-Type': 'application/json' },
+                body: JSON.stringify({ query, mode, sessionId, reset, fresh }),
+                signal
+            });
+            if (!res.ok || !res.body) {
+                const err = await res.json().catch(() => ({}));
+                throw new Error(err.error || `HTTP ${res.status}`);
+            }
+
+            const reader = res.body.getReader();
+            const decoder = new TextDecoder();
+            let buffer = '';
+            while (true) {
+                const { value, done } = await reader.read();
+                if (done) break;
+                buffer += decoder.decode(value, { stream: true });
+                let sep;
+                while ((sep = buffer.indexOf('\n\n')) !== -1) {
+                    const block = buffer.slice(0, sep);
+                    buffer = buffer.slice(sep + 2);
+                    let event = 'message';
+                    let data = '';
+                    block.split('\n').forEach(line => {
+                        if (line.startsWith('event: ')) event = line.slice(7);
+                        else if (line.startsWith('data: ')) data += line.slice(6);
+                    });
+                    const payload = data ? JSON.parse(data) : {};
+                    if (event === 'error') throw new Error(payload.error);
+                    if (event === 'done') return;
+                    if (payload.text) onChunk(payload.text);
+                }
+            }
+        }
     }
 };
\ No newline at end of file